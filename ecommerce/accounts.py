@@ -0,0 +1,52 @@
+import logging
+
+from fastapi import HTTPException, status
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+
+from database import WRITE_CONNECTION
+from emailss import enqueue_verification_email, outbox_worker
+from models import Business, User
+
+logger = logging.getLogger(__name__)
+
+
+async def create_account(username: str, email: str, password: str, is_verified: bool = False) -> User:
+    """Create a user, its business and, unless already verified, its verification email.
+
+    Everything goes in one transaction, so a failed signup leaves nothing
+    behind. Uniqueness is left to the unique constraints instead of looking
+    the names up first; a duplicate raises ``IntegrityError`` and
+    ``duplicate_account`` turns it into the response. ``password`` must be
+    hashed already.
+    """
+    # only writes in here, a sqlite transaction that reads first can't wait for the write lock
+    async with in_transaction(WRITE_CONNECTION) as connection:
+        user = await User.create(
+            username=username,
+            email=email,
+            password=password,
+            is_verified=is_verified,
+            using_db=connection,
+        )
+        await Business.create(business_name=username, owner=user, using_db=connection)
+        if not is_verified:
+            await enqueue_verification_email(user, using_db=connection)
+    if not is_verified:
+        outbox_worker.wake()
+    return user
+
+
+def duplicate_account(error: IntegrityError, username: str, email: str) -> HTTPException:
+    """The 400 for a signup that hit a unique constraint."""
+    # sqlite names the column ("user.email"), postgres the constraint ("user_email_key")
+    message = str(error).lower()
+    if "email" in message:
+        detail = f"Email {email} is already registered"
+    elif "username" in message or "business_name" in message:
+        # the business is named after the user, so a taken business name takes the username too
+        detail = f"Username {username} is already taken"
+    else:
+        logger.error(f"Unexpected integrity error during registration: {error}")
+        detail = "Username or email is already registered"
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
@@ -1,9 +1,13 @@
+import os
 from passlib.context import CryptContext
 import jwt
 from dotenv import dotenv_values
 from models import User
 from fastapi import status
 from fastapi.exceptions import HTTPException
+from config import get_int, get_setting
+from workers import BoundedExecutor
+from tokens import create_token_pair, decode_token
 
 # from jose import (JWTError, jwt)
 import logging
@@ -16,11 +20,67 @@ logger = logging.getLogger(__name__)
 
 config_credentials = dotenv_values(".env")
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+def build_crypt_context(
+    scheme="bcrypt",
+    bcrypt_rounds=12,
+    argon2_time_cost=2,
+    argon2_memory_cost=19456,
+    argon2_parallelism=1,
+):
+    """Hashing policy: ``scheme`` hashes new passwords, every other known scheme
+    still verifies and is reported as needing an update."""
+    if scheme == "argon2":
+        from passlib.hash import argon2
+        if not argon2.has_backend():
+            logger.warning("argon2 requested but argon2-cffi is not installed, falling back to bcrypt")
+            scheme = "bcrypt"
+
+    schemes = [scheme] + [name for name in ("argon2", "bcrypt") if name != scheme]
+    return CryptContext(
+        schemes=schemes,
+        default=scheme,
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds,
+        # pin the cost so hashes made with any other cost are flagged for an update
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__time_cost=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__parallelism=argon2_parallelism,
+    )
+
+
+pwd_context = build_crypt_context(
+    scheme=get_setting("PASSWORD_SCHEME", "bcrypt"),
+    bcrypt_rounds=get_int("BCRYPT_ROUNDS", 12),
+    argon2_time_cost=get_int("ARGON2_TIME_COST", 2),
+    argon2_memory_cost=get_int("ARGON2_MEMORY_COST", 19456),
+    argon2_parallelism=get_int("ARGON2_PARALLELISM", 1),
+)
+
+# bcrypt takes a few hundred ms of CPU per call, keep it off the event loop
+hash_pool = BoundedExecutor(
+    "password-hash",
+    max_workers=get_int("HASH_WORKERS", os.cpu_count() or 1),
+    max_queue=get_int("HASH_MAX_QUEUE", 64),
+    kind=get_setting("HASH_POOL", "thread"),
+)
+
+# module level so they can be pickled into a process pool
+def hash_password_sync(password):
+    return pwd_context.hash(password)
+
+def verify_password_sync(plain_password,hashed_password):
+    return pwd_context.verify(plain_password,hashed_password)
+
+def verify_and_update_sync(plain_password,hashed_password):
+    return pwd_context.verify_and_update(plain_password,hashed_password)
 
-def get_hashed_password(password):
+async def get_hashed_password(password):
     try:
-        return pwd_context.hash(password)
+        return await hash_pool.run(hash_password_sync, password)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -32,7 +92,8 @@ def get_hashed_password(password):
 async def verify_token(token:str):
 
     try:
-        payload = jwt.decode(token,config_credentials["SECRET"],algorithm="HS256")
+        #only email verification tokens, access and refresh tokens are rejected
+        payload = decode_token(token, "verify")
         user = await User.get(id = payload.get("id"))
     
     except:
@@ -102,15 +163,24 @@ async def verify_token(token:str):
 
 
 async def verify_password(plain_password,hashed_password):
-    return pwd_context.verify(plain_password,hashed_password)
+    return await hash_pool.run(verify_password_sync, plain_password, hashed_password)
 
 
 async def authenticate_user(username,password):
-    user = await User.get(username = username)
+    user = await User.get_or_none(username = username)
+    if not user:
+        return False
 
-    if user and verify_password(password,user.password):
-        return user
-    return False
+    verified, new_hash = await hash_pool.run(verify_and_update_sync, password, user.password)
+    if not verified:
+        return False
+
+    #the stored hash uses an old scheme or cost, upgrade it while we have the plain password
+    if new_hash:
+        user.password = new_hash
+        await user.save(update_fields=["password"])
+        logger.info(f"Upgraded password hash for user {user.id}")
+    return user
 
 async def token_generator(username:str,password:str):
     user = await  authenticate_user(username,password)
@@ -122,14 +192,7 @@ async def token_generator(username:str,password:str):
             headers={"WWW-Authenticate":"Bearer"}
         )
 
-    token_data = {
-        "id":user.id,
-        "username":user.username
-    }
-
-    token = jwt.encode(token_data, config_credentials['SECRET'],algorithm="HS256")
-
-    return token
+    return create_token_pair(user)
 
 
 
@@ -0,0 +1,419 @@
+"""End-to-end API benchmark suite.
+
+Every run starts from a scratch copy of the app with its own ``.env`` and a
+fresh sqlite database. It seeds ``--users`` owners with a business each,
+``--products`` products spread over them and ``--images`` product images.
+The real ``main.app`` is then driven through a fixed number of requests per
+scenario, with ``--concurrency`` requests in flight:
+
+    token           POST /token with a seeded user's password
+    catalog         GET  /product?category=...
+    detail          GET  /product/{id}
+    create_product  POST /products as a seeded owner
+    register        POST /register, delivered to a local SMTP sink
+    upload          POST /uploadfile/product/{id} with a pool of --images JPEGs
+
+``--mode inprocess`` (the default) imports the app in a child process and
+calls it through httpx's ASGI transport, so there is no network in the
+numbers; ``--mode uvicorn`` starts ``uvicorn main:app --workers N`` instead.
+The report is JSON with throughput, error rate and p50/p95/p99 per scenario:
+
+    python -m benchmarks.bench_api
+    python -m benchmarks.bench_api --mode uvicorn --workers 2 --scenarios catalog detail
+    python -m benchmarks.bench_api --save benchmarks/baseline.json
+    python -m benchmarks.bench_api --compare benchmarks/baseline.json --max-regression 25
+
+Compare runs made with the same options on the same machine; the baseline
+records both.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import (
+    free_port, init_db, close_db, prepare_app, remove_app, report, seed, summarize, wait_until_up,
+)
+
+PASSWORD = "bench-password"
+CATEGORIES = ("food", "wear", "home", "tech")
+DATASET_FILE = "bench_dataset.json"
+DEFAULT_SCENARIOS = ("token", "catalog", "detail", "create_product", "register", "upload")
+
+
+def jpeg(seed: int, size: int = 320) -> bytes:
+    """A distinct, compressible test image."""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (size, size), tuple(rng.randrange(256) for _ in range(3)))
+    for _ in range(12):
+        x, y = rng.randrange(size), rng.randrange(size)
+        image.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, min(size, x + 60), min(size, y + 60)))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+class SmtpSink:
+    """Accepts every message and drops it, so signups have a mailer to deliver to."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.messages = 0
+        self._server = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._session, "127.0.0.1", self.port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _session(self, reader, writer) -> None:
+        writer.write(b"220 bench ESMTP\r\n")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            verb = line[:4].upper()
+            if verb == b"DATA":
+                writer.write(b"354 end with <CRLF>.<CRLF>\r\n")
+                await writer.drain()
+                while (await reader.readline()) not in (b".\r\n", b""):
+                    pass
+                self.messages += 1
+                writer.write(b"250 queued\r\n")
+            elif verb == b"QUIT":
+                writer.write(b"221 bye\r\n")
+                break
+            else:
+                writer.write(b"250 ok\r\n")
+            await writer.drain()
+        await writer.drain()
+        writer.close()
+
+
+async def seed_dataset(app_dir: str, db_path: str, args) -> dict:
+    """Seed the scratch database and describe what the scenarios can use."""
+    from authentications import build_crypt_context
+    from models import Business, Product, User
+
+    await init_db(db_path)
+    try:
+        await seed(users=args.users, products_per_business=max(1, args.products // args.users), categories=CATEGORIES)
+        # the same cost the app hashes with, or every login would also rehash
+        hashed = build_crypt_context(bcrypt_rounds=args.bcrypt_rounds).hash(PASSWORD)
+        await User.all().update(password=hashed)
+
+        product_ids = list(await Product.all().order_by("id").values_list("id", flat=True))
+        images_dir = os.path.join(app_dir, "static", "images")
+        for i in range(args.images):
+            with open(os.path.join(images_dir, f"bench{i}.jpg"), "wb") as out:
+                out.write(jpeg(i))
+            await Product.filter(id__in=product_ids[i::args.images]).update(product_image=f"bench{i}.jpg")
+
+        owners = dict(await Business.all().values_list("id", "owner__username"))
+        owned = {}
+        for id, business_id in await Product.all().order_by("id").values_list("id", "business_id"):
+            owned.setdefault(owners[business_id], []).append(id)
+    finally:
+        await close_db()
+
+    rng = random.Random(args.seed)
+    users = sorted(owned)[:args.login_users]
+    return {
+        "users": [{"username": username, "products": owned[username][:200]} for username in users],
+        "product_ids": rng.sample(product_ids, min(len(product_ids), 5000)),
+    }
+
+
+class Session:
+    """What the scenarios share: the dataset, logged-in owners and upload payloads."""
+
+    def __init__(self, dataset: dict, images: int):
+        self.dataset = dataset
+        self.owners = []
+        self.uploads = [jpeg(10_000 + i) for i in range(images)]
+        self.registered = 0
+
+    async def login(self, client: httpx.AsyncClient) -> None:
+        for user in self.dataset["users"]:
+            response = await client.post("/token", data={"username": user["username"], "password": PASSWORD})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            self.owners.append((headers, user["products"]))
+
+
+def token_request(session, rng):
+    user = rng.choice(session.dataset["users"])
+    return "POST", "/token", {"data": {"username": user["username"], "password": PASSWORD}}
+
+
+def catalog_request(session, rng):
+    return "GET", "/product", {"params": {"category": rng.choice(CATEGORIES), "limit": 20}}
+
+
+def detail_request(session, rng):
+    return "GET", f"/product/{rng.choice(session.dataset['product_ids'])}", {}
+
+
+def create_product_request(session, rng):
+    headers, _ = rng.choice(session.owners)
+    original = rng.randrange(20, 500)
+    body = {
+        "name": f"bench product {rng.randrange(10 ** 6)}",
+        "category": rng.choice(CATEGORIES),
+        "original_price": original,
+        "new_price": round(original * rng.uniform(0.4, 0.95), 2),
+        "offer_expiration_date": "2030-01-01",
+        "date_published": "2024-06-01T00:00:00+00:00",
+    }
+    return "POST", "/products", {"json": body, "headers": headers}
+
+
+def register_request(session, rng):
+    session.registered += 1
+    name = f"signup{session.registered}"
+    return "POST", "/register", {"json": {"username": name, "email": f"{name}@example.com", "password": PASSWORD}}
+
+
+def upload_request(session, rng):
+    headers, products = rng.choice(session.owners)
+    i = rng.randrange(len(session.uploads))
+    files = {"file": (f"upload{i}.jpg", session.uploads[i], "image/jpeg")}
+    return "POST", f"/uploadfile/product/{rng.choice(products)}", {"files": files, "headers": headers}
+
+
+SCENARIOS = {
+    "token": ("POST /token", token_request),
+    "catalog": ("GET /product", catalog_request),
+    "detail": ("GET /product/{id}", detail_request),
+    "create_product": ("POST /products", create_product_request),
+    "register": ("POST /register", register_request),
+    "upload": ("POST /uploadfile/product/{id}", upload_request),
+}
+
+
+async def run_scenario(client, session, name, args) -> dict:
+    route, build = SCENARIOS[name]
+    rng = random.Random(f"{args.seed}:{name}")
+    latencies = []
+    statuses = {}
+
+    async def send(record: bool) -> None:
+        method, url, kwargs = build(session, rng)
+        started = time.perf_counter()
+        try:
+            code = (await client.request(method, url, **kwargs)).status_code
+        except httpx.HTTPError as e:
+            code = type(e).__name__
+        if record:
+            latencies.append(time.perf_counter() - started)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    for _ in range(args.warmup):
+        await send(False)
+
+    # a fixed number of requests shared by ``concurrency`` clients keeps runs comparable
+    remaining = iter(range(args.requests))
+
+    async def worker():
+        for _ in remaining:
+            await send(True)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    errors = sum(count for code, count in statuses.items() if not (isinstance(code, int) and code < 400))
+    result = {"route": route, "requests_per_second": round(len(latencies) / elapsed, 1)}
+    result.update(summarize(latencies))
+    result["error_rate"] = round(errors / max(len(latencies), 1), 4)
+    result["statuses"] = {str(code): count for code, count in sorted(statuses.items(), key=str)}
+    return result
+
+
+async def run_suite(client, dataset, args) -> dict:
+    session = Session(dataset, args.images)
+    await session.login(client)
+    return {name: await run_scenario(client, session, name, args) for name in args.scenarios}
+
+
+async def in_process(args) -> None:
+    """The child side of ``--mode inprocess``: runs inside the scratch copy."""
+    with open(DATASET_FILE) as source:
+        dataset = json.load(source)
+    sink = SmtpSink(args.smtp_port)
+    await sink.start()
+    try:
+        import main
+
+        async with main.app.router.lifespan_context(main.app):
+            # a 500 is a result to report, not a reason to stop
+            transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as client:
+                scenarios = await run_suite(client, dataset, args)
+            # give the outbox a moment to deliver what the signups queued
+            await asyncio.sleep(args.drain_seconds)
+    finally:
+        await sink.stop()
+    with open(args.child_output, "w") as out:
+        json.dump({"scenarios": scenarios, "emails_delivered": sink.messages}, out)
+
+
+async def under_uvicorn(app_dir: str, dataset: dict, args) -> dict:
+    port = free_port()
+    sink = SmtpSink(args.smtp_port)
+    await sink.start()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=app_dir,
+        stdout=subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_until_up(base_url, server)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+            scenarios = await run_suite(client, dataset, args)
+        await asyncio.sleep(args.drain_seconds)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        await sink.stop()
+    return {"scenarios": scenarios, "emails_delivered": sink.messages}
+
+
+def compare(results: dict, baseline: dict) -> dict:
+    """Percentage change against the baseline; positive is more throughput or more latency."""
+    changes = {}
+    for name, result in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            f"{metric}_change_pct": round((result[metric] - before[metric]) / before[metric] * 100, 1)
+            for metric in ("requests_per_second", "p50_ms", "p95_ms", "p99_ms")
+            if before.get(metric)
+        }
+    return changes
+
+
+def regressions(changes: dict, limit: float) -> list:
+    found = []
+    for name, change in changes.items():
+        if change.get("requests_per_second_change_pct", 0) < -limit:
+            found.append(f"{name}: throughput {change['requests_per_second_change_pct']}%")
+        if change.get("p95_ms_change_pct", 0) > limit:
+            found.append(f"{name}: p95 +{change['p95_ms_change_pct']}%")
+    return found
+
+
+async def main(args):
+    # configure logging before the app modules do, seeding should not log every statement
+    logging.basicConfig(level=logging.WARNING)
+    args.smtp_port = free_port()
+    db_dir = tempfile.mkdtemp(prefix="ecommerce-api-db-")
+    db_path = os.path.join(db_dir, "bench.sqlite3")
+    app_dir = prepare_app({
+        "DB_URL": f"sqlite://{db_path}",
+        "MAIL_PORT": str(args.smtp_port),
+        "MAIL_STARTTLS": "false",
+        "MAIL_USE_CREDENTIALS": "false",
+        "MAIL_POLL_INTERVAL": "0.5",
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+    })
+    try:
+        dataset = await seed_dataset(app_dir, db_path, args)
+        with open(os.path.join(app_dir, DATASET_FILE), "w") as out:
+            json.dump(dataset, out)
+
+        if args.mode == "uvicorn":
+            outcome = await under_uvicorn(app_dir, dataset, args)
+        else:
+            output = os.path.join(db_dir, "results.json")
+            child = [sys.executable, "-m", "benchmarks.bench_api", *sys.argv[1:],
+                     "--child-output", output, "--smtp-port", str(args.smtp_port)]
+            subprocess.run(
+                child, cwd=app_dir, check=True,
+                stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL,
+            )
+            with open(output) as source:
+                outcome = json.load(source)
+    finally:
+        remove_app(app_dir)
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+    results = {
+        "mode": args.mode,
+        "workers": args.workers if args.mode == "uvicorn" else 1,
+        "dataset": {"users": args.users, "products": args.products, "images": args.images},
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "bcrypt_rounds": args.bcrypt_rounds,
+        "machine": {"cpus": os.cpu_count(), "python": platform.python_version(), "platform": platform.platform()},
+        **outcome,
+    }
+    failed = []
+    if args.compare:
+        with open(args.compare) as source:
+            changes = compare(results, json.load(source))
+        results["vs_baseline"] = changes
+        if args.max_regression is not None:
+            failed = regressions(changes, args.max_regression)
+            results["regressions"] = failed
+    if args.save:
+        with open(args.save, "w") as out:
+            json.dump(results, out, indent=2)
+            out.write("\n")
+    report(results)
+    if failed:
+        sys.exit(1)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--scenarios", nargs="+", choices=tuple(SCENARIOS), default=list(DEFAULT_SCENARIOS))
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--login-users", type=int, default=10, help="owners the authenticated scenarios act as")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="password hashing cost of the app under test")
+    parser.add_argument("--drain-seconds", type=float, default=1.0, help="time left for the outbox after the run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compare", help="baseline JSON to report changes against")
+    parser.add_argument("--max-regression", type=float, help="exit 1 when throughput or p95 is this many percent worse")
+    parser.add_argument("--save", help="write the results here, e.g. benchmarks/baseline.json")
+    parser.add_argument("--verbose", action="store_true", help="show the app's log")
+    # used by the in-process child
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    parser.add_argument("--smtp-port", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    asyncio.run(in_process(arguments) if arguments.child_output else main(arguments))
@@ -0,0 +1,88 @@
+"""Bulk CSV import vs. one Product.create per row.
+
+    python -m benchmarks.bench_bulk_import --rows 100000
+"""
+import argparse
+import asyncio
+import io
+import tempfile
+import time
+from decimal import Decimal
+
+from benchmarks.common import close_db, init_db, report, seed
+from bulk import export_products, import_products
+from models import Business, Product
+
+
+def make_csv(rows):
+    out = io.StringIO()
+    out.write("name,category,original_price,new_price,offer_expiration_date\n")
+    for i in range(rows):
+        original = 100 + i % 900
+        out.write(f"sku {i},cat{i % 20},{original},{original * 0.8:.2f},2030-01-01\n")
+    return out.getvalue().encode()
+
+
+async def per_row(business, rows):
+    # the add_new_product path: discount in python and one insert per row
+    for i in range(rows):
+        original = Decimal(100 + i % 900)
+        new = (original * Decimal("0.8")).quantize(Decimal("0.01"))
+        await Product.create(
+            name=f"single {i}", category=f"cat{i % 20}", original_price=original, new_price=new,
+            percentage_discount=int((original - new) / original * 100), business=business,
+        )
+
+
+async def main(args):
+    await init_db()
+    try:
+        await seed(users=1, products_per_business=0)
+        business = await Business.first()
+
+        body = make_csv(args.rows)
+        spool = tempfile.SpooledTemporaryFile()
+        spool.write(body)
+        spool.seek(0)
+
+        started = time.perf_counter()
+        result = await import_products(spool, "csv", business)
+        bulk_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await per_row(business, args.sample)
+        per_row_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        exported = 0
+        async for chunk in export_products(business, "csv"):
+            exported += len(chunk)
+        export_seconds = time.perf_counter() - started
+
+        report({
+            "bulk_import": {
+                "rows": args.rows,
+                "created": result["created"],
+                "seconds": round(bulk_seconds, 3),
+                "rows_per_second": round(args.rows / bulk_seconds, 1),
+            },
+            "per_row_create": {
+                "rows": args.sample,
+                "seconds": round(per_row_seconds, 3),
+                "rows_per_second": round(args.sample / per_row_seconds, 1),
+                "projected_seconds_for_bulk_rows": round(per_row_seconds / args.sample * args.rows, 1),
+            },
+            "export_csv": {
+                "bytes": exported,
+                "seconds": round(export_seconds, 3),
+            },
+        })
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--sample", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
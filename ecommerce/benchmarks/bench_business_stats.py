@@ -0,0 +1,90 @@
+"""Business dashboard statistics: the summary row vs. aggregating on every load.
+
+    live_aggregate  the aggregates the summary holds, computed over the products each time
+    summary_row     get_business_stats, one lookup in businessstats
+    refresh         refresh_business_stats, the recompute a write falls back to
+    delta           add_product_stats + remove_product_stats of a product inside
+                    the business's ranges, what a product write adds
+
+    python -m benchmarks.bench_business_stats --products 100000 --businesses 10
+"""
+import argparse
+import asyncio
+import random
+
+from tortoise import connections
+
+from benchmarks.common import close_db, init_db, report, seed, summarize, timed
+from business_stats import add_product_stats, get_business_stats, refresh_business_stats, remove_product_stats
+from models import BusinessStats
+
+LIVE_SQL = """
+SELECT count(*), avg("percentage_discount"), max("percentage_discount"),
+       min(CAST("new_price" AS REAL)), max(CAST("new_price" AS REAL)),
+       min(CAST("original_price" AS REAL)), max(CAST("original_price" AS REAL))
+FROM "product" WHERE "business_id" = ?
+"""
+LIVE_CATEGORIES_SQL = 'SELECT "category", count(*) FROM "product" WHERE "business_id" = ? GROUP BY "category"'
+
+
+async def main(args):
+    await init_db()
+    try:
+        businesses = await seed(users=args.businesses, products_per_business=args.products // args.businesses)
+        ids = [business.id for business in businesses]
+        for id in ids:
+            await refresh_business_stats(id)
+        connection = connections.get("default")
+        rng = random.Random(args.seed)
+
+        async def live_aggregate():
+            id = rng.choice(ids)
+            await connection.execute_query(LIVE_SQL, [id])
+            await connection.execute_query(LIVE_CATEGORIES_SQL, [id])
+
+        async def summary_row():
+            await get_business_stats(rng.choice(ids))
+
+        async def refresh():
+            await refresh_business_stats(rng.choice(ids))
+
+        # a product in the middle of each business's ranges, which no extreme depends on
+        middle = {
+            stats.business_id: {
+                "business_id": stats.business_id,
+                "category": "bench",
+                "new_price": (stats.min_price + stats.max_price) / 2,
+                "original_price": (stats.min_original_price + stats.max_original_price) / 2,
+                "percentage_discount": 0,
+            }
+            for stats in await BusinessStats.filter(business_id__in=ids)
+        }
+
+        async def delta():
+            values = middle[rng.choice(ids)]
+            await add_product_stats(values)
+            assert await remove_product_stats(values)
+
+        results = {"products": args.products, "businesses": args.businesses}
+        for name, run, iterations in (
+            ("live_aggregate", live_aggregate, args.iterations // 10),
+            ("summary_row", summary_row, args.iterations),
+            ("refresh", refresh, args.iterations // 10),
+            ("delta", delta, args.iterations),
+        ):
+            await timed(run, 5)
+            results[name] = summarize(await timed(run, iterations))
+    finally:
+        await close_db()
+    results["speedup_p50"] = round(results["live_aggregate"]["p50_ms"] / results["summary_row"]["p50_ms"], 1)
+    results["write_speedup_p50"] = round(results["refresh"]["p50_ms"] / results["delta"]["p50_ms"], 1)
+    report(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--businesses", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
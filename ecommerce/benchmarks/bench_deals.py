@@ -0,0 +1,87 @@
+"""Best-deals pages as the catalog grows: scanning products vs. the deals table.
+
+For each ``--sizes`` catalog, ``--expired`` of the products have an offer
+that has run out. A first page and a deep page (cursor after ``--depth``
+deals) are read both ways:
+
+    product_scan  filter product on the expiration date, order by discount
+    active_deals  deals_page, an index range over activedeal
+
+and the sweeper retires the expired rows that were copied into the table.
+
+    python -m benchmarks.bench_deals --sizes 10000 100000 --iterations 200
+"""
+import argparse
+import asyncio
+import random
+
+from tortoise import connections
+
+from benchmarks.common import close_db, init_db, report, seed, summarize, timed
+from deals import DealSweeper, deals_page, rebuild_deals, today
+from models import ActiveDeal, Product
+
+CATEGORIES = ("food", "wear", "home", "tech")
+
+
+async def product_scan(category, limit, offset=0):
+    queryset = Product.filter(offer_expiration_date__gte=today())
+    if category is not None:
+        queryset = queryset.filter(category=category)
+    return await queryset.order_by("-percentage_discount", "-id").offset(offset).limit(limit)
+
+
+async def measure(size: int, args) -> dict:
+    await init_db()
+    try:
+        await seed(users=10, products_per_business=size // 10, categories=CATEGORIES)
+        connection = connections.get("default")
+        # a deterministic share of running offers with spread-out discounts
+        await connection.execute_query(
+            'UPDATE "product" SET "percentage_discount" = ("id" * 37) % 91, "offer_expiration_date" = '
+            f"CASE WHEN (\"id\" * 7) % 100 < {int(args.expired * 100)} THEN '2000-01-01' ELSE '2099-01-01' END"
+        )
+        await rebuild_deals()
+        deep_cursor = (await deals_page(limit=args.depth))[1]
+        rng = random.Random(args.seed)
+
+        def category():
+            return rng.choice(CATEGORIES + (None,))
+
+        cases = {
+            "product_scan_first": lambda: product_scan(category(), args.limit),
+            "active_deals_first": lambda: deals_page(category(), limit=args.limit),
+            "product_scan_deep": lambda: product_scan(None, args.limit, args.depth),
+            "active_deals_deep": lambda: deals_page(None, deep_cursor, args.limit),
+        }
+        results = {"products": size, "active_deals": await ActiveDeal.all().count()}
+        for name, run in cases.items():
+            await timed(run, 5)
+            results[name] = summarize(await timed(run, args.iterations))
+
+        # what the sweeper has to do when all of those offers run out at once
+        await connection.execute_query(
+            'UPDATE "activedeal" SET "offer_expiration_date" = \'2000-01-01\' WHERE "id" % 2 = 0'
+        )
+        sweeper = DealSweeper(batch_size=args.batch_size)
+        latencies = await timed(sweeper.sweep, 1)
+        results["sweep"] = {"rows": sweeper.swept, "seconds": round(latencies[0], 3)}
+    finally:
+        await close_db()
+    return results
+
+
+async def main(args):
+    report({str(size): await measure(size, args) for size in args.sizes})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--expired", type=float, default=0.8, help="share of products whose offer has run out")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
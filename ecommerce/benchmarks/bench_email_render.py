@@ -0,0 +1,56 @@
+"""Email render throughput from the precompiled templates.
+
+``render`` renders a different context per recipient, as every
+verification email is, ``message`` also builds the multipart MIME message.
+
+    python -m benchmarks.bench_email_render --renders 20000
+"""
+import argparse
+import time
+from email.message import EmailMessage
+
+from benchmarks.common import report
+from emailss import get_email_templates, load_email_templates, render_email
+
+
+def throughput(fn, renders):
+    started = time.perf_counter()
+    for i in range(renders):
+        fn(i)
+    elapsed = time.perf_counter() - started
+    return {"renders": renders, "renders_per_second": round(renders / elapsed, 1)}
+
+
+def build_message(i):
+    html, text = render_email("verification", {
+        "username": f"user{i}", "verification_url": f"http://localhost:8000/verification/?token={i}"
+    })
+    message = EmailMessage()
+    message["Subject"] = "EasyShopas Account Verification Email"
+    message["To"] = f"user{i}@example.com"
+    message.set_content(text)
+    message.add_alternative(html, subtype="html")
+    return message.as_bytes()
+
+
+def main(args):
+    started = time.perf_counter()
+    load_email_templates()
+    compile_ms = (time.perf_counter() - started) * 1000
+    get_email_templates("verification", "en")
+
+    results = {
+        "compile_ms": round(compile_ms, 3),
+        "render": throughput(lambda i: render_email("verification", {
+            "username": f"user{i}", "verification_url": f"http://localhost:8000/verification/?token={i}"
+        }), args.renders),
+        "message": throughput(build_message, args.renders // 4),
+    }
+    results["templates"] = get_email_templates.cache_info()._asdict()
+    report(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--renders", type=int, default=20000)
+    main(parser.parse_args())
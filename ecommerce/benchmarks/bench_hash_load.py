@@ -0,0 +1,66 @@
+"""Event-loop latency for unrelated requests while a burst of logins is hashing.
+
+A probe coroutine stands in for a cheap endpoint and is scheduled every few
+milliseconds; its lateness is what every other in-flight request would see.
+The burst runs once with bcrypt called inline on the loop and once through the
+bounded hash pool.
+
+    python -m benchmarks.bench_hash_load --logins 32
+"""
+import argparse
+import asyncio
+import time
+
+from authentications import hash_password_sync, hash_pool, verify_password, verify_password_sync
+from benchmarks.common import report, summarize
+
+
+async def inline_verify(plain, hashed):
+    # what the login handler did before: synchronous bcrypt on the event loop
+    return verify_password_sync(plain, hashed)
+
+
+async def probe(stop, interval, lags):
+    while not stop.is_set():
+        scheduled = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - scheduled - interval))
+
+
+async def burst(verify, hashed, logins, interval):
+    lags = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(stop, interval, lags))
+    await asyncio.sleep(interval * 5)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(verify("correct horse", hashed) for _ in range(logins)), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await prober
+    summary = summarize(lags)
+    summary["logins"] = logins
+    summary["rejected"] = sum(isinstance(result, Exception) for result in results)
+    summary["logins_per_second"] = round(logins / elapsed, 2)
+    return summary
+
+
+async def main(args):
+    hashed = hash_password_sync("correct horse")
+    results = {
+        "inline": await burst(inline_verify, hashed, args.logins, args.interval),
+        "pool": await burst(verify_password, hashed, args.logins, args.interval),
+    }
+    results["pool"]["workers"] = hash_pool.max_workers
+    hash_pool.shutdown()
+    report({"probe_lag": results})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--interval", type=float, default=0.005)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,53 @@
+"""Hashes per second per core for each password hashing profile.
+
+Each profile hashes and verifies on a single thread, which is the cost one
+core pays per registration and per login.
+
+    python -m benchmarks.bench_hash_profiles --seconds 3
+"""
+import argparse
+import time
+
+from authentications import build_crypt_context
+from benchmarks.common import report
+
+PROFILES = {
+    "bcrypt-10": {"scheme": "bcrypt", "bcrypt_rounds": 10},
+    "bcrypt-12": {"scheme": "bcrypt", "bcrypt_rounds": 12},
+    "bcrypt-13": {"scheme": "bcrypt", "bcrypt_rounds": 13},
+    "argon2-t2-m19MiB": {"scheme": "argon2", "argon2_time_cost": 2, "argon2_memory_cost": 19456},
+    "argon2-t1-m47MiB": {"scheme": "argon2", "argon2_time_cost": 1, "argon2_memory_cost": 47104},
+    "argon2-t3-m64MiB": {"scheme": "argon2", "argon2_time_cost": 3, "argon2_memory_cost": 65536},
+}
+
+
+def rate(fn, seconds):
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return calls / elapsed
+
+
+def main(args):
+    results = {}
+    for name, profile in PROFILES.items():
+        context = build_crypt_context(**profile)
+        if context.default_scheme() != profile["scheme"]:
+            results[name] = {"skipped": f"{profile['scheme']} backend not installed"}
+            continue
+        hashed = context.hash("correct horse battery staple")
+        results[name] = {
+            "hashes_per_second": round(rate(lambda: context.hash("correct horse battery staple"), args.seconds), 2),
+            "verifies_per_second": round(rate(lambda: context.verify("correct horse battery staple", hashed), args.seconds), 2),
+        }
+    report({"per_core": results})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    main(parser.parse_args())
@@ -0,0 +1,205 @@
+"""Images per second from /static/images under concurrent load.
+
+``--images`` distinct JPEGs are written under content-hash names into a
+scratch directory. Each server variant is then started with uvicorn and
+driven over keep-alive connections, with ``--concurrency`` requests in flight:
+
+    static  the plain ``StaticFiles`` mount the app used before
+    images  ``ImageFiles``, what main.py mounts now
+
+and, against each of them:
+
+    full        GET a random image
+    revalidate  GET with the image's ETag in If-None-Match, answered 304
+    range       GET the first KB of a random image
+
+Besides throughput, the report records whether each variant sent the
+caching headers a browser or CDN needs to avoid the request entirely.
+
+    python -m benchmarks.bench_images --requests 5000 --concurrency 32
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_api import jpeg
+from benchmarks.common import free_port, report, summarize, wait_until_up
+
+SERVERS = ("static", "images")
+SCENARIOS = ("full", "revalidate", "range")
+
+
+def write_images(directory: str, count: int, size: int) -> list:
+    names = []
+    for i in range(count):
+        body = jpeg(i, size)
+        name = hashlib.sha256(body).hexdigest()[:32] + ".jpg"
+        with open(os.path.join(directory, name), "wb") as out:
+            out.write(body)
+        names.append(name)
+    return names
+
+
+def serve(kind: str, directory: str, port: int) -> None:
+    """The child side: serve ``directory`` at /static/images with one kind of mount."""
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Mount, Route
+    from starlette.staticfiles import StaticFiles
+
+    from image_files import ImageFiles
+
+    files = ImageFiles(directory=directory) if kind == "images" else StaticFiles(directory=directory)
+    app = Starlette(routes=[
+        Route("/", lambda request: PlainTextResponse("ok")),
+        Mount("/static/images", app=files),
+    ])
+    uvicorn.run(app, port=port, log_level="warning")
+
+
+class Connection:
+    """A bare keep-alive HTTP/1.1 client, so the load generator costs less than the server it drives."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def get(self, path: str, headers: dict) -> tuple:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        lines = [f"GET {path} HTTP/1.1", "Host: bench"] + [f"{name}: {value}" for name, value in headers.items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        response_headers = {}
+        for line in header_lines:
+            if line:
+                name, _, value = line.partition(":")
+                response_headers[name.strip().lower()] = value.strip()
+        body = await self.reader.readexactly(int(response_headers.get("content-length", 0)))
+        return int(status_line.split()[1]), response_headers, body
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def run_scenario(port, names, etags, name, args) -> dict:
+    rng = random.Random(f"{args.seed}:{name}")
+    latencies = []
+    statuses = {}
+    received = 0
+
+    def build():
+        image = rng.choice(names)
+        headers = {}
+        if name == "revalidate":
+            headers["If-None-Match"] = etags[image]
+        elif name == "range":
+            headers["Range"] = "bytes=0-1023"
+        return f"/static/images/{image}", headers
+
+    async def worker(requests) -> None:
+        nonlocal received
+        connection = Connection(port)
+        try:
+            for record in requests:
+                url, headers = build()
+                started = time.perf_counter()
+                status_code, _, body = await connection.get(url, headers)
+                if record:
+                    latencies.append(time.perf_counter() - started)
+                    statuses[status_code] = statuses.get(status_code, 0) + 1
+                    received += len(body)
+        finally:
+            connection.close()
+
+    await worker([False] * args.warmup)
+
+    # a fixed number of requests shared by ``concurrency`` connections keeps runs comparable
+    remaining = iter([True] * args.requests)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(remaining) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "images_per_second": round(len(latencies) / elapsed, 1),
+        "mb_per_second": round(received / elapsed / 1e6, 2),
+    }
+    result.update(summarize(latencies))
+    result["statuses"] = {str(code): count for code, count in sorted(statuses.items())}
+    return result
+
+
+async def drive(kind: str, directory: str, names: list, args) -> dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_images", "--serve", kind, "--directory", directory,
+         "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        await wait_until_up(f"http://127.0.0.1:{port}", server)
+        connection = Connection(port)
+        try:
+            _, first, _ = await connection.get(f"/static/images/{names[0]}", {})
+            etags = {}
+            for name in names:
+                etags[name] = (await connection.get(f"/static/images/{name}", {}))[1]["etag"]
+        finally:
+            connection.close()
+        results = {"cache_control": first.get("cache-control"), "etag": first.get("etag")}
+        for scenario in SCENARIOS:
+            results[scenario] = await run_scenario(port, names, etags, scenario, args)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return results
+
+
+async def main(args):
+    directory = tempfile.mkdtemp(prefix="ecommerce-images-")
+    try:
+        names = write_images(directory, args.images, args.size)
+        average = sum(os.path.getsize(os.path.join(directory, name)) for name in names) // len(names)
+        results = {"files": len(names), "average_bytes": average, "concurrency": args.concurrency}
+        for kind in SERVERS:
+            results[kind] = await drive(kind, directory, names, args)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    results["speedup"] = {
+        scenario: round(
+            results["images"][scenario]["images_per_second"] / results["static"][scenario]["images_per_second"], 2
+        )
+        for scenario in SCENARIOS
+    }
+    report(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--size", type=int, default=320, help="image width and height in pixels")
+    parser.add_argument("--requests", type=int, default=5000, help="per scenario")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--serve", choices=SERVERS, help=argparse.SUPPRESS)
+    parser.add_argument("--directory", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.directory, args.port)
+    else:
+        asyncio.run(main(args))
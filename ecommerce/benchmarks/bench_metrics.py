@@ -0,0 +1,72 @@
+"""Cost of the request instrumentation on a cheap endpoint.
+
+The same two-query endpoint is served by a plain FastAPI app and by one with
+``MetricsMiddleware``, ``TimedRoute`` and the instrumented tortoise client,
+and driven in-process, so the difference is the per-request overhead.
+
+    python -m benchmarks.bench_metrics --iterations 5000
+"""
+import argparse
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.common import close_db, init_db, report, seed, summarize, timed
+from metrics import MetricsMiddleware, RequestStats, TimedRoute, instrument_db
+from models import Product
+
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+    if instrumented:
+        app.router.route_class = TimedRoute
+        app.add_middleware(MetricsMiddleware, stats=RequestStats())
+
+    @app.get("/product/{id}")
+    async def product(id: int):
+        row = await Product.filter(id=id).values("id", "name", "category", "business_id")
+        return {"data": row[0], "in_category": await Product.filter(category=row[0]["category"]).count()}
+
+    return app
+
+
+async def drive(app: FastAPI, ids, iterations: int) -> dict:
+    picks = iter(ids * (iterations // len(ids) + 1))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one():
+            response = await client.get(f"/product/{next(picks)}")
+            assert response.status_code == 200
+            return response
+
+        await timed(one, 100)
+        latencies = await timed(one, iterations)
+        timing = (await one()).headers.get("server-timing")
+    summary = summarize(latencies)
+    if timing:
+        summary["server_timing"] = timing
+    return summary
+
+
+async def main(args):
+    await init_db()
+    try:
+        await seed(users=10, products_per_business=args.products // 10)
+        ids = list(await Product.all().limit(1000).values_list("id", flat=True))
+        plain = await drive(build_app(False), ids, args.iterations)
+        instrument_db()
+        instrumented = await drive(build_app(True), ids, args.iterations)
+    finally:
+        await close_db()
+    report({
+        "plain": plain,
+        "instrumented": instrumented,
+        "overhead_p50_ms": round(instrumented["p50_ms"] - plain["p50_ms"], 3),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=5000)
+    asyncio.run(main(parser.parse_args()))
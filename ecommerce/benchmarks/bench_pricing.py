@@ -0,0 +1,147 @@
+"""Pricing analytics and batch repricing: NumPy columns vs. Python rows.
+
+Analytics over the whole catalog (``--products`` rows, 1M by default):
+
+    load              load_price_columns, the chunked id walk into arrays
+    python_summary    the same figures from the fetched rows with loops, sorted() and dicts
+    numpy_summary     pricing_summary over the loaded columns
+
+Repricing one business (``--products / --businesses`` rows), 10% off its
+original prices, alternating with 20% so every run changes every row:
+
+    orm_bulk_update   fetch Product objects, Decimal math per row, bulk_update
+    vectorized        reprice, array math and one executemany per chunk
+
+and finally ``reprice`` over every business, i.e. the whole catalog.
+
+    python -m benchmarks.bench_pricing --products 1000000 --businesses 10
+"""
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from tortoise import connections
+
+from benchmarks.common import close_db, init_db, report, seed
+from deals import rebuild_deals
+from models import Product
+from pricing import CHUNK_SQL, PERCENTILES, load_price_columns, pricing_summary, reprice
+
+CENT = Decimal("0.01")
+
+
+def python_percentiles(values):
+    ordered = sorted(values)
+    result = {}
+    for q in PERCENTILES:
+        # linear interpolation, like numpy's default
+        position = (len(ordered) - 1) * q / 100
+        low = int(position)
+        high = min(low + 1, len(ordered) - 1)
+        result[f"p{q}"] = round(ordered[low] + (ordered[high] - ordered[low]) * (position - low), 2)
+    return result
+
+
+def python_summary(rows, bins=10):
+    """pricing_summary computed row by row, the way it would be without NumPy."""
+    discounts = [row[3] for row in rows]
+    prices = [row[2] for row in rows]
+    histogram = [0] * bins
+    categories = defaultdict(lambda: {"products": 0, "discount": 0, "max_discount": None, "price": 0.0, "prices": []})
+    for _, _, price, discount, category in rows:
+        histogram[min(max(discount, 0) * bins // 100, bins - 1)] += 1
+        entry = categories[category]
+        entry["products"] += 1
+        entry["discount"] += discount
+        entry["max_discount"] = discount if entry["max_discount"] is None else max(entry["max_discount"], discount)
+        entry["price"] += price
+        entry["prices"].append(price)
+    return {
+        "products": len(rows),
+        "discount": {
+            "average": round(sum(discounts) / len(discounts), 2),
+            "percentiles": python_percentiles(discounts),
+            "distribution": histogram,
+        },
+        "new_price": {"average": round(sum(prices) / len(prices), 2), "percentiles": python_percentiles(prices)},
+        "categories": {
+            name: {
+                "products": entry["products"],
+                "average_discount": round(entry["discount"] / entry["products"], 2),
+                "max_discount": entry["max_discount"],
+                "average_price": round(entry["price"] / entry["products"], 2),
+                "min_price": min(entry["prices"]),
+                "max_price": max(entry["prices"]),
+            }
+            for name, entry in sorted(categories.items())
+        },
+    }
+
+
+async def orm_reprice(business_id, percent_off):
+    factor = Decimal(100 - percent_off) / 100
+    products = await Product.filter(business_id=business_id)
+    for product in products:
+        product.new_price = (product.original_price * factor).quantize(CENT, ROUND_HALF_EVEN)
+        product.percentage_discount = int((product.original_price - product.new_price) / product.original_price * 100)
+    await Product.bulk_update(products, fields=["new_price", "percentage_discount"], batch_size=1000)
+    return len(products)
+
+
+async def seconds(coro):
+    started = time.perf_counter()
+    result = await coro
+    return time.perf_counter() - started, result
+
+
+async def main(args):
+    await init_db()
+    try:
+        started = time.perf_counter()
+        businesses = await seed(users=args.businesses, products_per_business=args.products // args.businesses)
+        connection = connections.get("default")
+        # running offers, so repricing also has deals to keep in step
+        await connection.execute_query('UPDATE "product" SET "offer_expiration_date" = \'2099-01-01\'')
+        await rebuild_deals()
+        results = {"products": args.products, "businesses": args.businesses, "seed_s": round(time.perf_counter() - started, 1)}
+
+        load_s, columns = await seconds(load_price_columns())
+        results["load"] = {"seconds": round(load_s, 3), "rows_per_s": round(len(columns) / load_s)}
+
+        # the same rows as floats, for the loop version
+        _, rows = await connection.execute_query(CHUNK_SQL.format(filters=""), [0, args.products])
+        rows = [tuple(row) for row in rows]
+        started = time.perf_counter()
+        python_summary(rows)
+        results["python_summary_s"] = round(time.perf_counter() - started, 3)
+        started = time.perf_counter()
+        pricing_summary(columns)
+        results["numpy_summary_s"] = round(time.perf_counter() - started, 3)
+        results["summary_speedup"] = round(results["python_summary_s"] / results["numpy_summary_s"], 1)
+        del rows, columns
+
+        business_id = businesses[0].id
+        orm_s, count = await seconds(orm_reprice(business_id, 10))
+        results["orm_bulk_update"] = {"rows": count, "seconds": round(orm_s, 3), "rows_per_s": round(count / orm_s)}
+        vector_s, outcome = await seconds(reprice(business_id, 20))
+        results["vectorized"] = {**outcome, "seconds": round(vector_s, 3), "rows_per_s": round(outcome["updated"] / vector_s)}
+        results["reprice_speedup"] = round(results["vectorized"]["rows_per_s"] / results["orm_bulk_update"]["rows_per_s"], 1)
+
+        started = time.perf_counter()
+        updated = 0
+        for business in businesses:
+            updated += (await reprice(business.id, 10))["updated"]
+        catalog_s = time.perf_counter() - started
+        results["catalog_reprice"] = {"rows": updated, "seconds": round(catalog_s, 3), "rows_per_s": round(updated / catalog_s)}
+    finally:
+        await close_db()
+    report(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000000)
+    parser.add_argument("--businesses", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,51 @@
+"""Product detail: four sequential round trips vs. one joined query.
+
+    python -m benchmarks.bench_product_detail --products 20000 --iterations 2000
+"""
+import argparse
+import asyncio
+import random
+
+from benchmarks.common import close_db, count_queries, init_db, report, seed, summarize, timed
+from catalog import get_product_detail, product_detail_response
+from models import Product, product_pydantic
+
+
+async def legacy_detail(id):
+    # the handler as it was before the joined read path
+    product = await Product.get(id=id)
+    business = await product.business
+    owner = await business.owner
+    response = await product_pydantic.from_queryset_single(Product.get(id=id))
+    return response, business, owner
+
+
+async def joined_detail(id):
+    return product_detail_response(await get_product_detail(id))
+
+
+async def main(args):
+    await init_db()
+    try:
+        await seed(users=args.businesses, products_per_business=args.products // args.businesses)
+        ids = await Product.all().values_list("id", flat=True)
+        rng = random.Random(42)
+        sample = [rng.choice(ids) for _ in range(args.iterations)]
+
+        results = {}
+        for name, handler in (("legacy", legacy_detail), ("joined", joined_detail)):
+            picks = iter(sample)
+            with count_queries() as counter:
+                latencies = await timed(lambda: handler(next(picks)), args.iterations)
+            results[name] = summarize(latencies, counter.count)
+        report(results)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--businesses", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
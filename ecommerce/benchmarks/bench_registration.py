@@ -0,0 +1,106 @@
+"""Registration: the old check-then-insert flow vs. the single transaction.
+
+``throughput`` registers distinct users one after another with an already
+hashed password, so it measures the database work per signup. ``race``
+fires the real handler for the same few usernames from many coroutines at
+once and checks that exactly one signup per name wins, the rest get a 400,
+and no user is left without its business; the run exits non-zero when not.
+ecommerce/tests/test_registration.py asserts the same on every test run.
+
+    python -m benchmarks.bench_registration --registrations 2000 --racers 50
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from fastapi import HTTPException
+
+from accounts import create_account
+from authentications import hash_password_sync
+from benchmarks.common import close_db, count_queries, init_db, report
+from emailss import enqueue_verification_email
+from models import Business, EmailOutbox, User, user_pydanticIn
+
+
+async def legacy_register(username, email, password):
+    # what /register did before: a connectivity probe, two lookups, the insert,
+    # then the post_save hook creating the business outside any transaction
+    await User.first()
+    if await User.get_or_none(email=email):
+        raise HTTPException(status_code=400, detail="email taken")
+    if await User.get_or_none(username=username):
+        raise HTTPException(status_code=400, detail="username taken")
+    user = await User.create(username=username, email=email, password=password, email_sent=False)
+    await Business.create(business_name=username, owner=user)
+    await enqueue_verification_email(user)
+    return user
+
+
+async def throughput(register, prefix, registrations, password):
+    with count_queries() as counter:
+        started = time.perf_counter()
+        for i in range(registrations):
+            await register(f"{prefix}{i}", f"{prefix}{i}@example.com", password)
+        elapsed = time.perf_counter() - started
+    return {
+        "registrations": registrations,
+        "registrations_per_second": round(registrations / elapsed, 1),
+        "queries_per_registration": round(counter.count / registrations, 2),
+    }
+
+
+async def race(names, racers):
+    from main import user_registration
+
+    async def signup(i):
+        name = names[i % len(names)]
+        try:
+            await user_registration(user_pydanticIn(username=name, email=f"{name}@example.com", password="pw123456"))
+            return 200
+        except HTTPException as e:
+            return e.status_code
+
+    started = time.perf_counter()
+    codes = await asyncio.gather(*(signup(i) for i in range(racers)))
+    elapsed = time.perf_counter() - started
+
+    users = await User.filter(username__in=names).count()
+    businesses = await Business.filter(business_name__in=names).count()
+    emails = await EmailOutbox.filter(user__username__in=names).count()
+    statuses = {str(code): codes.count(code) for code in sorted(set(codes))}
+    return {
+        "racers": racers,
+        "names": len(names),
+        "statuses": statuses,
+        "users": users,
+        "businesses": businesses,
+        "verification_emails": emails,
+        "consistent": statuses.get("200") == len(names) == users == businesses == emails
+        and set(statuses) <= {"200", "400"},
+        "seconds": round(elapsed, 3),
+    }
+
+
+async def main(args):
+    await init_db()
+    try:
+        password = hash_password_sync("pw123456")
+        results = {
+            "legacy": await throughput(legacy_register, "old", args.registrations, password),
+            "transaction": await throughput(create_account, "new", args.registrations, password),
+            "race": await race([f"racer{i}" for i in range(args.names)], args.racers),
+        }
+    finally:
+        await close_db()
+    report(results)
+    if not results["race"]["consistent"]:
+        sys.exit("race: duplicate signups did not resolve to one account per name")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--registrations", type=int, default=2000)
+    parser.add_argument("--racers", type=int, default=50)
+    parser.add_argument("--names", type=int, default=5, help="distinct usernames the racers fight over")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,118 @@
+"""Catalog reads: rebuilding every response vs. cache hits vs. 304 revalidation.
+
+    python -m benchmarks.bench_response_cache --products 20000 --iterations 2000
+"""
+import argparse
+import asyncio
+import random
+
+from starlette.requests import Request
+
+from benchmarks.common import close_db, count_queries, init_db, report, seed, summarize, timed
+from catalog import catalog_queryset, get_product_detail, product_detail_response, product_page
+from models import Product, product_pydantic
+from response_cache import ResponseCache, cache_key, catalog_tags
+
+
+def make_request(if_none_match=None):
+    headers = [(b"accept", b"application/json")]
+    if if_none_match:
+        headers.append((b"if-none-match", if_none_match.encode()))
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": headers})
+
+
+def list_build(category):
+    async def build():
+        products, next_cursor = await product_page(catalog_queryset(category=category), limit=50)
+        data = [product_pydantic.model_validate(product) for product in products]
+        payload = {"status": "ok", "data": data, "next_cursor": next_cursor}
+        return payload, catalog_tags(category, [product.id for product in products])
+    return build
+
+
+def detail_build(id):
+    async def build():
+        product = await get_product_detail(id)
+        payload = {"status": "ok", "data": product_detail_response(product)}
+        return payload, [f"product:{id}", f"business:{product.business_id}"]
+    return build
+
+
+async def run(cache, requests, conditional, iterations):
+    """``requests`` is a list of (key, build); with ``conditional`` the client sends the ETag it saw."""
+    etags = {}
+    picks = iter(requests * (iterations // len(requests) + 1))
+
+    async def one():
+        key, build = next(picks)
+        response = await cache.respond(make_request(etags.get(key) if conditional else None), key, build)
+        etags[key] = response.headers["etag"]
+        return response
+
+    with count_queries() as counter:
+        latencies = await timed(one, iterations)
+    return summarize(latencies, counter.count)
+
+
+async def main(args):
+    await init_db()
+    try:
+        await seed(users=args.businesses, products_per_business=args.products // args.businesses)
+        ids = await Product.all().values_list("id", flat=True)
+        rng = random.Random(42)
+        categories = [None, "food", "wear", "home", "tech"]
+        hot = [
+            (cache_key("/product", "newest", category, None, None, 50, None, ""), list_build(category))
+            for category in categories
+        ] + [
+            (cache_key("/product/{id}", id, None, ""), detail_build(id))
+            for id in rng.sample(ids, args.hot_products)
+        ]
+        rng.shuffle(hot)
+
+        results = {"products": args.products, "hot_keys": len(hot)}
+        # a zero-sized cache rebuilds and re-serializes every response, like the handlers used to
+        uncached = ResponseCache()
+        uncached.backend.maxsize = 0
+        results["uncached"] = await run(uncached, hot, False, args.iterations)
+
+        cache = ResponseCache()
+        for key, build in hot:
+            await cache.fetch(key, build)
+        results["cached_200"] = await run(cache, hot, False, args.iterations)
+        results["cached_304"] = await run(cache, hot, True, args.iterations)
+
+        # a write to one product every ``write_every`` reads
+        writes = 0
+
+        async def write():
+            nonlocal writes
+            id = rng.choice(ids)
+            cache.invalidate(f"product:{id}", "catalog")
+            writes += 1
+
+        mixed = iter(hot * (args.iterations // len(hot) + 1))
+
+        async def one():
+            if rng.random() < 1 / args.write_every:
+                await write()
+            key, build = next(mixed)
+            return await cache.respond(make_request(), key, build)
+
+        with count_queries() as counter:
+            latencies = await timed(one, args.iterations)
+        results["cached_with_writes"] = {**summarize(latencies, counter.count), "writes": writes}
+        results["cache"] = cache.stats()
+        report(results)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--businesses", type=int, default=20)
+    parser.add_argument("--hot-products", type=int, default=200)
+    parser.add_argument("--write-every", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
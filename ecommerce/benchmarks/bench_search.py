@@ -0,0 +1,46 @@
+"""Full-text search latency over a seeded catalog.
+
+    python -m benchmarks.bench_search --products 1000000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import close_db, init_db, report, seed, summarize, timed
+from search import rebuild_search_index, search_products
+
+QUERIES = ["product", "prod 1", "food", "wear 12", "user3", "product 7-9", "tech", "home user1"]
+
+
+async def main(args):
+    await init_db()
+    try:
+        await seed(users=args.businesses, products_per_business=args.products // args.businesses)
+
+        started = time.perf_counter()
+        await rebuild_search_index()
+        build_seconds = time.perf_counter() - started
+
+        rng = random.Random(7)
+        results = {"products": args.products, "index_build_seconds": round(build_seconds, 2)}
+        for label, kwargs in (
+            ("query", {}),
+            ("query_category", {"category": "food"}),
+            ("query_deep_page", {"offset": 200}),
+        ):
+            latencies = await timed(
+                lambda: search_products(rng.choice(QUERIES), limit=20, **kwargs), args.iterations
+            )
+            results[label] = summarize(latencies)
+        report(results)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--businesses", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,83 @@
+"""Serialization cost per 1,000 products, pydantic models vs. row projections.
+
+Every variant starts from the same loaded ``Product`` instances, so only
+turning them into response bytes is timed:
+
+    pydantic_jsonable  model per row, jsonable_encoder, json.dumps (the old render_json)
+    pydantic_ndjson    model per row, model_dump_json (the old NDJSON export)
+    row_orjson         product_row and orjson (what the handlers do now)
+    row_stdlib         product_row and the json fallback used without orjson
+
+    python -m benchmarks.bench_serialization --rows 1000 --iterations 200
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+import serialization
+from benchmarks.common import close_db, init_db, report, seed
+from models import Product, product_pydantic
+from serialization import dumps, product_row
+
+
+def pydantic_jsonable(products):
+    payload = {"status": "ok", "data": [product_pydantic.model_validate(product) for product in products]}
+    return json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def pydantic_ndjson(products):
+    return "".join(product_pydantic.model_validate(product).model_dump_json() + "\n" for product in products).encode()
+
+
+def row_orjson(products):
+    return dumps({"status": "ok", "data": [product_row(product) for product in products]})
+
+
+def row_stdlib(products):
+    fast, serialization.orjson = serialization.orjson, None
+    try:
+        return dumps({"status": "ok", "data": [product_row(product) for product in products]})
+    finally:
+        serialization.orjson = fast
+
+
+def measure(encode, products, iterations):
+    encode(products)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        body = encode(products)
+    elapsed = time.perf_counter() - started
+    return {
+        "ms_per_1000_products": round(elapsed / iterations * 1000 * 1000 / len(products), 3),
+        "bytes": len(body),
+    }
+
+
+async def main(args):
+    await init_db()
+    try:
+        await seed(users=1, products_per_business=args.rows)
+        products = await Product.all().order_by("id").limit(args.rows)
+    finally:
+        await close_db()
+
+    results = {"rows": len(products)}
+    for encode in (pydantic_jsonable, pydantic_ndjson, row_orjson, row_stdlib):
+        results[encode.__name__] = measure(encode, products, args.iterations)
+    results["same_bytes"] = pydantic_jsonable(products) == row_orjson(products) == row_stdlib(products)
+    results["speedup"] = round(
+        results["pydantic_jsonable"]["ms_per_1000_products"] / results["row_orjson"]["ms_per_1000_products"], 1
+    )
+    report(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
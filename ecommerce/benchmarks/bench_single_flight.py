@@ -0,0 +1,112 @@
+"""A burst of identical reads on a cold key: every request querying vs. one shared flight.
+
+Each burst sends ``--concurrency`` concurrent reads of one product right
+after its cached response was invalidated, as happens when a flash sale
+starts, and counts the queries the burst ran:
+
+    uncoalesced   ResponseCache.fetch as it was, every miss builds the response
+    single_flight ResponseCache.fetch, one build shared by the whole burst
+
+and the same for the business lookup of ``/user/me``:
+
+    business_uncoalesced  Business.get per request
+    business_single_flight  business lookups through SingleFlight
+
+    python -m benchmarks.bench_single_flight --concurrency 500 --bursts 50
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import close_db, count_queries, init_db, report, seed, summarize
+from catalog import get_product_detail, product_detail_response
+from database import read_db
+from models import Business, Product
+from response_cache import MemoryBackend, ResponseCache, cache_key
+from single_flight import SingleFlight
+
+
+class UncoalescedCache(ResponseCache):
+    async def fetch(self, key, build):
+        entry = self.get(key)
+        if entry is None:
+            entry = await self._build(key, build)
+        return entry
+
+
+def product_reader(cache, id):
+    key = cache_key("/product/{id}", id, None, "")
+
+    async def build():
+        product = await get_product_detail(id)
+        payload = {"status": "ok", "data": product_detail_response(product)}
+        return payload, [f"product:{id}", f"business:{product.business_id}", f"user:{product.business.owner_id}"]
+
+    async def read():
+        return (await cache.fetch(key, build)).body
+
+    return read
+
+
+async def bursts(read, reset, concurrency, count):
+    latencies, queries = [], []
+    for _ in range(count):
+        reset()
+        with count_queries() as counter:
+            started = time.perf_counter()
+            bodies = await asyncio.gather(*(read() for _ in range(concurrency)))
+            latencies.append(time.perf_counter() - started)
+        assert len(set(bodies)) == 1
+        queries.append(counter.count)
+    summary = summarize(latencies)
+    summary["queries_per_burst"] = max(queries)
+    return summary
+
+
+async def main(args):
+    await init_db()
+    try:
+        businesses = await seed(users=args.businesses, products_per_business=args.products // args.businesses)
+        id = (await Product.all().order_by("id").first()).id
+        owner_id = businesses[0].owner_id
+        results = {"concurrency": args.concurrency, "bursts": args.bursts}
+
+        for name, cache in (
+            ("uncoalesced", UncoalescedCache(backend=MemoryBackend())),
+            ("single_flight", ResponseCache(backend=MemoryBackend())),
+        ):
+            read = product_reader(cache, id)
+            # the first request after an invalidation misses, the rest of its burst too
+            reset = lambda: cache.invalidate(f"product:{id}")
+            await bursts(read, reset, 10, 2)
+            results[name] = await bursts(read, reset, args.concurrency, args.bursts)
+            if name == "single_flight":
+                results[name]["flights"] = cache.flights.stats()
+
+        lookups = SingleFlight()
+
+        async def business_direct():
+            return (await Business.get(owner_id=owner_id, using_db=read_db())).id
+
+        async def business_shared():
+            business, _ = await lookups.do(owner_id, lambda: Business.get(owner_id=owner_id, using_db=read_db()))
+            return business.id
+
+        for name, read in (("business_uncoalesced", business_direct), ("business_single_flight", business_shared)):
+            results[name] = await bursts(read, lambda: None, args.concurrency, args.bursts)
+    finally:
+        await close_db()
+    for prefix in ("", "business_"):
+        results[f"{prefix}speedup_p50"] = round(
+            results[f"{prefix}uncoalesced"]["p50_ms"] / results[f"{prefix}single_flight"]["p50_ms"], 1
+        )
+    report(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--businesses", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--bursts", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,157 @@
+"""Multi-worker load test: uvicorn workers sharing one sqlite database.
+
+Each run copies the app into a scratch directory, seeds a catalog, starts
+``uvicorn main:app --workers N`` and drives it with a read-heavy mix of
+catalog and detail reads plus small bulk inserts, for every combination of
+worker count and journal mode:
+
+    python -m benchmarks.bench_workers --workers 1 2 4 --journal-modes DELETE WAL --seconds 15
+
+Point ``--db-url`` at an already seeded Postgres database to load test that instead.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import (
+    close_db, free_port, init_db, prepare_app, remove_app, report, seed, summarize, wait_until_up,
+)
+
+def prepare_workers_app(db_url: str, response_cache: bool) -> str:
+    env = {"DB_URL": db_url}
+    if not response_cache:
+        # measure the database, not the per-worker response cache
+        env["RESPONSE_CACHE_SIZE"] = "0"
+    return prepare_app(env)
+
+
+async def drive(base_url: str, ids, seconds: float, concurrency: int, write_ratio: float) -> dict:
+    latencies = {"read": [], "write": []}
+    statuses = {}
+    rng = random.Random(1)
+    categories = ["food", "wear", "home", "tech"]
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=30.0,
+        limits=httpx.Limits(max_connections=concurrency),
+    ) as client:
+        name = f"load{rng.randrange(10 ** 9)}"
+        await client.post("/register", json={"username": name[:20], "email": f"{name}@example.com", "password": "pw123456"})
+        token = (await client.post("/token", data={"username": name[:20], "password": "pw123456"})).json()["access_token"]
+        auth = {"Authorization": f"Bearer {token}"}
+
+        deadline = time.monotonic() + seconds
+
+        async def user():
+            while time.monotonic() < deadline:
+                if rng.random() < write_ratio:
+                    kind = "write"
+                    row = '{"name":"load","category":"%s","original_price":10,"new_price":8}\n' % rng.choice(categories)
+                    request = client.post(
+                        "/products/bulk?format=ndjson", content=row, headers=auth,
+                    )
+                elif rng.random() < 0.5:
+                    kind = "read"
+                    request = client.get("/product", params={"category": rng.choice(categories), "limit": 20})
+                else:
+                    kind = "read"
+                    request = client.get(f"/product/{rng.choice(ids)}")
+                started = time.perf_counter()
+                try:
+                    response = await request
+                    code = response.status_code
+                except httpx.HTTPError as e:
+                    code = type(e).__name__
+                latencies[kind].append(time.perf_counter() - started)
+                statuses[code] = statuses.get(code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    total = sum(statuses.values())
+    errors = sum(count for code, count in statuses.items() if code not in (200, 304))
+    return {
+        "requests_per_second": round(total / elapsed, 1),
+        "error_rate": round(errors / max(total, 1), 4),
+        "statuses": {str(code): count for code, count in statuses.items()},
+        "read": summarize(latencies["read"]),
+        "write": summarize(latencies["write"]),
+    }
+
+
+async def run(args, workers: int, journal_mode: str) -> dict:
+    if args.db_url:
+        db_url, db_path = args.db_url, None
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="ecommerce-workers-db-"), "bench.sqlite3")
+        db_url = f"sqlite://{db_path}?journal_mode={journal_mode}"
+
+    app_dir = prepare_workers_app(db_url, args.response_cache)
+    if db_path is not None:
+        await init_db(db_path)
+        try:
+            await seed(users=args.businesses, products_per_business=args.products // args.businesses)
+        finally:
+            await close_db()
+    ids = list(range(1, args.products + 1))
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=app_dir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_until_up(base_url, server)
+        return await drive(base_url, ids, args.seconds, args.concurrency, args.write_ratio)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        remove_app(app_dir)
+        if db_path is not None:
+            shutil.rmtree(os.path.dirname(db_path), ignore_errors=True)
+
+
+async def main(args):
+    results = {
+        "products": args.products,
+        "concurrency": args.concurrency,
+        "write_ratio": args.write_ratio,
+        "cpus": os.cpu_count(),
+    }
+    journal_modes = ["server"] if args.db_url else args.journal_modes
+    for journal_mode in journal_modes:
+        for workers in args.workers:
+            results[f"{journal_mode.lower()}_workers_{workers}"] = await run(args, workers, journal_mode)
+    report(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--journal-modes", nargs="+", default=["DELETE", "WAL"])
+    parser.add_argument("--db-url", help="load test this database instead of a seeded sqlite file")
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--businesses", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--response-cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--verbose", action="store_true", help="show the server's log")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,202 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks are run from the ``ecommerce`` directory so the app modules import
+the same way they do under uvicorn, e.g. ``python -m benchmarks.bench_product_detail``.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import httpx
+from tortoise import Tortoise
+
+import migrate
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# settings for a scratch copy of the app, see prepare_app
+BENCH_ENV = {
+    "EMAIL": "bench@example.com",
+    "PASS": "x",
+    "SECRET": "bench-secret",
+    "GOOGLE_CLIENT_ID": "bench",
+    "GOOGLE_CLIENT_SECRET": "bench",
+    "GOOGLE_REDIRECT_URI": "http://localhost/auth/google",
+    # nothing listens there, the outbox just backs off
+    "MAIL_SERVER": "127.0.0.1",
+    "MAIL_PORT": "9",
+    "BCRYPT_ROUNDS": "4",
+}
+
+SQL_VERBS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+class QueryCounter(logging.Handler):
+    """Counts the statements tortoise logs on the ``tortoise.db_client`` logger."""
+
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.count = 0
+
+    def emit(self, record):
+        message = record.msg if isinstance(record.msg, str) else ""
+        if message == "%s: %s" and record.args:
+            message = str(record.args[0])
+        if message.lstrip().upper().startswith(SQL_VERBS):
+            self.count += 1
+
+
+@contextmanager
+def count_queries():
+    db_logger = logging.getLogger("tortoise.db_client")
+    counter = QueryCounter()
+    previous_level = db_logger.level
+    previous_propagate = db_logger.propagate
+    db_logger.setLevel(logging.DEBUG)
+    db_logger.propagate = False
+    db_logger.addHandler(counter)
+    try:
+        yield counter
+    finally:
+        db_logger.removeHandler(counter)
+        db_logger.setLevel(previous_level)
+        db_logger.propagate = previous_propagate
+
+
+async def init_db(path=None):
+    """Create a throwaway sqlite database and migrate it to the app schema."""
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="ecommerce-bench-"), "bench.sqlite3")
+    await Tortoise.init(db_url=f"sqlite://{path}", modules={"models": ["models"]})
+    await migrate.upgrade()
+    return path
+
+
+async def close_db():
+    await Tortoise.close_connections()
+
+
+async def seed(users=10, products_per_business=100, categories=("food", "wear", "home", "tech")):
+    """Insert ``users`` owners, one business each, and their products."""
+    from models import Business, Product, User
+
+    await User.bulk_create([
+        User(username=f"user{i}", email=f"user{i}@example.com", password="x", is_verified=True)
+        for i in range(users)
+    ])
+    owners = await User.all().order_by("id")
+    await Business.bulk_create([
+        Business(business_name=owner.username, owner_id=owner.id) for owner in owners
+    ])
+    businesses = await Business.all().order_by("id")
+
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    batch = []
+    for b, business in enumerate(businesses):
+        for i in range(products_per_business):
+            original = Decimal(100 + (i % 400))
+            new = original * Decimal(100 - (i * 7) % 60) / 100
+            batch.append(Product(
+                name=f"product {b}-{i}",
+                category=categories[i % len(categories)],
+                original_price=original,
+                new_price=new.quantize(Decimal("0.01")),
+                percentage_discount=int((original - new) / original * 100),
+                offer_expiration_date=(start + timedelta(days=i % 90)).date(),
+                date_published=start + timedelta(minutes=b * products_per_business + i),
+                business_id=business.id,
+            ))
+            if len(batch) >= 5000:
+                await Product.bulk_create(batch)
+                batch = []
+    if batch:
+        await Product.bulk_create(batch)
+    return businesses
+
+
+def prepare_app(env=None) -> str:
+    """Copy the app into a scratch directory with its own ``.env``; returns the copy's path.
+
+    The copy can be started with uvicorn or imported in a child process
+    without touching the checkout's database, uploads or settings.
+    """
+    directory = tempfile.mkdtemp(prefix="ecommerce-app-")
+    app_dir = os.path.join(directory, "app")
+    shutil.copytree(
+        APP_DIR, app_dir,
+        ignore=shutil.ignore_patterns("database.sqlite3*", "__pycache__", ".env"),
+    )
+    with open(os.path.join(app_dir, ".env"), "w") as out:
+        out.writelines(f"{name}={value}\n" for name, value in {**BENCH_ENV, **(env or {})}.items())
+    return app_dir
+
+
+def remove_app(app_dir: str) -> None:
+    shutil.rmtree(os.path.dirname(app_dir), ignore_errors=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_up(base_url: str, server: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not come up")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, queries=None, requests=None):
+    """Latency summary in milliseconds."""
+    ms = [value * 1000 for value in latencies]
+    summary = {
+        "requests": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+    }
+    if queries is not None:
+        summary["queries_per_request"] = round(queries / max(requests or len(ms), 1), 2)
+    return summary
+
+
+async def timed(coro_factory, iterations):
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await coro_factory()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(results):
+    print(json.dumps(results, indent=2))
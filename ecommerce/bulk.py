@@ -0,0 +1,203 @@
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Iterator, List, Optional, Tuple, Union
+
+from fastapi import HTTPException, Request, status
+from pydantic import BaseModel, Field, ValidationError
+from tortoise.transactions import in_transaction
+
+from business_stats import refresh_business_stats
+from catalog import catalog_queryset, product_page
+from deals import add_deals
+from migrate import dialect, sql
+from models import Business, Product
+from response_cache import response_cache
+from search import index_products
+from serialization import dumps, product_row
+
+BULK_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+SPOOL_SIZE = 8 * 1024 * 1024
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+EXPORT_FIELDS = [
+    "id", "name", "category", "original_price", "new_price", "percentage_discount",
+    "offer_expiration_date", "product_image", "date_published",
+]
+
+RESERVE_IDS_SQL = "SELECT nextval(pg_get_serial_sequence('product', 'id')) FROM generate_series(1, ?)"
+
+
+class ProductRow(BaseModel):
+    name: str = Field(min_length=1, max_length=100)
+    category: str = Field(min_length=1, max_length=30)
+    original_price: Decimal = Field(gt=0, max_digits=12, decimal_places=2)
+    new_price: Decimal = Field(ge=0, max_digits=12, decimal_places=2)
+    offer_expiration_date: Optional[date] = None
+    product_image: Optional[str] = Field(default=None, max_length=200)
+    date_published: Optional[datetime] = None
+
+
+def request_format(request: Request, format: Optional[str]) -> str:
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip()
+        format = next((name for name, mime in FORMATS.items() if mime == content_type), None)
+    if format not in FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Send the rows as {' or '.join(FORMATS.values())}"
+        )
+    return format
+
+
+async def spool_body(request: Request) -> tempfile.SpooledTemporaryFile:
+    """Copy the request body into a spooled file without holding it in memory."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def read_rows(spool, format: str) -> Iterator[Tuple[int, object]]:
+    """Yield (row number, raw row) pairs; a row that cannot be parsed yields the error."""
+    text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    if format == "csv":
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            # empty cells mean "use the default"
+            yield number, {key: value for key, value in row.items() if value not in ("", None)}
+        return
+
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, e
+
+
+def _row_error(number: int, error) -> dict:
+    if isinstance(error, ValidationError):
+        message = "; ".join(
+            f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()
+        )
+    else:
+        message = str(error)
+    return {"row": number, "error": message}
+
+
+def build_products(rows: List[ProductRow], business: Business, ids: Optional[List[int]] = None) -> List[Product]:
+    """Turn validated rows into unsaved products, discounts computed for the whole chunk."""
+    discounts = [
+        int((row.original_price - row.new_price) / row.original_price * 100) for row in rows
+    ]
+    products = []
+    for i, (row, discount) in enumerate(zip(rows, discounts)):
+        values = row.model_dump(exclude_none=True)
+        if ids is not None:
+            values["id"] = ids[i]
+        products.append(Product(**values, percentage_discount=discount, business_id=business.id))
+    return products
+
+
+async def insert_products(rows: List[ProductRow], business: Business, connection) -> List[int]:
+    """Insert the rows in the transaction of ``connection``, returns the ids they got."""
+    if dialect(connection) == "postgres":
+        # ids of concurrent transactions interleave in the sequence, so the
+        # chunk takes its ids first and inserts the rows with them
+        _, reserved = await connection.execute_query(sql(connection, RESERVE_IDS_SQL), [len(rows)])
+        ids = [row[0] for row in reserved]
+        await Product.bulk_create(build_products(rows, business, ids), using_db=connection)
+        return ids
+
+    # write first: a sqlite transaction that reads before writing cannot wait
+    # for the lock of a writer in another worker and fails at once
+    await Product.bulk_create(build_products(rows, business), using_db=connection)
+    # from its first write the transaction holds the database lock, so the
+    # rows are the newest ids and nobody else inserted in between
+    last_id = await Product.all().using_db(connection).order_by("-id").first().values_list("id", flat=True)
+    return list(range(last_id - len(rows) + 1, last_id + 1))
+
+
+async def import_products(spool, format: str, business: Business, chunk_size: int = BULK_CHUNK_SIZE) -> dict:
+    """Validate rows as they are read and insert them in chunked transactions."""
+    received = created = 0
+    errors: List[dict] = []
+    error_count = 0
+    chunk: List[ProductRow] = []
+
+    async def flush():
+        nonlocal created
+        if not chunk:
+            return
+        async with in_transaction() as connection:
+            ids = await insert_products(chunk, business, connection)
+            # bulk_create fires no signals, index the new rows here
+            await index_products(ids, connection)
+            await add_deals(ids, connection)
+            await refresh_business_stats(business.id, connection)
+        response_cache.invalidate(
+            "catalog", f"storefront:{business.id}", *{f"category:{row.category}" for row in chunk}
+        )
+        created += len(chunk)
+        chunk.clear()
+
+    for number, raw in read_rows(spool, format):
+        received += 1
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            if not isinstance(raw, dict):
+                raise ValueError("Expected a JSON object")
+            chunk.append(ProductRow.model_validate(raw))
+        except (ValidationError, ValueError) as e:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(_row_error(number, e))
+            continue
+
+        if len(chunk) >= chunk_size:
+            await flush()
+    await flush()
+
+    return {
+        "received": received,
+        "created": created,
+        "failed": error_count,
+        "errors": errors,
+    }
+
+
+def _csv_line(values: list) -> str:
+    out = io.StringIO()
+    csv.writer(out).writerow(
+        [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    )
+    return out.getvalue()
+
+
+async def export_products(business: Business, format: str) -> AsyncIterator[Union[str, bytes]]:
+    """Stream every product of a business as CSV or NDJSON, one keyset page at a time."""
+    queryset = catalog_queryset().filter(business_id=business.id)
+    if format == "csv":
+        yield _csv_line(EXPORT_FIELDS)
+
+    cursor = None
+    while True:
+        products, cursor = await product_page(queryset, cursor=cursor, limit=BULK_CHUNK_SIZE)
+        if format == "csv":
+            yield "".join(
+                _csv_line([getattr(product, field) for field in EXPORT_FIELDS]) for product in products
+            )
+        else:
+            yield b"".join(dumps(product_row(product)) + b"\n" for product in products)
+        if cursor is None:
+            break
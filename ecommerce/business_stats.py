@@ -0,0 +1,306 @@
+"""Per-business product statistics behind /business/{id}/stats.
+
+A dashboard read is a single lookup of the business's row in
+``businessstats``. Product writes keep the row current through signals by
+applying the product's own values as a delta: its count, discount sum,
+price extremes and category count. Each delta is one statement on one row,
+whatever the size of the catalog. An update takes the old values out and
+puts the new ones in.
+
+Running extremes can grow but not shrink. A delete or an update that takes
+away the business's current minimum or maximum falls back to
+``refresh_business_stats``, which recomputes the row with one aggregate
+upsert over the business's products, found through the business_id index.
+Bulk imports and repricing recompute once per chunk. A recompute is
+idempotent, so it also evens out a delta lost to two concurrent updates of
+one product.
+"""
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import HTTPException, status
+from tortoise import BaseDBAsyncClient, connections
+
+from database import read_db
+from migrate import dialect, sql
+from models import Business, BusinessStats, Product
+
+# a save touching only other fields, e.g. the image, leaves the stats alone
+STATS_FIELDS = {"category", "original_price", "new_price", "percentage_discount", "business_id"}
+
+# per category first, then per business; the business join keeps a business
+# without products in the result so its row is reset instead of left stale
+REFRESH_SQL = """
+INSERT INTO "businessstats" (
+    "business_id", "product_count", "discount_sum", "avg_discount", "max_discount", "min_price", "max_price",
+    "min_original_price", "max_original_price", "category_counts", "updated_at"
+)
+SELECT
+    b."id",
+    coalesce(sum(c."products"), 0),
+    coalesce(sum(c."discount_sum"), 0),
+    coalesce(sum(c."discount_sum") * 1.0 / sum(c."products"), 0),
+    max(c."max_discount"),
+    min(c."min_price"), max(c."max_price"), min(c."min_original_price"), max(c."max_original_price"),
+    coalesce({object_agg}(c."category", c."products") FILTER (WHERE c."category" IS NOT NULL), {empty_object}),
+    CURRENT_TIMESTAMP
+FROM "business" b
+LEFT JOIN (
+    SELECT
+        "business_id", "category", count(*) AS "products",
+        sum("percentage_discount") AS "discount_sum", max("percentage_discount") AS "max_discount",
+        min({new_price}) AS "min_price", max({new_price}) AS "max_price",
+        min({original_price}) AS "min_original_price", max({original_price}) AS "max_original_price"
+    FROM "product"
+    WHERE "business_id" = ?
+    GROUP BY "business_id", "category"
+) c ON c."business_id" = b."id"
+WHERE b."id" = ?
+GROUP BY b."id"
+ON CONFLICT ("business_id") DO UPDATE SET
+    "product_count" = excluded."product_count",
+    "discount_sum" = excluded."discount_sum",
+    "avg_discount" = excluded."avg_discount",
+    "max_discount" = excluded."max_discount",
+    "min_price" = excluded."min_price",
+    "max_price" = excluded."max_price",
+    "min_original_price" = excluded."min_original_price",
+    "max_original_price" = excluded."max_original_price",
+    "category_counts" = excluded."category_counts",
+    "updated_at" = excluded."updated_at"
+"""
+
+# one product more; a business without a row gets one holding just this product
+ADD_SQL = """
+INSERT INTO "businessstats" (
+    "business_id", "product_count", "discount_sum", "avg_discount", "max_discount", "min_price", "max_price",
+    "min_original_price", "max_original_price", "category_counts", "updated_at"
+)
+VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?, {one_category}, CURRENT_TIMESTAMP)
+ON CONFLICT ("business_id") DO UPDATE SET
+    "product_count" = "businessstats"."product_count" + 1,
+    "discount_sum" = "businessstats"."discount_sum" + ?,
+    "avg_discount" = ("businessstats"."discount_sum" + ?) * 1.0 / ("businessstats"."product_count" + 1),
+    "max_discount" = {greatest}(coalesce("businessstats"."max_discount", ?), ?),
+    "min_price" = {least}(coalesce({stats_min_price}, ?), ?),
+    "max_price" = {greatest}(coalesce({stats_max_price}, ?), ?),
+    "min_original_price" = {least}(coalesce({stats_min_original_price}, ?), ?),
+    "max_original_price" = {greatest}(coalesce({stats_max_original_price}, ?), ?),
+    "category_counts" = {add_category},
+    "updated_at" = CURRENT_TIMESTAMP
+"""
+
+# one product less, only while none of the extremes is its value: the row is
+# left alone when the product held one, unless its replacement (NULL for a
+# delete) holds it still
+REMOVE_SQL = """
+UPDATE "businessstats" SET
+    "product_count" = "product_count" - 1,
+    "discount_sum" = "discount_sum" - ?,
+    "avg_discount" = CASE WHEN "product_count" > 1 THEN ("discount_sum" - ?) * 1.0 / ("product_count" - 1) ELSE 0 END,
+    "category_counts" = {remove_category},
+    "updated_at" = CURRENT_TIMESTAMP
+WHERE "business_id" = ? AND "product_count" > 1
+    AND ("max_discount" > ? OR "max_discount" <= ?)
+    AND ({stats_min_price} < ? OR {stats_min_price} >= ?)
+    AND ({stats_max_price} > ? OR {stats_max_price} <= ?)
+    AND ({stats_min_original_price} < ? OR {stats_min_original_price} >= ?)
+    AND ({stats_max_original_price} > ? OR {stats_max_original_price} <= ?)
+"""
+
+# prices are stored as text on sqlite, so they are compared as numbers; the
+# category fragments take the category as their every parameter
+DIALECT_SQL = {
+    "sqlite": {
+        "object_agg": "json_group_object",
+        "empty_object": "'{}'",
+        "new_price": 'CAST("new_price" AS REAL)',
+        "original_price": 'CAST("original_price" AS REAL)',
+        "stats_min_price": 'CAST("businessstats"."min_price" AS REAL)',
+        "stats_max_price": 'CAST("businessstats"."max_price" AS REAL)',
+        "stats_min_original_price": 'CAST("businessstats"."min_original_price" AS REAL)',
+        "stats_max_original_price": 'CAST("businessstats"."max_original_price" AS REAL)',
+        "least": "min",
+        "greatest": "max",
+        "one_category": "json_object(?, 1)",
+        "add_category": (
+            "json_set(\"businessstats\".\"category_counts\", '$.' || json_quote(?), "
+            "coalesce(json_extract(\"businessstats\".\"category_counts\", '$.' || json_quote(?)), 0) + 1)"
+        ),
+        "remove_category": (
+            "CASE WHEN coalesce(json_extract(\"category_counts\", '$.' || json_quote(?)), 0) <= 1 "
+            "THEN json_remove(\"category_counts\", '$.' || json_quote(?)) "
+            "ELSE json_set(\"category_counts\", '$.' || json_quote(?), "
+            "json_extract(\"category_counts\", '$.' || json_quote(?)) - 1) END"
+        ),
+        "price": float,
+    },
+    "postgres": {
+        "object_agg": "jsonb_object_agg",
+        "empty_object": "'{}'::jsonb",
+        "new_price": '"new_price"',
+        "original_price": '"original_price"',
+        "stats_min_price": '"businessstats"."min_price"',
+        "stats_max_price": '"businessstats"."max_price"',
+        "stats_min_original_price": '"businessstats"."min_original_price"',
+        "stats_max_original_price": '"businessstats"."max_original_price"',
+        "least": "LEAST",
+        "greatest": "GREATEST",
+        "one_category": "jsonb_build_object(?::text, 1)",
+        "add_category": (
+            "jsonb_set(\"businessstats\".\"category_counts\", ARRAY[?::text], "
+            "to_jsonb(coalesce((\"businessstats\".\"category_counts\" ->> ?::text)::int, 0) + 1))"
+        ),
+        "remove_category": (
+            "CASE WHEN coalesce((\"category_counts\" ->> ?::text)::int, 0) <= 1 "
+            "THEN \"category_counts\" - ?::text "
+            "ELSE jsonb_set(\"category_counts\", ARRAY[?::text], "
+            "to_jsonb((\"category_counts\" ->> ?::text)::int - 1)) END"
+        ),
+        "price": Decimal,
+    },
+}
+
+
+def _connection(using_db: Optional[BaseDBAsyncClient] = None) -> BaseDBAsyncClient:
+    return using_db or connections.get("default")
+
+
+def _dialect_sql(connection: BaseDBAsyncClient) -> dict:
+    return DIALECT_SQL.get(dialect(connection), DIALECT_SQL["sqlite"])
+
+
+def refresh_sql(connection: BaseDBAsyncClient) -> str:
+    return sql(connection, REFRESH_SQL.format(**_dialect_sql(connection)))
+
+
+async def refresh_business_stats(business_id: int, using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    connection = _connection(using_db)
+    await connection.execute_query(refresh_sql(connection), [business_id, business_id])
+
+
+def stats_values(product: Product) -> dict:
+    """The values of a product that the stats are made of."""
+    return {
+        "business_id": product.business_id,
+        "category": product.category,
+        "new_price": Decimal(str(product.new_price)),
+        "original_price": Decimal(str(product.original_price)),
+        "percentage_discount": product.percentage_discount,
+    }
+
+
+async def stored_stats_values(product_id: int, using_db: Optional[BaseDBAsyncClient] = None) -> Optional[dict]:
+    """``stats_values`` of the product as it is in the database, before a save changes it."""
+    rows = await Product.filter(id=product_id).using_db(_connection(using_db)).values(
+        "business_id", "category", "new_price", "original_price", "percentage_discount"
+    )
+    if not rows:
+        return None
+    values = rows[0]
+    return {**values, "new_price": Decimal(str(values["new_price"])), "original_price": Decimal(str(values["original_price"]))}
+
+
+async def add_product_stats(values: dict, using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    connection = _connection(using_db)
+    dialect_sql = _dialect_sql(connection)
+    price = dialect_sql["price"]
+    discount, category = values["percentage_discount"], values["category"]
+    new_price, original_price = price(values["new_price"]), price(values["original_price"])
+    await connection.execute_query(
+        sql(connection, ADD_SQL.format(**dialect_sql)),
+        [
+            values["business_id"], discount, discount, discount, new_price, new_price,
+            original_price, original_price, category,
+            discount, discount,
+            discount, discount,
+            new_price, new_price, new_price, new_price,
+            original_price, original_price, original_price, original_price,
+            category, category,
+        ],
+    )
+
+
+async def remove_product_stats(
+    values: dict,
+    using_db: Optional[BaseDBAsyncClient] = None,
+    replacement: Optional[dict] = None,
+) -> bool:
+    """Take a product out of its business's stats; False when that needed a recompute.
+
+    ``replacement`` are the values an update puts in its place, which keep
+    an extreme the product held when they are at least as extreme.
+    """
+    connection = _connection(using_db)
+    dialect_sql = _dialect_sql(connection)
+    price = dialect_sql["price"]
+    discount, category = values["percentage_discount"], values["category"]
+    new_price, original_price = price(values["new_price"]), price(values["original_price"])
+    # NULL fails the comparisons, so a delete keeps no extreme
+    next_discount = next_price = next_original_price = None
+    if replacement is not None:
+        next_discount = replacement["percentage_discount"]
+        next_price, next_original_price = price(replacement["new_price"]), price(replacement["original_price"])
+    updated, _ = await connection.execute_query(
+        sql(connection, REMOVE_SQL.format(**dialect_sql)),
+        [
+            discount, discount,
+            category, category, category, category,
+            values["business_id"],
+            discount, next_discount,
+            new_price, next_price,
+            new_price, next_price,
+            original_price, next_original_price,
+            original_price, next_original_price,
+        ],
+    )
+    if not updated:
+        await refresh_business_stats(values["business_id"], connection)
+        return False
+    return True
+
+
+async def update_product_stats(before: dict, after: dict, using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    if before == after:
+        return
+    if before["business_id"] != after["business_id"]:
+        await remove_product_stats(before, using_db)
+        await add_product_stats(after, using_db)
+    # a recompute already counted the new values
+    elif await remove_product_stats(before, using_db, replacement=after):
+        await add_product_stats(after, using_db)
+
+
+def stats_row(business_id: int, stats: Optional[BusinessStats]) -> dict:
+    if stats is None:
+        # a business that has never had a product
+        return {
+            "business_id": business_id,
+            "product_count": 0,
+            "average_discount": 0.0,
+            "max_discount": None,
+            "price": {"min": None, "max": None},
+            "original_price": {"min": None, "max": None},
+            "categories": {},
+            "updated_at": None,
+        }
+    return {
+        "business_id": business_id,
+        "product_count": stats.product_count,
+        "average_discount": round(stats.avg_discount, 2),
+        "max_discount": stats.max_discount,
+        "price": {"min": stats.min_price, "max": stats.max_price},
+        "original_price": {"min": stats.min_original_price, "max": stats.max_original_price},
+        "categories": stats.category_counts,
+        "updated_at": stats.updated_at,
+    }
+
+
+async def get_business_stats(business_id: int) -> dict:
+    stats = await BusinessStats.get_or_none(business_id=business_id, using_db=read_db())
+    if stats is None and not await Business.filter(id=business_id).using_db(read_db()).exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Business does not exist"
+        )
+    return stats_row(business_id, stats)
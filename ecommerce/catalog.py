@@ -0,0 +1,174 @@
+import base64
+import json
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from tortoise.expressions import Q, RawSQL
+from tortoise.queryset import QuerySet
+
+from database import read_db
+from images import resolve_image
+from models import Product
+from serialization import dumps, product_row
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK_SIZE = 500
+
+# prices are stored as text on sqlite, so sort on a numeric cast of the column;
+# migration 0009 indexes this exact expression, keep the two in step
+PRICE_SORT = RawSQL('CAST("new_price" AS DOUBLE PRECISION)')
+
+# sort name -> (column to order on, descending)
+SORT_FIELDS = {
+    "newest": ("date_published", True),
+    "price": ("new_price", False),
+    "-price": ("new_price", True),
+    "discount": ("percentage_discount", False),
+    "-discount": ("percentage_discount", True),
+}
+
+
+def encode_cursor(value, id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif value is not None and not isinstance(value, (int, float)):
+        value = str(value)
+    raw = json.dumps([value, id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[object, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, id = json.loads(raw)
+        column = SORT_FIELDS[sort][0]
+        if column == "date_published":
+            value = datetime.fromisoformat(value)
+        elif column == "new_price":
+            value = float(value)
+        else:
+            value = int(value)
+        return value, int(id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def catalog_queryset(
+    sort: str = "newest",
+    category: Optional[str] = None,
+    name: Optional[str] = None,
+    business_id: Optional[int] = None,
+) -> QuerySet:
+    if sort not in SORT_FIELDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown sort '{sort}', expected one of {', '.join(SORT_FIELDS)}"
+        )
+
+    #catalog reads never write, so they can be served by the replica
+    queryset = Product.all().using_db(read_db())
+    if category is not None:
+        queryset = queryset.filter(category=category)
+    if name is not None:
+        queryset = queryset.filter(name=name)
+    if business_id is not None:
+        queryset = queryset.filter(business_id=business_id)
+    return queryset
+
+
+def _sort_key(sort: str) -> Tuple[str, bool]:
+    column, descending = SORT_FIELDS[sort]
+    # the price cast is exposed as an annotation so it can be filtered and ordered on
+    return ("sort_price" if column == "new_price" else column), descending
+
+
+def _page_queryset(queryset: QuerySet, sort: str, after: Optional[Tuple[object, int]], limit: int) -> QuerySet:
+    key, descending = _sort_key(sort)
+    if key == "sort_price":
+        queryset = queryset.annotate(sort_price=PRICE_SORT)
+
+    if after is not None:
+        value, last_id = after
+        op = "lt" if descending else "gt"
+        queryset = queryset.filter(
+            Q(**{f"{key}__{op}": value}) | Q(**{key: value, f"id__{op}": last_id})
+        )
+
+    prefix = "-" if descending else ""
+    return queryset.order_by(f"{prefix}{key}", f"{prefix}id").limit(limit)
+
+
+def _cursor_for(product: Product, sort: str) -> str:
+    key, _ = _sort_key(sort)
+    value = getattr(product, key)
+    return encode_cursor(value, product.id)
+
+
+async def product_page(
+    queryset: QuerySet,
+    sort: str = "newest",
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> Tuple[List[Product], Optional[str]]:
+    """Fetch one keyset page of products and the cursor for the next one."""
+    after = decode_cursor(cursor, sort) if cursor else None
+
+    # fetch one extra row to know whether another page exists
+    rows = await _page_queryset(queryset, sort, after, limit + 1)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _cursor_for(rows[-1], sort)
+    return rows, next_cursor
+
+
+async def stream_products(
+    queryset: QuerySet,
+    sort: str = "newest",
+    cursor: Optional[str] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> AsyncIterator[bytes]:
+    """Yield every matching product as one NDJSON line, walking the keyset page by page."""
+    while True:
+        rows, cursor = await product_page(queryset, sort, cursor, chunk_size)
+        if rows:
+            yield b"".join(dumps(product_row(row)) + b"\n" for row in rows)
+        if cursor is None:
+            break
+
+
+async def get_product_detail(id: int) -> Product:
+    """Load a product with its business and owner joined in a single query."""
+    product = await Product.filter(id=id).using_db(read_db()).select_related("business__owner").first()
+    if product is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product does not exist"
+        )
+    return product
+
+
+def product_detail_response(product: Product, image_size: Optional[int] = None, accept: Optional[str] = None) -> dict:
+    business = product.business
+    owner = business.owner
+    product.product_image = resolve_image(product.product_image, image_size, accept)
+    return {
+        "product_details": product_row(product),
+        "business_details": {
+            "name": business.business_name,
+            "city": business.city,
+            "region": business.region,
+            "description": business.business_description,
+            "logo": resolve_image(business.logo, image_size, accept),
+            "owner_id": owner.id,
+            "email": owner.email,
+            "join_date": owner.join_date.strftime("%b %d %Y"),
+        },
+    }
@@ -0,0 +1,27 @@
+import os
+from dotenv import dotenv_values
+
+
+# settings come from .env and can be overridden through the process environment
+config_values = dotenv_values(".env")
+
+
+def get_setting(name: str, default=None):
+    return os.environ.get(name, config_values.get(name, default))
+
+
+def get_int(name: str, default: int) -> int:
+    value = get_setting(name)
+    return default if value in (None, "") else int(value)
+
+
+def get_float(name: str, default: float) -> float:
+    value = get_setting(name)
+    return default if value in (None, "") else float(value)
+
+
+def get_bool(name: str, default: bool) -> bool:
+    value = get_setting(name)
+    if value in (None, ""):
+        return default
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,68 @@
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from tortoise import BaseDBAsyncClient, connections
+
+from config import get_bool, get_int, get_setting
+
+DB_URL = get_setting("DB_URL", "sqlite://database.sqlite3")
+# an optional replica for read-only handlers, writes always go to DB_URL
+DB_READ_URL = get_setting("DB_READ_URL")
+DB_POOL_MIN = get_int("DB_POOL_MIN", 1)
+DB_POOL_MAX = get_int("DB_POOL_MAX", 10)
+# the schema is owned by the migrations (python -m migrate upgrade), not by app startup
+DB_GENERATE_SCHEMAS = get_bool("DB_GENERATE_SCHEMAS", False)
+
+# WAL lets readers run alongside the single writer, NORMAL sync is safe under WAL,
+# and busy_timeout makes writers from other workers wait instead of failing
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -16000,
+    "temp_store": "MEMORY",
+    "mmap_size": 128 * 1024 * 1024,
+}
+
+WRITE_CONNECTION = "default"
+READ_CONNECTION = "replica" if DB_READ_URL else WRITE_CONNECTION
+
+
+def with_params(url: str, defaults: Dict[str, object]) -> str:
+    """Add ``defaults`` to the url's query string; parameters already in the url win."""
+    # split by hand, urllib drops the empty host of sqlite:///absolute/paths
+    base, _, query = url.partition("?")
+    params = dict(parse_qsl(query))
+    for name, value in defaults.items():
+        params.setdefault(name, str(value))
+    return base + "?" + urlencode(params)
+
+
+def connection_url(url: str) -> str:
+    """Tune a configured url: sqlite gets the pragmas above, servers get the pool size."""
+    if url.startswith("sqlite"):
+        return with_params(url, SQLITE_PRAGMAS)
+    return with_params(url, {"minsize": DB_POOL_MIN, "maxsize": DB_POOL_MAX})
+
+
+def tortoise_config(url: str = DB_URL, read_url: Optional[str] = DB_READ_URL) -> dict:
+    db_connections = {WRITE_CONNECTION: connection_url(url)}
+    if read_url:
+        db_connections["replica"] = connection_url(read_url)
+    return {
+        "connections": db_connections,
+        "apps": {
+            "models": {
+                "models": ["models"],
+                "default_connection": WRITE_CONNECTION,
+            },
+        },
+    }
+
+
+TORTOISE_ORM = tortoise_config()
+
+
+def read_db() -> BaseDBAsyncClient:
+    """The connection read-only handlers query; the primary when no replica is configured."""
+    return connections.get(READ_CONNECTION)
@@ -0,0 +1,202 @@
+"""Active deals: products whose offer has not expired, best discount first.
+
+``activedeal`` holds one row per product with a running offer, copying the
+columns the listing filters and sorts on. The (category, discount, product)
+and (discount, product) indexes give a page of ``/deals`` in a single index
+range read, however many products, expired ones included, the catalog has.
+
+Product saves and deletes keep the table in step through signals, bulk
+imports once per chunk. ``DealSweeper`` deletes rows whose offer has run out
+in small batches, so expired offers do not pile up in the index. Reads
+still filter on the expiration date, which hides rows that expired since
+the last sweep.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import List, Optional, Tuple
+
+from tortoise import BaseDBAsyncClient, connections
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
+
+from catalog import decode_cursor, encode_cursor
+from config import get_float, get_int
+from database import read_db
+from migrate import sql
+from models import ActiveDeal, Product
+from response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# a save touching only other fields, e.g. the image, leaves the deal alone
+DEAL_FIELDS = {"category", "percentage_discount", "offer_expiration_date"}
+
+DEAL_SELECT = """
+INSERT INTO "activedeal" ("product_id", "category", "percentage_discount", "offer_expiration_date")
+SELECT "id", "category", "percentage_discount", "offer_expiration_date" FROM "product"
+WHERE "offer_expiration_date" >= ?
+"""
+
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _connection(using_db: Optional[BaseDBAsyncClient] = None) -> BaseDBAsyncClient:
+    return using_db or connections.get("default")
+
+
+# the deal of a product whose offer is running, written over the one it has
+UPSERT_DEAL = DEAL_SELECT + """ AND "id" = ?
+ON CONFLICT ("product_id") DO UPDATE SET
+    "category" = excluded."category",
+    "percentage_discount" = excluded."percentage_discount",
+    "offer_expiration_date" = excluded."offer_expiration_date"
+"""
+
+# the deal of a product whose offer is not running, or that is gone
+DROP_ENDED_DEAL = """
+DELETE FROM "activedeal" WHERE "product_id" = ? AND NOT EXISTS (
+    SELECT 1 FROM "product" WHERE "id" = ? AND "offer_expiration_date" >= ?
+)
+"""
+
+
+async def sync_deal(product_id: int, using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    """Copy a product's offer into the deals table, or drop it when it has expired.
+
+    Each statement reads the product as it is when it runs, so concurrent
+    saves of one product converge on its last offer instead of racing a
+    delete and an insert into the unique product_id.
+    """
+    connection = _connection(using_db)
+    day = today()
+    await connection.execute_query(sql(connection, UPSERT_DEAL), [day, product_id])
+    await connection.execute_query(sql(connection, DROP_ENDED_DEAL), [product_id, product_id, day])
+
+
+async def remove_deal(product_id: int, using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    connection = _connection(using_db)
+    await connection.execute_query(sql(connection, 'DELETE FROM "activedeal" WHERE "product_id" = ?'), [product_id])
+
+
+async def update_deal_discounts(
+    product_ids: List[int], discounts: List[int], using_db: Optional[BaseDBAsyncClient] = None
+) -> None:
+    """Carry new discounts of products whose offer is otherwise unchanged, e.g. after repricing."""
+    connection = _connection(using_db)
+    await connection.execute_many(
+        sql(connection, 'UPDATE "activedeal" SET "percentage_discount" = ? WHERE "product_id" = ?'),
+        [[discount, product_id] for product_id, discount in zip(product_ids, discounts)],
+    )
+
+
+async def add_deals(product_ids: List[int], using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    """Add the running offers of newly inserted products (bulk inserts skip signals)."""
+    if not product_ids:
+        return
+    connection = _connection(using_db)
+    placeholders = ", ".join("?" * len(product_ids))
+    await connection.execute_query(
+        sql(connection, DEAL_SELECT + f' AND "id" IN ({placeholders})'), [today(), *product_ids]
+    )
+
+
+async def rebuild_deals(using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    """Refill the table from the products, e.g. after rows were written without going through the app.
+
+    Run it with ``python -m migrate repair``.
+    """
+    connection = _connection(using_db)
+    async with in_transaction(connection.connection_name) as transaction:
+        await transaction.execute_query('DELETE FROM "activedeal"')
+        await transaction.execute_query(sql(transaction, DEAL_SELECT), [today()])
+
+
+async def deals_page(
+    category: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> Tuple[List[Product], Optional[str]]:
+    """One keyset page of running offers, highest discount first, and the cursor for the next one."""
+    queryset = ActiveDeal.filter(offer_expiration_date__gte=today()).using_db(read_db())
+    if category is not None:
+        queryset = queryset.filter(category=category)
+    if cursor:
+        discount, last_id = decode_cursor(cursor, "-discount")
+        queryset = queryset.filter(
+            Q(percentage_discount__lt=discount) | Q(percentage_discount=discount, product_id__lt=last_id)
+        )
+
+    # one extra row tells whether another page exists
+    deals = await queryset.order_by("-percentage_discount", "-product_id").limit(limit + 1).select_related("product")
+
+    next_cursor = None
+    if len(deals) > limit:
+        deals = deals[:limit]
+        next_cursor = encode_cursor(deals[-1].percentage_discount, deals[-1].product_id)
+    return [deal.product for deal in deals], next_cursor
+
+
+class DealSweeper:
+    """Deletes expired deals every ``interval`` seconds, ``batch_size`` rows at a time.
+
+    Small batches keep each write transaction short, so requests waiting on
+    the database are not held up behind one large delete. Every worker may
+    run a sweeper; deleting an already deleted row does nothing.
+    """
+
+    def __init__(self, interval: float = 600.0, batch_size: int = 1000):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.swept = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def sweep(self, using_db: Optional[BaseDBAsyncClient] = None) -> int:
+        """Delete every expired deal, returns how many there were."""
+        removed = 0
+        while True:
+            expired = await ActiveDeal.filter(offer_expiration_date__lt=today()).using_db(using_db).limit(
+                self.batch_size
+            ).values_list("id", flat=True)
+            if expired:
+                removed += await ActiveDeal.filter(id__in=expired).using_db(using_db).delete()
+            if len(expired) < self.batch_size:
+                break
+            # let requests in between batches
+            await asyncio.sleep(0)
+        if removed:
+            self.swept += removed
+            response_cache.invalidate("deals")
+            logger.info(f"Retired {removed} expired deal(s)")
+        return removed
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Deal sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+deal_sweeper = DealSweeper(
+    interval=get_float("DEALS_SWEEP_INTERVAL", 600.0),
+    batch_size=get_int("DEALS_SWEEP_BATCH", 1000),
+)
@@ -1,130 +1,318 @@
-from typing import List
-from fastapi import BackgroundTasks, HTTPException, status
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema
-from pydantic import BaseModel, EmailStr
-from dotenv import dotenv_values
-from models import User
-import jwt
+import asyncio
+from datetime import timedelta
+from email.message import EmailMessage
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from jinja2 import Environment, FileSystemLoader, Template, TemplatesNotFound, select_autoescape
+from tortoise import BaseDBAsyncClient, timezone
+from tortoise.exceptions import IntegrityError
+from models import EmailOutbox, User
+from config import get_bool, get_float, get_int, get_setting
+from tokens import create_verification_token
+import aiosmtplib
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-config_details = dotenv_values(".env")
-
 # Validate required environment variables
 required_configs = ["EMAIL", "PASS", "SECRET"]
 for config in required_configs:
-    if config not in config_details:
+    if get_setting(config) is None:
         raise ValueError(f"Missing required environment variable: {config}")
 
 # Email configuration
-conf = ConnectionConfig(
-    MAIL_USERNAME=config_details["EMAIL"],
-    MAIL_PASSWORD=config_details["PASS"],
-    MAIL_FROM=config_details["EMAIL"],
-    MAIL_PORT=587,
-    MAIL_SERVER="smtp.gmail.com",
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
+MAIL_USERNAME = get_setting("EMAIL")
+MAIL_PASSWORD = get_setting("PASS")
+MAIL_FROM = MAIL_USERNAME
+MAIL_PORT = get_int("MAIL_PORT", 587)
+MAIL_SERVER = get_setting("MAIL_SERVER", "smtp.gmail.com")
+MAIL_STARTTLS = get_bool("MAIL_STARTTLS", True)
+MAIL_SSL_TLS = get_bool("MAIL_SSL_TLS", False)
+MAIL_USE_CREDENTIALS = get_bool("MAIL_USE_CREDENTIALS", True)
+MAIL_VALIDATE_CERTS = get_bool("MAIL_VALIDATE_CERTS", True)
+MAIL_TIMEOUT = get_float("MAIL_TIMEOUT", 30.0)
+
+# email bodies are jinja templates under templates/email, optionally overridden
+# per locale in templates/email/<locale>/
+email_env = Environment(
+    loader=FileSystemLoader("templates"),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+    cache_size=-1,
 )
+DEFAULT_LOCALE = get_setting("MAIL_DEFAULT_LOCALE", "en")
+
+
+@lru_cache(maxsize=None)
+def get_email_templates(name: str, locale: str) -> Tuple[Template, Optional[Template]]:
+    """Compiled (html, text) templates for ``name``, the text part is optional."""
+    def select(extension: str) -> Optional[Template]:
+        candidates = [f"email/{name}.{extension}"]
+        if locale != DEFAULT_LOCALE:
+            candidates.insert(0, f"email/{locale}/{name}.{extension}")
+        try:
+            return email_env.select_template(candidates)
+        except TemplatesNotFound:
+            return None
+
+    html = select("html")
+    if html is None:
+        raise ValueError(f"No email template named {name}")
+    return html, select("txt")
+
+
+def load_email_templates() -> None:
+    """Compile every email template up front so the first send pays nothing."""
+    for template_name in email_env.list_templates(extensions=["html", "txt"]):
+        if template_name.startswith("email/"):
+            email_env.get_template(template_name)
+    get_email_templates("verification", DEFAULT_LOCALE)
+
+
+def render_email(name: str, context: dict, locale: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """Render the (html, text) bodies of an email from the templates compiled for its locale."""
+    html, text = get_email_templates(name, locale or DEFAULT_LOCALE)
+    return html.render(context), text.render(context) if text is not None else None
+
+
+def get_verification_url(instance: User) -> str:
+    #typed and valid for 24 hours, it cannot be used as an access token
+    token = create_verification_token(instance)
+    return f"http://localhost:8000/verification/?token={token}"
 
-class EmailSchema(BaseModel):
-    email: List[EmailStr]
-
-def get_verification_template(username: str, verification_url: str) -> str:
-    return f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                line-height: 1.6;
-                color: #333;
-            }}
-            .container {{
-                max-width: 600px;
-                margin: 0 auto;
-                padding: 20px;
-                background-color: #f9f9f9;
-                border-radius: 5px;
-            }}
-            .button {{
-                display: inline-block;
-                padding: 10px 20px;
-                background-color: #007bff;
-                color: white;
-                text-decoration: none;
-                border-radius: 5px;
-                margin: 20px 0;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h3>Account Verification</h3>
-            <p>Hello {username},</p>
-            <p>Thanks for choosing EasyShopas. Please click on the link below to verify your account:</p>
-            <a href="{verification_url}" class="button">Verify your email</a>
-            <p>Or copy and paste this link in your browser:</p>
-            <p>{verification_url}</p>
-            <p>This link will expire in 24 hours.</p>
-            <p>Please ignore this email if you did not create an account with us.</p>
-        </div>
-    </body>
-    </html>
-    """
 
-async def send_email(email_list: List, instance: User):
+VERIFICATION_SUBJECT = "EasyShopas Account Verification Email"
+
+
+async def enqueue_verification_email(instance: User, using_db: Optional[BaseDBAsyncClient] = None) -> bool:
+    """Queue the verification email for the outbox worker.
+
+    Returns False when one is already queued (or sent) for this user.
+    """
     try:
-        logger.info(f"Preparing to send email to: {email_list}")
-        
-        # Generate token
-        token_data = {
-            "id": str(instance.id),  # Convert UUID to string if needed
-            "username": instance.username
-        }
-        
-        logger.debug("Generating verification token")
-        token = jwt.encode(token_data, config_details["SECRET"], algorithm="HS256")
-        
-        # Create verification URL
-        verification_url = f"http://localhost:8000/verification/?token={token}"
-        
-        # Get email template
-        template = get_verification_template(instance.username, verification_url)
-        
-        # Create message
-        message = MessageSchema(
-            subject="EasyShopas Account Verification Email",
-            recipients=email_list,
-            body=template,
-            subtype="html"
+        await EmailOutbox.create(
+            user=instance,
+            kind="verification",
+            recipient=instance.email,
+            dedupe_key=f"verification:{instance.id}",
+            using_db=using_db,
         )
+    except IntegrityError:
+        logger.info(f"Verification email already queued for user {instance.id}")
+        return False
+    if using_db is None:
+        # inside a transaction the row is invisible until commit, the caller wakes the worker then
+        outbox_worker.wake()
+    return True
+
+
+async def build_message(entry: EmailOutbox) -> EmailMessage:
+    if entry.kind != "verification":
+        raise ValueError(f"Unknown email kind: {entry.kind}")
+
+    instance = await entry.user
+    message = EmailMessage()
+    message["Subject"] = VERIFICATION_SUBJECT
+    message["From"] = MAIL_FROM
+    message["To"] = entry.recipient
+    html, text = render_email(
+        "verification",
+        {"username": instance.username, "verification_url": get_verification_url(instance)}
+    )
+    #plain text first so clients that prefer it pick it, html as the alternative
+    if text is not None:
+        message.set_content(text)
+        message.add_alternative(html, subtype="html")
+    else:
+        message.set_content(html, subtype="html")
+    return message
+
+
+class OutboxWorker:
+    """Drains ``EmailOutbox`` in the background over a reused SMTP connection.
+
+    Due rows are claimed in batches by pushing their ``next_attempt_at`` out by
+    a lease, so several app workers can drain the same table without sending a
+    message twice, and a row claimed by a worker that died is retried once the
+    lease runs out. Failed sends back off exponentially up to ``max_attempts``.
+    """
 
-        # Initialize FastMail
-        logger.debug("Initializing FastMail")
-        fm = FastMail(conf)
-        
-        # Send email
-        logger.info("Attempting to send email")
-        await fm.send_message(message=message)
-        logger.info(f"Email successfully sent to {email_list}")
-        
+    def __init__(
+        self,
+        batch_size: int = 50,
+        poll_interval: float = 5.0,
+        idle_timeout: float = 30.0,
+        lease: float = 120.0,
+        max_attempts: int = 8,
+        backoff_base: float = 30.0,
+        backoff_max: float = 3600.0,
+    ):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sent = 0
+        self.failed = 0
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+        self._idle_since: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            # an Event binds to the loop it first waits on, so each start gets its own
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._disconnect()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                sent_any = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+                await self._disconnect()
+                sent_any = False
+
+            if sent_any:
+                continue
+
+            await self._close_if_idle()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim_batch(self) -> List[EmailOutbox]:
+        now = timezone.now()
+        due = await EmailOutbox.filter(
+            status="pending", next_attempt_at__lte=now
+        ).order_by("next_attempt_at").limit(self.batch_size)
+
+        claimed = []
+        lease_until = now + timedelta(seconds=self.lease)
+        for entry in due:
+            # conditional update: only one worker wins each row
+            won = await EmailOutbox.filter(
+                id=entry.id, status="pending", next_attempt_at=entry.next_attempt_at
+            ).update(next_attempt_at=lease_until)
+            if won:
+                claimed.append(entry)
+        return claimed
+
+    async def drain_once(self) -> bool:
+        """Send one batch of due messages, returns whether there was any work."""
+        batch = await self._claim_batch()
+        if not batch:
+            return False
+
+        try:
+            smtp = await self._connection()
+        except Exception as e:
+            logger.error(f"Could not connect to {MAIL_SERVER}:{MAIL_PORT}: {e}")
+            for entry in batch:
+                await self._reschedule(entry, e)
+            return False
+
+        for entry in batch:
+            try:
+                await smtp.send_message(await build_message(entry))
+            except Exception as e:
+                logger.error(f"Failed to send {entry.kind} email to {entry.recipient}: {e}")
+                await self._reschedule(entry, e)
+                if isinstance(e, aiosmtplib.SMTPServerDisconnected):
+                    await self._disconnect()
+                    return True
+                continue
+
+            await EmailOutbox.filter(id=entry.id).update(
+                status="sent", sent_at=timezone.now(), attempts=entry.attempts + 1, last_error=None
+            )
+            if entry.kind == "verification" and entry.user_id is not None:
+                await User.filter(id=entry.user_id).update(email_sent=True)
+            self.sent += 1
+            logger.info(f"Email successfully sent to {entry.recipient}")
         return True
-        
-    except Exception as e:
-        # logger.error(f"Failed to send email: {str(e)}")
-        # Log configuration details (excluding sensitive information)
-        # logger.debug(f"Mail server: {conf.MAIL_SERVER}")
-        # logger.debug(f"Mail port: {conf.MAIL_PORT}")
-        # logger.debug(f"From address: {conf.MAIL_FROM}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to send email: {str(e)}"
+
+    async def _reschedule(self, entry: EmailOutbox, error: Exception) -> None:
+        attempts = entry.attempts + 1
+        if attempts >= self.max_attempts:
+            self.failed += 1
+            await EmailOutbox.filter(id=entry.id).update(
+                status="failed", attempts=attempts, last_error=str(error)
+            )
+            return
+
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        await EmailOutbox.filter(id=entry.id).update(
+            attempts=attempts,
+            last_error=str(error),
+            next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        )
+
+    async def _connection(self) -> aiosmtplib.SMTP:
+        self._idle_since = None
+        if self._smtp is not None and self._smtp.is_connected:
+            return self._smtp
+
+        smtp = aiosmtplib.SMTP(
+            hostname=MAIL_SERVER,
+            port=MAIL_PORT,
+            use_tls=MAIL_SSL_TLS,
+            start_tls=MAIL_STARTTLS,
+            validate_certs=MAIL_VALIDATE_CERTS,
+            timeout=MAIL_TIMEOUT,
         )
+        await smtp.connect()
+        if MAIL_USE_CREDENTIALS:
+            await smtp.login(MAIL_USERNAME, MAIL_PASSWORD)
+        self._smtp = smtp
+        return smtp
+
+    async def _close_if_idle(self) -> None:
+        if self._smtp is None:
+            return
+        loop_time = asyncio.get_running_loop().time()
+        if self._idle_since is None:
+            self._idle_since = loop_time
+        elif loop_time - self._idle_since >= self.idle_timeout:
+            await self._disconnect()
+
+    async def _disconnect(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        self._idle_since = None
+        if smtp is None:
+            return
+        try:
+            if smtp.is_connected:
+                await smtp.quit()
+        except Exception:
+            smtp.close()
+
+
+outbox_worker = OutboxWorker(
+    batch_size=get_int("MAIL_BATCH_SIZE", 50),
+    poll_interval=get_float("MAIL_POLL_INTERVAL", 5.0),
+    max_attempts=get_int("MAIL_MAX_ATTEMPTS", 8),
+    backoff_base=get_float("MAIL_BACKOFF_BASE", 30.0),
+)
@@ -0,0 +1,283 @@
+import logging
+import re
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+import jwt
+from fastapi import HTTPException, status
+from tortoise.exceptions import IntegrityError
+
+from accounts import create_account
+from authentications import get_hashed_password
+from config import get_float, get_int, get_setting
+from models import User
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CLIENT_ID = get_setting("GOOGLE_CLIENT_ID")
+GOOGLE_CLIENT_SECRET = get_setting("GOOGLE_CLIENT_SECRET")
+GOOGLE_REDIRECT_URI = get_setting("GOOGLE_REDIRECT_URI")
+# point this at a local mock server to run the flow without Google
+GOOGLE_DISCOVERY_URL = get_setting(
+    "GOOGLE_DISCOVERY_URL", "https://accounts.google.com/.well-known/openid-configuration"
+)
+
+# Google issues id tokens under both spellings of its issuer
+GOOGLE_ISSUERS = ("https://accounts.google.com", "accounts.google.com")
+STATE_TTL = timedelta(minutes=10)
+USERNAME_MAX_LENGTH = 20
+
+
+def _max_age(response: httpx.Response, default: float) -> float:
+    match = re.search(r"max-age=(\d+)", response.headers.get("cache-control", ""))
+    return float(match.group(1)) if match else default
+
+
+class GoogleOAuth:
+    """Google sign-in over one pooled, keep-alive HTTP client.
+
+    The discovery document and the signing keys are cached for as long as
+    Google's Cache-Control allows (``metadata_ttl`` when it says nothing), so
+    a login costs a single round trip, the code exchange, and the id token
+    is verified locally instead of calling ``userinfo``.
+    """
+
+    def __init__(
+        self,
+        client_id: Optional[str],
+        client_secret: Optional[str],
+        redirect_uri: Optional[str],
+        discovery_url: str = GOOGLE_DISCOVERY_URL,
+        timeout: float = 10.0,
+        metadata_ttl: float = 3600.0,
+        max_connections: int = 20,
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.discovery_url = discovery_url
+        self.timeout = timeout
+        self.metadata_ttl = metadata_ttl
+        self.max_connections = max_connections
+        self.http: Optional[httpx.AsyncClient] = None
+        self._discovery: Optional[dict] = None
+        self._discovery_expires = 0.0
+        self._jwks: Optional[jwt.PyJWKSet] = None
+        self._jwks_expires = 0.0
+        self._jwks_fetched = 0.0
+
+    def start(self, client: Optional[httpx.AsyncClient] = None) -> None:
+        """Open the shared client; tests pass one wired to a mock server."""
+        if self.http is None:
+            self.http = client or httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+
+    async def stop(self) -> None:
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+    async def _get_json(self, url: str) -> Tuple[dict, float]:
+        if self.http is None:
+            self.start()
+        try:
+            response = await self.http.get(url)
+            response.raise_for_status()
+            return response.json(), _max_age(response, self.metadata_ttl)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Could not fetch {url}: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="Google sign-in is unavailable"
+            )
+
+    async def discovery(self) -> dict:
+        if self._discovery is None or self._discovery_expires <= time.monotonic():
+            document, max_age = await self._get_json(self.discovery_url)
+            self._discovery = document
+            self._discovery_expires = time.monotonic() + max_age
+        return self._discovery
+
+    async def signing_key(self, kid: Optional[str]) -> jwt.PyJWK:
+        now = time.monotonic()
+        if self._jwks is None or self._jwks_expires <= now:
+            await self._refresh_jwks()
+        for key in self._jwks.keys:
+            if key.key_id == kid:
+                return key
+
+        # Google rotates keys; refetch for an unknown kid, but not more than once a minute
+        if now - self._jwks_fetched > 60:
+            await self._refresh_jwks()
+            for key in self._jwks.keys:
+                if key.key_id == kid:
+                    return key
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid Google id token"
+        )
+
+    async def _refresh_jwks(self) -> None:
+        document, max_age = await self._get_json((await self.discovery())["jwks_uri"])
+        self._jwks = jwt.PyJWKSet.from_dict(document)
+        self._jwks_fetched = time.monotonic()
+        self._jwks_expires = self._jwks_fetched + max_age
+
+    async def authorization_url(self, state: str, nonce: str) -> str:
+        params = {
+            "response_type": "code",
+            "client_id": self.client_id,
+            "redirect_uri": self.redirect_uri,
+            "scope": "openid profile email",
+            "access_type": "offline",
+            "state": state,
+            "nonce": nonce,
+        }
+        return (await self.discovery())["authorization_endpoint"] + "?" + urlencode(params)
+
+    async def exchange_code(self, code: str) -> dict:
+        token_endpoint = (await self.discovery())["token_endpoint"]
+        try:
+            response = await self.http.post(token_endpoint, data={
+                "code": code,
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "redirect_uri": self.redirect_uri,
+                "grant_type": "authorization_code",
+            })
+        except httpx.HTTPError as e:
+            logger.error(f"Google code exchange failed: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="Google sign-in is unavailable"
+            )
+        if response.status_code != 200:
+            logger.warning(f"Google rejected the authorization code: {response.text[:200]}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid or expired authorization code"
+            )
+        return response.json()
+
+    async def verify_id_token(self, id_token: str, nonce: str) -> dict:
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.PyJWTError:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid Google id token"
+            )
+        key = await self.signing_key(header.get("kid"))
+        issuer = (await self.discovery()).get("issuer")
+        try:
+            claims = jwt.decode(
+                id_token,
+                key=key,
+                algorithms=["RS256"],
+                audience=self.client_id,
+                issuer=list({issuer, *GOOGLE_ISSUERS} - {None}),
+                options={"require": ["exp", "iat", "sub"]},
+            )
+        except jwt.PyJWTError as e:
+            logger.warning(f"Rejected Google id token: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid Google id token"
+            )
+        if claims.get("nonce") != nonce:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid Google id token"
+            )
+        return claims
+
+    async def authenticate(self, code: str, state: str) -> dict:
+        """Run the callback half of the flow and return the verified id token claims."""
+        nonce = check_state(state)
+        tokens = await self.exchange_code(code)
+        if "id_token" not in tokens:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="Google did not return an id token"
+            )
+        return await self.verify_id_token(tokens["id_token"], nonce)
+
+
+def create_state() -> Tuple[str, str]:
+    """A signed, short-lived state carrying the nonce, so no server-side session is needed."""
+    nonce = secrets.token_urlsafe(16)
+    state = jwt.encode(
+        {"type": "oauth_state", "nonce": nonce, "exp": datetime.now(timezone.utc) + STATE_TTL},
+        get_setting("SECRET"),
+        algorithm="HS256",
+    )
+    return state, nonce
+
+
+def check_state(state: str) -> str:
+    try:
+        payload = jwt.decode(state, get_setting("SECRET"), algorithms=["HS256"])
+    except jwt.PyJWTError:
+        payload = {}
+    if payload.get("type") != "oauth_state" or not payload.get("nonce"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid or expired sign-in state"
+        )
+    return payload["nonce"]
+
+
+def _username_base(claims: dict) -> str:
+    local = claims["email"].split("@")[0].lower()
+    return re.sub(r"[^a-z0-9_]", "", local)[:USERNAME_MAX_LENGTH - 6] or "user"
+
+
+async def get_or_create_google_user(claims: dict) -> User:
+    """The local account for a verified Google identity, matched on email."""
+    email = claims.get("email")
+    if not email or not claims.get("email_verified"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Google account has no verified email"
+        )
+
+    user = await User.get_or_none(email=email)
+    if user is not None:
+        return user
+
+    # the account is only reachable through Google, give it a password nobody knows
+    password = await get_hashed_password(secrets.token_urlsafe(32))
+    base = _username_base(claims)
+    for attempt in range(5):
+        username = base if attempt == 0 else f"{base}_{secrets.token_hex(2)}"
+        try:
+            # the same single transaction as a password signup, business included
+            return await create_account(username, email, password, is_verified=True)
+        except IntegrityError:
+            # a concurrent callback for the same email may have won the race
+            user = await User.get_or_none(email=email)
+            if user is not None:
+                return user
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Could not create an account for this Google identity"
+    )
+
+
+google_oauth = GoogleOAuth(
+    client_id=GOOGLE_CLIENT_ID,
+    client_secret=GOOGLE_CLIENT_SECRET,
+    redirect_uri=GOOGLE_REDIRECT_URI,
+    timeout=get_float("GOOGLE_HTTP_TIMEOUT", 10.0),
+    metadata_ttl=get_float("GOOGLE_METADATA_TTL", 3600.0),
+    max_connections=get_int("GOOGLE_HTTP_CONNECTIONS", 20),
+)
@@ -0,0 +1,203 @@
+"""Serving /static/images.
+
+Uploads are stored under the hash of their content (``store_upload``) and
+their variants under that hash plus size and format, so those names never
+point at different bytes. ``ImageFiles`` serves them with a year-long
+``Cache-Control: immutable`` and a strong ETag made from the name, the
+same on every worker and host. Anything else in the directory, such as
+the default logo and product image, is cached for ``IMAGE_MAX_AGE``
+seconds and revalidated against its mtime/size ETag.
+
+Ranges, ``If-Range`` and zero-copy sending come from starlette's
+``FileResponse``: it answers ranges itself and hands the path to the
+server through the ``http.response.pathsend`` extension when the server
+offers it. Servers without it get the file streamed in chunks, one thread
+hop per read, so small immutable files are kept in memory
+(``IMAGE_MEMORY_CACHE_MB``) and sent as a single body instead.
+
+With ``IMAGE_PRECOMPRESSED``, a ``.br`` or ``.gz`` file next to a
+compressible image (SVG, BMP, icons) is sent when the client accepts that
+encoding. JPEG, PNG, WebP and AVIF are compressed already and never looked
+up.
+
+Immutable lookups are cached, so a hot image costs no ``stat``.
+"""
+import errno
+import os
+import re
+import stat
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from mimetypes import guess_type
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from config import get_bool, get_int
+
+IMAGE_MAX_AGE = get_int("IMAGE_MAX_AGE", 3600)
+IMAGE_PRECOMPRESSED = get_bool("IMAGE_PRECOMPRESSED", True)
+IMAGE_LOOKUP_CACHE = get_int("IMAGE_LOOKUP_CACHE", 4096)
+IMAGE_MEMORY_CACHE_MB = get_int("IMAGE_MEMORY_CACHE_MB", 64)
+IMAGE_MEMORY_FILE_KB = get_int("IMAGE_MEMORY_FILE_KB", 256)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# content hashes (older uploads used 20 random hex characters) and their variants
+IMMUTABLE_NAME = re.compile(r"[0-9a-f]{20,64}(_\d+)?\.[a-z0-9]+")
+
+# preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE_TYPES = {"image/svg+xml", "image/bmp", "image/x-icon", "image/vnd.microsoft.icon", "image/tiff"}
+
+
+@dataclass
+class ImageFile:
+    path: str
+    stat_result: os.stat_result
+    media_type: str
+    etag: Optional[str] = None
+    # content-coding -> (path, stat) of the precompressed copy
+    encoded: Dict[str, Tuple[str, os.stat_result]] = field(default_factory=dict)
+    body: Optional[bytes] = None
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+    accepted = []
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.append(coding.strip().lower())
+    return accepted
+
+
+class ImageFiles(StaticFiles):
+    """``StaticFiles`` for the image directory, with caching headers and precompressed copies."""
+
+    def __init__(
+        self,
+        *args,
+        max_age: int = IMAGE_MAX_AGE,
+        precompressed: bool = IMAGE_PRECOMPRESSED,
+        lookup_cache: int = IMAGE_LOOKUP_CACHE,
+        memory_cache_bytes: int = IMAGE_MEMORY_CACHE_MB * 1024 * 1024,
+        memory_file_bytes: int = IMAGE_MEMORY_FILE_KB * 1024,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.max_age = max_age
+        self.precompressed = precompressed
+        self.lookup_cache = lookup_cache
+        self.memory_cache_bytes = memory_cache_bytes
+        self.memory_file_bytes = memory_file_bytes
+        self.files: "OrderedDict[str, ImageFile]" = OrderedDict()
+        self.cached_bytes = 0
+
+    def load(self, path: str) -> Optional[ImageFile]:
+        """Runs in a thread: stat the file and its precompressed copies, read it if it is small."""
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            return None
+
+        media_type = guess_type(full_path)[0] or "application/octet-stream"
+        image = ImageFile(full_path, stat_result, media_type)
+        immutable = IMMUTABLE_NAME.fullmatch(os.path.basename(path)) is not None
+        if immutable:
+            image.etag = '"' + os.path.splitext(os.path.basename(path))[0] + '"'
+
+        if self.precompressed and media_type in COMPRESSIBLE_TYPES:
+            for coding, suffix in ENCODINGS:
+                try:
+                    encoded_stat = os.stat(full_path + suffix)
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
+                if stat.S_ISREG(encoded_stat.st_mode):
+                    image.encoded[coding] = (full_path + suffix, encoded_stat)
+
+        if immutable and not image.encoded and stat_result.st_size <= self.memory_file_bytes:
+            with open(full_path, "rb") as file:
+                image.body = file.read()
+        return image
+
+    def remember(self, path: str, image: ImageFile) -> None:
+        if path in self.files or self.lookup_cache <= 0:
+            return
+        if image.body is not None:
+            if len(image.body) > self.memory_cache_bytes:
+                image.body = None
+            else:
+                self.cached_bytes += len(image.body)
+        self.files[path] = image
+        while len(self.files) > self.lookup_cache or self.cached_bytes > self.memory_cache_bytes:
+            _, evicted = self.files.popitem(last=False)
+            if evicted.body is not None:
+                self.cached_bytes -= len(evicted.body)
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405, headers={"Allow": "GET, HEAD"})
+
+        image = self.files.get(path)
+        if image is not None:
+            self.files.move_to_end(path)
+        else:
+            try:
+                image = await anyio.to_thread.run_sync(self.load, path)
+            except PermissionError:
+                raise HTTPException(status_code=401)
+            except OSError as exc:
+                if exc.errno == errno.ENAMETOOLONG:
+                    raise HTTPException(status_code=404)
+                raise
+            except ValueError:
+                raise HTTPException(status_code=404)
+            if image is None:
+                raise HTTPException(status_code=404)
+            if image.etag is not None:
+                self.remember(path, image)
+
+        return self.image_response(image, scope)
+
+    def image_response(self, image: ImageFile, scope: Scope) -> Response:
+        request_headers = Headers(scope=scope)
+        headers = {
+            "cache-control": IMMUTABLE_CACHE_CONTROL if image.etag else f"public, max-age={self.max_age}",
+        }
+        file_path, stat_result = image.path, image.stat_result
+
+        if image.encoded:
+            headers["vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            for coding, _ in ENCODINGS:
+                if coding in image.encoded and coding in accepted:
+                    file_path, stat_result = image.encoded[coding]
+                    headers["content-encoding"] = coding
+                    break
+        if image.etag is not None:
+            # each encoding is a different representation and needs its own tag
+            coding = headers.get("content-encoding")
+            headers["etag"] = image.etag if coding is None else image.etag[:-1] + "-" + coding + '"'
+
+        response: Response
+        if (
+            image.body is not None
+            and scope["method"] == "GET"
+            and "range" not in request_headers
+            and "http.response.pathsend" not in scope.get("extensions", {})
+        ):
+            headers["accept-ranges"] = "bytes"
+            headers["last-modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+            response = Response(image.body, headers=headers, media_type=image.media_type)
+        else:
+            response = FileResponse(file_path, headers=headers, media_type=image.media_type, stat_result=stat_result)
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
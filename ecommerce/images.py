@@ -0,0 +1,191 @@
+import hashlib
+import logging
+import os
+import secrets
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import aiofiles
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, ImageOps, features
+
+from config import get_int, get_setting
+from workers import BoundedExecutor
+
+logger = logging.getLogger(__name__)
+
+FILEPATH = "./static/images/"
+IMAGE_URL = "localhost:8000/static/images/"
+ALLOWED_EXTENSIONS = ["png", "jpg"]
+CHUNK_SIZE = 1024 * 1024
+MAX_JOBS = 10000
+
+# square thumbnails generated for every upload, DEFAULT_SIZE is what clients get
+# when they do not ask for a size
+VARIANT_SIZES = tuple(int(size) for size in get_setting("IMAGE_VARIANT_SIZES", "64,200,800").split(","))
+DEFAULT_SIZE = get_int("IMAGE_DEFAULT_SIZE", 200)
+
+# extension -> (pillow format, mime type); the original format is always generated
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "avif": ("AVIF", "image/avif"),
+}
+PIL_FORMATS = {"jpg": "JPEG", "png": "PNG"}
+
+# decoding and resizing is CPU bound and holds the GIL, so it gets its own processes
+image_pool = BoundedExecutor(
+    "image",
+    max_workers=get_int("IMAGE_WORKERS", os.cpu_count() or 1),
+    max_queue=get_int("IMAGE_MAX_QUEUE", 32),
+    kind="process",
+)
+
+# job id -> {"status": ..., "filename": ..., "detail": ...}, oldest evicted first
+jobs: "OrderedDict[str, dict]" = OrderedDict()
+
+
+def upload_extension(filename: Optional[str]) -> Optional[str]:
+    """The upload's extension, or None when it is not an allowed image type."""
+    extension = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    return extension if extension in ALLOWED_EXTENSIONS else None
+
+
+def variant_extensions(extension: str) -> List[str]:
+    extensions = [extension]
+    for name in VARIANT_FORMATS:
+        if features.check(name):
+            extensions.append(name)
+    return extensions
+
+
+def variant_name(name: str, size: int, extension: str) -> str:
+    digest = os.path.splitext(name)[0]
+    return f"{digest}_{size}.{extension}"
+
+
+async def store_upload(file: UploadFile, extension: str) -> Tuple[str, str, bool]:
+    """Stream an upload to disk in chunks under the hash of its content.
+
+    Returns (token_name, path, created); identical images map to the same
+    name, so a re-upload is not stored twice.
+    """
+    digest = hashlib.sha256()
+    partial_name = FILEPATH + secrets.token_hex(10) + ".part"
+
+    async with aiofiles.open(partial_name, "wb") as out:
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            await out.write(chunk)
+    await file.close()
+
+    token_name = digest.hexdigest()[:32] + "." + extension
+    generated_name = FILEPATH + token_name
+
+    if os.path.exists(generated_name):
+        os.remove(partial_name)
+        return token_name, generated_name, False
+
+    os.replace(partial_name, generated_name)
+    return token_name, generated_name, True
+
+
+def variants_complete(token_name: str) -> bool:
+    extension = os.path.splitext(token_name)[1].lstrip(".")
+    return all(
+        os.path.exists(FILEPATH + variant_name(token_name, size, variant_extension))
+        for size in VARIANT_SIZES
+        for variant_extension in variant_extensions(extension)
+    )
+
+
+def generate_variants(path: str, sizes: Tuple[int, ...] = VARIANT_SIZES) -> List[str]:
+    """Runs in a worker process: write every size/format variant of the original."""
+    directory, token_name = os.path.split(path)
+    extension = os.path.splitext(token_name)[1].lstrip(".")
+    written = []
+
+    with Image.open(path) as img:
+        # let the jpeg decoder scale down while decoding instead of after
+        img.draft("RGB", (max(sizes), max(sizes)))
+        img = ImageOps.exif_transpose(img)
+        img.load()
+
+        for size in sorted(sizes, reverse=True):
+            thumbnail = ImageOps.fit(img, (size, size), method=Image.LANCZOS)
+            for variant_extension in variant_extensions(extension):
+                pil_format = PIL_FORMATS.get(variant_extension) or VARIANT_FORMATS[variant_extension][0]
+                out = thumbnail
+                if pil_format == "JPEG" and out.mode not in ("RGB", "L"):
+                    out = out.convert("RGB")
+
+                name = variant_name(token_name, size, variant_extension)
+                partial_name = os.path.join(directory, name + ".part")
+                out.save(partial_name, format=pil_format, quality=80)
+                os.replace(partial_name, os.path.join(directory, name))
+                written.append(name)
+    return written
+
+
+def resolve_image(name: str, size: Optional[int] = None, accept: Optional[str] = None) -> str:
+    """Pick the stored file to serve for an image field.
+
+    The smallest variant at least ``size`` pixels wide is used (``DEFAULT_SIZE``
+    when no size is asked for), in avif or webp when the client's Accept header
+    allows it. Names without generated variants, such as the defaults and files
+    uploaded before variants existed, resolve to themselves.
+    """
+    extension = os.path.splitext(name)[1].lstrip(".")
+    if size is None:
+        size = DEFAULT_SIZE
+
+    candidates = [candidate for candidate in sorted(VARIANT_SIZES) if candidate >= size]
+    chosen_size = candidates[0] if candidates else max(VARIANT_SIZES)
+
+    accept = accept or ""
+    preferred = [
+        variant_extension for variant_extension, (_, mime) in VARIANT_FORMATS.items()
+        if mime in accept
+    ]
+    for variant_extension in preferred + [extension]:
+        variant = variant_name(name, chosen_size, variant_extension)
+        if os.path.exists(FILEPATH + variant):
+            return variant
+    return name
+
+
+def image_url(name: str) -> str:
+    return IMAGE_URL + name
+
+
+def create_job(filename: str, job_status: str = "pending") -> str:
+    job_id = uuid.uuid4().hex
+    jobs[job_id] = {"status": job_status, "filename": filename, "detail": None}
+    while len(jobs) > MAX_JOBS:
+        jobs.popitem(last=False)
+    return job_id
+
+
+def get_job(job_id: str) -> dict:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job does not exist"
+        )
+    return job
+
+
+async def process_image(job_id: str, path: str) -> None:
+    job = jobs.get(job_id, {})
+    job["status"] = "processing"
+    try:
+        job["variants"] = await image_pool.run(generate_variants, path)
+        job["status"] = "done"
+    except Exception as e:
+        logger.error(f"Image processing failed for {path}: {e}")
+        job["status"] = "failed"
+        job["detail"] = str(e)
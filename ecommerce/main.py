@@ -1,22 +1,48 @@
 import logging
-from fastapi import FastAPI, Request, HTTPException, status,Depends
+from fastapi import FastAPI, Request, HTTPException, status,Depends, Query
 from tortoise.contrib.fastapi import register_tortoise
-from tortoise.signals import post_save
+from tortoise.exceptions import IntegrityError
+from tortoise.signals import post_delete, post_save, pre_save
 from typing import List, Optional, Type
 from tortoise import BaseDBAsyncClient
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from models import *
 from authentications import *
 from emailss import *
+from catalog import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, catalog_queryset, product_page, stream_products,
+    get_product_detail, product_detail_response,
+)
+from database import DB_GENERATE_SCHEMAS, TORTOISE_ORM, read_db
+from migrate import pending_migrations
+from user_cache import get_cached_user, user_cache
+from response_cache import accepted_formats, cache_key, catalog_tags, product_tags, response_cache
+from bulk import FORMATS, export_products, import_products, request_format, spool_body
+from search import (
+    MAX_CANDIDATES, index_product, rename_business, search_products, unindex_product,
+)
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from dotenv import dotenv_values
-import requests
+from tokens import create_token_pair, decode_token, revocations
+from accounts import create_account, duplicate_account
+from serialization import FastJSONResponse, business_row, product_row
+from metrics import MetricsMiddleware, TimedRoute, instrument_db, query_budget, request_stats
+from google_auth import create_state, get_or_create_google_user, google_oauth
+from business_stats import (
+    STATS_FIELDS, add_product_stats, get_business_stats, remove_product_stats, stats_values, stored_stats_values,
+    update_product_stats,
+)
+from deals import DEAL_FIELDS, deal_sweeper, deals_page, remove_deal, sync_deal, today
+from pricing import load_price_columns, pricing_summary, reprice
+from single_flight import SingleFlight
 #image upload
-from fastapi import File, UploadFile
-import secrets
+from fastapi import BackgroundTasks, File, UploadFile
 from fastapi.staticfiles import StaticFiles
-from PIL import Image
+from image_files import ImageFiles
+from images import (
+    create_job, get_job, image_pool, image_url, jobs, process_image, resolve_image, store_upload,
+    upload_extension, variants_complete,
+)
 
 
 # Initialize logging at the very top of the file
@@ -24,12 +50,15 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
+#per-request query count and timings, sent as Server-Timing and collected for /metrics
+app.router.route_class = TimedRoute
+app.add_middleware(MetricsMiddleware)
 
+#DB_URL and the optional DB_READ_URL replica come from the settings, see database.py
 register_tortoise(
     app,
-    db_url="sqlite://database.sqlite3",
-    modules={"models": ["models"]},
-    generate_schemas=True,
+    config=TORTOISE_ORM,
+    generate_schemas=DB_GENERATE_SCHEMAS,
     add_exception_handlers=True
 )
 
@@ -37,27 +66,47 @@ register_tortoise(
 
 oath2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
-goog_credentials = dotenv_values(".env")
-
-GOOGLE_CLIENT_ID = goog_credentials["GOOGLE_CLIENT_ID"]
-GOOGLE_CLIENT_SECRET = goog_credentials["GOOGLE_CLIENT_SECRET"]
-
-GOOGLE_REDIRECT_URI =goog_credentials["GOOGLE_REDIRECT_URI"]
-
-#static file setup config
+#static file setup config, images first so they get their caching headers
 
+app.mount("/static/images", ImageFiles(directory="static/images"), name="images")
 app.mount("/static", StaticFiles(directory="static"),name = "static")
 
 
 @app.post("/token")
 async def generate_token(request_form:OAuth2PasswordRequestForm = Depends()):
-    token = await token_generator(request_form.username,request_form.password)
-    return {"access_token":token, "token_type":"bearer"}
+    return await token_generator(request_form.username,request_form.password)
+
+@app.post("/token/refresh")
+async def refresh_token(body: RefreshRequest):
+    payload = decode_token(body.refresh_token, "refresh")
+    user = await User.get_or_none(id = payload["id"])
+
+    if user is None or payload.get("ver") != user.token_version or await revocations.is_refresh_revoked(payload):
+        raise HTTPException(
+            status_code = status.HTTP_401_UNAUTHORIZED,
+            detail= "Invalid or expired token",
+            headers={"WWW-Authenticate":"Bearer"}
+        )
+
+    #refresh tokens are single use, the old one is revoked as the new pair is issued
+    await revocations.revoke_token(payload)
+    return create_token_pair(user)
 
-async def get_current_user(token: str = Depends(oath2_scheme)):
+async def get_token_payload(token: str = Depends(oath2_scheme)) -> dict:
+    #signature, expiry and revocation are all checked in memory
+    payload = decode_token(token, "access")
+    if revocations.is_revoked(payload):
+        raise HTTPException(
+            status_code = status.HTTP_401_UNAUTHORIZED,
+            detail= "Invalid or expired token",
+            headers={"WWW-Authenticate":"Bearer"}
+        )
+    return payload
+
+async def get_current_user(payload: dict = Depends(get_token_payload)):
     try :
-        payload = jwt.decode(token,config_credentials["SECRET"],algorithms= "HS256")
-        user = await User.get(id = payload.get("id"))
+        #served from the in-process cache, the database is only hit on a miss
+        user = await get_cached_user(payload.get("id"), payload.get("ver", 0))
 
     except:
         raise HTTPException(
@@ -65,19 +114,41 @@ async def get_current_user(token: str = Depends(oath2_scheme)):
             detail= "Invalid username or password",
             headers={"WWW-Authenticate":"Bearer"}
         )
-    return await user
-
-@app.post("/user/me")
-async def user_login(user: user_pydanticIn = Depends(get_current_user)):
-    #return business details of the user
-    business =  await Business.get(owner=user)
-    logo = business.logo
-    logo_path = "localhost:8000/static/images"+logo
+    return user
+
+@app.post("/logout")
+async def logout(
+    body: Optional[LogoutRequest] = None,
+    payload: dict = Depends(get_token_payload),
+    user: user_pydantic = Depends(get_current_user),
+):
+    if body is not None and body.everywhere:
+        await revocations.revoke_user(user)
+        user_cache.invalidate(user.id)
+    else:
+        await revocations.revoke_token(payload)
+        if body is not None and body.refresh_token:
+            refresh = decode_token(body.refresh_token, "refresh")
+            if refresh["id"] == user.id:
+                await revocations.revoke_token(refresh)
 
+    return {
+        "status":"ok"
+    }
 
+#concurrent /user/me calls of one user read its business once
+business_lookups = SingleFlight()
 
+@app.post("/user/me")
+#the user on a cache miss, then its business
+@query_budget(2)
+async def user_login(request: Request, image_size: Optional[int] = None, user: user_pydanticIn = Depends(get_current_user)):
+    #return business details of the user
+    business, _ = await business_lookups.do(user.id, lambda: Business.get(owner=user, using_db=read_db()))
+    logo = resolve_image(business.logo, image_size, request.headers.get("accept"))
+    logo_path = image_url(logo)
 
-    return {
+    return FastJSONResponse({
         "status":"ok",
         "data":{
             "username": user.username,
@@ -87,7 +158,7 @@ async def user_login(user: user_pydanticIn = Depends(get_current_user)):
             "logo":logo_path
 
         }
-    }
+    }, headers={"Vary":"Accept"})
 
 
 
@@ -95,104 +166,144 @@ async def user_login(user: user_pydanticIn = Depends(get_current_user)):
 
 @app.post("/register")
 async def user_registration(user: user_pydanticIn):
-    try:
-        logger.info(f"Received registration request with username: {user.username} and email: {user.email}")
-        
-        # Database connection check
-        try:
-            await User.first()
-        except Exception as db_error:
-            logger.error(f"Database connection error: {db_error}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Database connection error"
-            )
+    logger.info(f"Received registration request with username: {user.username} and email: {user.email}")
+    password = await get_hashed_password(user.password)
 
-        # Email check
-        existing_user = await User.get_or_none(email=user.email)
-        if existing_user:
-            logger.warning(f"Attempted registration with existing email: {user.email}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Email {user.email} is already registered"
-            )
-
-        # Username check
-        existing_username = await User.get_or_none(username=user.username)
-        if existing_username:
-            logger.warning(f"Attempted registration with existing username: {user.username}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Username {user.username} is already taken"
-            )
-
-        # Create user
-        try:
-            user_info = user.dict(exclude_unset=True)
-            user_info["password"] = get_hashed_password(user_info["password"])
-            # Add a flag to prevent duplicate email sending
-            user_info["email_sent"] = False
-            user_obj = await User.create(**user_info)
-            logger.info(f"Successfully created user: {user_obj.username}")
-        except Exception as create_error:
-            logger.error(f"Error creating user: {create_error}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error creating user account"
-            )
-
-        # Send verification email
-        try:
-            await send_email([user_obj.email], user_obj)
-            user_obj.email_sent = True
-            await user_obj.save()
-            logger.info(f"Verification email sent to: {user_obj.email}")
-        except Exception as email_error:
-            logger.error(f"Error sending verification email: {email_error}")
-            
-        return {
-            "status": "success",
-            "data": f"Hello {user_obj.username}, thanks for choosing our services. Please check your email to confirm registration."
-        }
-
-    except HTTPException as http_error:
-        raise http_error
+    # one transaction for the user, its business and its verification email;
+    # the unique constraints catch duplicates, including two signups racing each other
+    try:
+        user_obj = await create_account(user.username, user.email, password)
+    except IntegrityError as e:
+        logger.warning(f"Rejected duplicate registration for {user.username} / {user.email}")
+        raise duplicate_account(e, user.username, user.email)
     except Exception as e:
-        logger.error(f"Unexpected error during registration: {str(e)}")
+        logger.error(f"Unexpected error during registration: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred during registration"
         )
 
+    logger.info(f"Successfully created user: {user_obj.username}")
+    return {
+        "status": "success",
+        "data": f"Hello {user_obj.username}, thanks for choosing our services. Please check your email to confirm registration."
+    }
+
 @post_save(User)
-async def create_business(
+async def invalidate_cached_user(
     sender: "Type[User]",
     instance: User,
     created: bool,
     using_db: "Optional[BaseDBAsyncClient]",
     update_fields: List[str]
 ) -> None:
-    try:
-        if created:
-            # Create business
-            business_obj = await Business.create(
-                business_name=instance.username,
-                owner=instance
-            )
-            await business_pydantic.from_tortoise_orm(business_obj)
-            
-            # Only send email if it hasn't been sent already
-            if not getattr(instance, 'email_sent', False):
-                await send_email([instance.email], instance)
-                instance.email_sent = True
-                await instance.save()
-    except Exception as e:
-        logger.error(f"Error in post_save signal handler: {e}")
+    #verification, password changes etc. must not be served from a stale cache entry
+    user_cache.invalidate(instance.id)
+    response_cache.invalidate(f"user:{instance.id}")
+
+@post_delete(User)
+async def evict_deleted_user(
+    sender: "Type[User]",
+    instance: User,
+    using_db: "Optional[BaseDBAsyncClient]"
+) -> None:
+    user_cache.invalidate(instance.id)
+    response_cache.invalidate(f"user:{instance.id}")
+
+@pre_save(Product)
+async def remember_product_stats(
+    sender: "Type[Product]",
+    instance: Product,
+    using_db: "Optional[BaseDBAsyncClient]",
+    update_fields: List[str]
+) -> None:
+    #an update takes the stored values out of the business stats, the saved ones go in
+    if instance._saved_in_db and (not update_fields or STATS_FIELDS.intersection(update_fields)):
+        instance._stats_before = await stored_stats_values(instance.id, using_db)
+
+@post_save(Product)
+async def index_saved_product(
+    sender: "Type[Product]",
+    instance: Product,
+    created: bool,
+    using_db: "Optional[BaseDBAsyncClient]",
+    update_fields: List[str]
+) -> None:
+    await index_product(instance.id, using_db)
+    if created:
+        await add_product_stats(stats_values(instance), using_db)
+    else:
+        before = instance.__dict__.pop("_stats_before", None)
+        if before is not None:
+            await update_product_stats(before, stats_values(instance), using_db)
+    if not update_fields or DEAL_FIELDS.intersection(update_fields):
+        await sync_deal(instance.id, using_db)
+    response_cache.invalidate(*product_tags(instance.id, instance.category, instance.business_id))
+
+@post_delete(Product)
+async def unindex_deleted_product(
+    sender: "Type[Product]",
+    instance: Product,
+    using_db: "Optional[BaseDBAsyncClient]"
+) -> None:
+    await unindex_product(instance.id, using_db)
+    await remove_product_stats(stats_values(instance), using_db)
+    await remove_deal(instance.id, using_db)
+    response_cache.invalidate(*product_tags(instance.id, instance.category, instance.business_id))
+
+@post_save(Business)
+async def reindex_business_products(
+    sender: "Type[Business]",
+    instance: Business,
+    created: bool,
+    using_db: "Optional[BaseDBAsyncClient]",
+    update_fields: List[str]
+) -> None:
+    if not created:
+        await rename_business(instance.id, instance.business_name, using_db)
+        response_cache.invalidate(f"business:{instance.id}")
 
 @app.get("/")
 def index():
     return {"message": "Hello World"}
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(request_stats.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def instrument_queries():
+    #the client classes are only imported once tortoise has opened its connections
+    instrument_db()
+
+@app.on_event("startup")
+async def check_migrations():
+    #the schema is migrated out of band, only warn when this database is behind the code
+    pending = await pending_migrations()
+    if pending:
+        logger.warning(
+            f"{len(pending)} pending migration(s) ({', '.join(m.version for m in pending)}), "
+            "run `python -m migrate upgrade`"
+        )
+
+@app.on_event("startup")
+async def start_workers():
+    load_email_templates()
+    outbox_worker.start()
+    google_oauth.start()
+    await revocations.rebuild()
+    revocations.start()
+    deal_sweeper.start()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await outbox_worker.stop()
+    await google_oauth.stop()
+    await revocations.stop()
+    await deal_sweeper.stop()
+    hash_pool.shutdown()
+    image_pool.shutdown()
+
 templates = Jinja2Templates(directory="templates")
 
 @app.get("/verification", response_class=HTMLResponse)
@@ -203,8 +314,9 @@ async def email_verification(request: Request, token: str):
             user.is_verified = True
             await user.save()
             return templates.TemplateResponse(
+                request,
                 "verification.html",
-                {"request": request, "username": user.username}
+                {"username": user.username}
             )
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -232,102 +344,97 @@ async def check_user(email: str):
 
 
 @app.post("/uploadfile/profile")
-async def create_upload_file(file:UploadFile = File(...), user: user_pydantic = Depends(get_current_user)):
+async def create_upload_file(background_tasks: BackgroundTasks, file:UploadFile = File(...), user: user_pydantic = Depends(get_current_user)):
+    extension = upload_extension(file.filename)
 
-    FILEPATH = "./static/images/"
-    filename = file.filename
-    #test.png == ["test","png"]
-    extension = filename.split(".")[1]
-
-    if extension not in ["png","jpg"]:
+    if extension is None:
         return {"status":"error","detail":"File extension not allowed"}
 
-    token_name = secrets.token_hex(10) + "." + extension
-    generated_name = FILEPATH + token_name
-    file_content = await file.read()
-
-    with open(generated_name,"wb") as file:
-        file.write(file_content)
-
-    
-    #pillow
-
-    img = Image.open(generated_name)
-    img  = img.resize(size = (200,200))
-    img.save(generated_name)
-
-
-    file.close()
+    image_pool.check_capacity()
 
     business = await Business.get(owner = user)
-    owner = await business.owner
 
-    if owner == user:
-        business.logo = token_name
-        await business.save()
+    #the original is on disk once this returns, resizing happens after the response
+    token_name, generated_name, created = await store_upload(file, extension)
+    business.logo = token_name
+    await business.save()
 
+    #identical images are stored once, their variants only need generating the first time
+    if not created and variants_complete(token_name):
+        job_id = create_job(token_name, "done")
     else:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated to perform this action",
-            headers = {"WWW-Authenticate":"Bearer"}
-        )
+        job_id = create_job(token_name)
+        background_tasks.add_task(process_image, job_id, generated_name)
+        #cached details point at the original until the variants exist
+        background_tasks.add_task(response_cache.invalidate, f"business:{business.id}")
 
-    file_url = "localhost:8000"+ generated_name[1:]
+    file_url = image_url(token_name)
 
     return {
         "status":"ok",
-        "filename":file_url
+        "filename":file_url,
+        "job_id":job_id,
+        "job_status":jobs[job_id]["status"]
     }
 
 
 @app.post("/uploadfile/product/{id}")
-async def create_upload_file(id:int, file:UploadFile = File(...),user:user_pydantic = Depends(get_current_user) ):
-    FILEPATH = "./static/images/"
-    filename = file.filename
-    #test.png == ["test","png"]
-    extension = filename.split(".")[1]
+async def create_upload_file(id:int, background_tasks: BackgroundTasks, file:UploadFile = File(...),user:user_pydantic = Depends(get_current_user) ):
+    extension = upload_extension(file.filename)
 
-    if extension not in ["png","jpg"]:
+    if extension is None:
         return {"status":"error","detail":"File extension not allowed"}
 
-    token_name = secrets.token_hex(10) + "." + extension
-    generated_name = FILEPATH + token_name
-    file_content = await file.read()
-
-    with open(generated_name,"wb") as file:
-        file.write(file_content)
-
-    
-    #pillow
-
-    img = Image.open(generated_name)
-    img  = img.resize(size = (200,200))
-    img.save(generated_name)
-
+    image_pool.check_capacity()
 
-    file.close()
+    product = await Product.filter(id=id).select_related("business").first()
 
-    product = await Product.get(id=id)
-    business = await product.business
-    owner = await business.owner
-
-    if owner == user:
-        product.product_image = token_name
-        await product.save()
+    if product is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product does not exist"
+        )
 
-    else:
+    if product.business.owner_id != user.id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated to perform this action",
             headers = {"WWW-Authenticate":"Bearer"}
         )
-    
-    file_url = "localhost:8000"+ generated_name[1:]
+
+    token_name, generated_name, created = await store_upload(file, extension)
+    product.product_image = token_name
+    await product.save(update_fields=["product_image"])
+
+    #identical images are stored once, their variants only need generating the first time
+    if not created and variants_complete(token_name):
+        job_id = create_job(token_name, "done")
+    else:
+        job_id = create_job(token_name)
+        background_tasks.add_task(process_image, job_id, generated_name)
+        #cached pages point at the original until the variants exist
+        background_tasks.add_task(response_cache.invalidate, f"product:{id}")
+
+    file_url = image_url(token_name)
+
+    return {
+        "status":"ok",
+        "filename":file_url,
+        "job_id":job_id,
+        "job_status":jobs[job_id]["status"]
+    }
+
+
+@app.get("/uploadfile/jobs/{job_id}")
+async def upload_job_status(job_id:str):
+    job = get_job(job_id)
 
     return {
         "status":"ok",
-        "filename":file_url
+        "data":{
+            "job_id":job_id,
+            **job
+        }
     }
 
 
@@ -341,62 +448,212 @@ async def add_new_product(product:product_pydanticIn ,user: user_pydantic = Depe
     #to avoid division by zero error
 
     if product["original_price"] > 0:
-        product["percentage_discount"] = ((product["original_price"]-product["new_price"])/ product["original_price"]) * 100
-
-        product_obj = await Product.create(**product, business = user)
+        product["percentage_discount"] = int(((product["original_price"]-product["new_price"])/ product["original_price"]) * 100)
 
-        product_obj = await product_pydantic.from_tortoise_orm(product_obj)
+        #products belong to the user's business, not to the user
+        business = await Business.get(owner = user)
+        product_obj = await Product.create(**product, business = business)
 
-        return {
+        return FastJSONResponse({
                 "status":"ok",
-                "data":product_obj
-                }
+                "data":product_row(product_obj)
+                })
     else:
         return {
             "status":"error"
         }
     
-@app.get("/product")
-async def get_product():
-    response = await product_pydantic.from_queryset(Product.all())
+@app.post("/products/bulk")
+async def bulk_import_products(request: Request, format: Optional[str] = None, user: user_pydantic = Depends(get_current_user)):
+    format = request_format(request, format)
+    business = await Business.get(owner = user)
+
+    spool = await spool_body(request)
+    try:
+        result = await import_products(spool, format, business)
+    finally:
+        spool.close()
 
+    return {
+        "status":"ok" if not result["failed"] else "partial",
+        "data":result
+    }
+
+
+@app.post("/products/reprice")
+async def reprice_products(body: RepriceRequest, user: user_pydantic = Depends(get_current_user)):
+    #only ever the user's own business
+    business = await Business.get(owner = user)
+    result = await reprice(business.id, body.percent_off, category=body.category, base=body.base)
     return {
         "status":"ok",
-        "data":response
-        }
+        "data":result
+    }
 
 
-@app.get("/product/{id}")
-async def get_product(id:int):
-    product = await Product.get(id = id)
-    business = await product.business
-    owner = await business.owner
-    response = await product_pydantic.from_queryset_single(Product.get(id = id))
+@app.get("/products/export")
+async def bulk_export_products(format: str = "ndjson", user: user_pydantic = Depends(get_current_user)):
+    if format not in FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown format '{format}', expected one of {', '.join(FORMATS)}"
+        )
+    business = await Business.get(owner = user)
 
-    return {
+    return StreamingResponse(
+        export_products(business, format),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'}
+    )
+
+
+@app.get("/products/search")
+async def product_search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    category: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=MAX_CANDIDATES),
+    image_size: Optional[int] = None,
+):
+    ids, total, facets, exact = await search_products(q, category=category, limit=limit, offset=offset)
+
+    accept = request.headers.get("accept")
+    products = {product.id: product for product in await Product.filter(id__in=ids)}
+    data = []
+    for id in ids:
+        if id in products:
+            product = products[id]
+            product.product_image = resolve_image(product.product_image, image_size, accept)
+            data.append(product_row(product))
+
+    return FastJSONResponse({
         "status":"ok",
-        "data":{
-            "product_details": response,
-            "business_details":{
-                "name": business.business_name,
-                "city": business.city,
-                "region":business.region,
-                "description":business.business_description,
-                "logo":business.logo,
-                "owner_id":owner.id,
-                "email":owner.email,
-                "join_date":owner.join_date.strftime("%b %d %Y")
+        "data":data,
+        "total":total,
+        "exact":exact,
+        "facets":{"category":facets}
+    }, headers={"Vary":"Accept"})
+
+
+@app.get("/product")
+#one page query, none when served from the response cache
+@query_budget(1)
+async def get_product(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    category: Optional[str] = None,
+    name: Optional[str] = None,
+    sort: str = "newest",
+    format: str = "json",
+    image_size: Optional[int] = None,
+):
+    queryset = catalog_queryset(sort=sort, category=category, name=name)
+
+    #bulk consumers get the whole filtered catalog as ndjson, one page at a time
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_products(queryset, sort=sort, cursor=cursor),
+            media_type="application/x-ndjson"
+        )
+
+    accept = request.headers.get("accept")
+    key = cache_key("/product", sort, category, name, cursor, limit, image_size, accepted_formats(accept))
+
+    async def build():
+        products, next_cursor = await product_page(queryset, sort=sort, cursor=cursor, limit=limit)
+        data = []
+        for product in products:
+            product.product_image = resolve_image(product.product_image, image_size, accept)
+            data.append(product_row(product))
+        payload = {
+            "status":"ok",
+            "data":data,
+            "next_cursor":next_cursor
             }
+        return payload, catalog_tags(category, [product.id for product in products])
+
+    #repeat reads are served from the serialized response, or as a 304 when the client has it
+    return await response_cache.respond(request, key, build, headers={"Vary":"Accept"})
+
+
+@app.get("/product/{id}")
+#the product joined with its business and owner
+@query_budget(1)
+async def get_product(id:int, request: Request, image_size: Optional[int] = None):
+    accept = request.headers.get("accept")
+    key = cache_key("/product/{id}", id, image_size, accepted_formats(accept))
+
+    async def build():
+        product = await get_product_detail(id)
+        payload = {
+            "status":"ok",
+            "data":product_detail_response(product, image_size, accept)
         }
-    }
+        #the payload also shows the business and its owner
+        tags = [f"product:{id}", f"business:{product.business_id}", f"user:{product.business.owner_id}"]
+        return payload, tags
+
+    return await response_cache.respond(request, key, build, headers={"Vary":"Accept"})
+
+@app.get("/deals")
+#one page of deals joined with their products, none when served from the response cache
+@query_budget(1)
+async def get_deals(
+    request: Request,
+    category: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    image_size: Optional[int] = None,
+):
+    accept = request.headers.get("accept")
+    #offers expire by the day, a new day gets new entries
+    key = cache_key("/deals", today(), category, cursor, limit, image_size, accepted_formats(accept))
+
+    async def build():
+        products, next_cursor = await deals_page(category=category, cursor=cursor, limit=limit)
+        data = []
+        for product in products:
+            product.product_image = resolve_image(product.product_image, image_size, accept)
+            data.append(product_row(product))
+        payload = {
+            "status":"ok",
+            "data":data,
+            "next_cursor":next_cursor
+            }
+        return payload, catalog_tags(category, [product.id for product in products]) + ["deals"]
+
+    return await response_cache.respond(request, key, build, headers={"Vary":"Accept"})
+
+@app.get("/analytics/pricing")
+async def get_pricing_analytics(
+    request: Request,
+    category: Optional[str] = None,
+    bins: int = Query(10, ge=1, le=100),
+    user: user_pydantic = Depends(get_current_user),
+):
+    #only ever the user's own business, a summary scans every product in its scope
+    business = await Business.get(owner = user)
+    key = cache_key("/analytics/pricing", business.id, category, bins)
+
+    async def build():
+        columns = await load_price_columns(category=category, business_id=business.id)
+        payload = {
+            "status":"ok",
+            "data":pricing_summary(columns, bins)
+            }
+        #product edits don't drop it, so a scope is scanned at most once per cache ttl;
+        #a reprice, which rewrites the prices wholesale, does
+        return payload, [f"pricing:{business.id}"]
+
+    return await response_cache.respond(request, key, build)
 
 #delete functions
 
 @app.delete("/products/{id}")
 async def delete_product(id:int, user:user_pydantic= Depends(get_current_user)):
-    product = await Product.get(id = id)
-    business = await product.business
-    owner = await business.owner
+    product = await Product.get_or_none(id = id).select_related("business")
 
     if product is None:
        raise HTTPException(
@@ -405,8 +662,8 @@ async def delete_product(id:int, user:user_pydantic= Depends(get_current_user)):
             headers = {"WWW-Authenticate":"Bearer"}
         )
 
-    elif user == owner:
-        product.delete()
+    elif product.business.owner_id == user.id:
+        await product.delete()
 
     else:
         raise HTTPException(
@@ -424,76 +681,120 @@ async def delete_product(id:int, user:user_pydantic= Depends(get_current_user)):
 
 @app.get("/login/google")
 async def login_google():
+    state, nonce = create_state()
     return {
-        "url": f"https://accounts.google.com/o/oauth2/auth?response_type=code&client_id={GOOGLE_CLIENT_ID}&redirect_uri={GOOGLE_REDIRECT_URI}&scope=openid%20profile%20email&access_type=offline"
+        "url": await google_oauth.authorization_url(state, nonce)
     }
 
 @app.get("/auth/google")
-async def auth_google(request: Request):
-    code = request.query_params.get("code")
-    token_url = "https://accounts.google.com/o/oauth2/token"
-    data = {
-        "code": code,
-        "client_id": GOOGLE_CLIENT_ID,
-        "client_secret": GOOGLE_CLIENT_SECRET,
-        "redirect_uri": GOOGLE_REDIRECT_URI,
-        "grant_type": "authorization_code",
-    }
-    response = requests.post(token_url, data=data)
-    access_token = response.json().get("access_token")
-    user_info = requests.get("https://www.googleapis.com/oauth2/v1/userinfo", headers={"Authorization": f"Bearer {access_token}"})
-    print(response)
-    print(user_info)
+async def auth_google(code: Optional[str] = None, state: Optional[str] = None, error: Optional[str] = None):
+    if error or not code or not state:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Google sign-in failed: {error or 'missing code or state'}"
+        )
+
+    #one pooled round trip for the code, the id token is verified against the cached keys
+    claims = await google_oauth.authenticate(code, state)
+    user = await get_or_create_google_user(claims)
 
-    return user_info.json()
+    return create_token_pair(user)
 
 @app.put("/product/{id}")
 async def update_product(id:int,update_info:product_pydanticIn,user:user_pydantic = Depends(get_current_user)):
-    product = await Product.get(id = id)
-    owner = await product.business
+    #the owner id is on the business row, no need to load the user
+    product = await Product.get(id = id).select_related("business")
+    old_category = product.category
 
     update_info = update_info.dict(exclude_unset=True)
     update_info["date_published"] = datetime.utcnow()
 
-    if user == owner and update_info["original_price"] != 0 :
+    if product.business.owner_id == user.id and update_info["original_price"] != 0 :
 
         update_info["percentage_discount"] = ((update_info["original_price"]-update_info["new_price"])/update_info["original_price"])*100
 
         product = await product.update_from_dict(update_info)
-        response = await product_pydantic.from_tortoise_orm(product)
 
         await product.save()
+        #the save signal covers the new category, pages of the old one lose the product too
+        if product.category != old_category:
+            response_cache.invalidate(f"category:{old_category}")
 
-        return {
+        return FastJSONResponse({
             "status":"ok",
-            "data":response
-        }
+            "data":product_row(product)
+        })
     
     else:
 
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authorised to perform this function"
+            detail="Not authorised to perform this function",
             headers={"WWW-Authenticate":"Bearer"}
         )
 
 
+@app.get("/business/{id}/products")
+#one page query, and whether the business exists when the first page is empty
+@query_budget(2)
+async def get_business_products(
+    id: int,
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    category: Optional[str] = None,
+    sort: str = "newest",
+    image_size: Optional[int] = None,
+):
+    queryset = catalog_queryset(sort=sort, category=category, business_id=id)
+    accept = request.headers.get("accept")
+    key = cache_key("/business/{id}/products", id, sort, category, cursor, limit, image_size, accepted_formats(accept))
+
+    async def build():
+        products, next_cursor = await product_page(queryset, sort=sort, cursor=cursor, limit=limit)
+        if not products and cursor is None and not await Business.filter(id=id).using_db(read_db()).exists():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Business does not exist"
+            )
+        data = []
+        for product in products:
+            product.product_image = resolve_image(product.product_image, image_size, accept)
+            data.append(product_row(product))
+        payload = {
+            "status":"ok",
+            "data":data,
+            "next_cursor":next_cursor
+            }
+        return payload, catalog_tags(category, [product.id for product in products], business_id=id)
+
+    return await response_cache.respond(request, key, build, headers={"Vary":"Accept"})
+
+
+@app.get("/business/{id}/stats")
+#the summary row, and whether the business exists when it has none
+@query_budget(2)
+async def get_business_statistics(id: int):
+    return FastJSONResponse({
+        "status":"ok",
+        "data":await get_business_stats(id)
+    })
+
+
 @app.put("/business/{id}")
 async def update_business(id:int,update_business:business_pydanticIn,user:user_pydantic = Depends(get_current_user)):
 
     update_business = update_business.dict()
 
     business = await Business.get(id=id)
-    business_owner = await business.owner
 
-    if user == business_owner:
+    if business.owner_id == user.id:
         await business.update_from_dict(update_business)
-        business.save()
-        response = await business_pydantic.from_tortoise_orm(business)
-        return {
+        await business.save()
+        return FastJSONResponse({
             "status":"ok",
-            "data":response
-        }
+            "data":business_row(business)
+        })
     
     else:
         raise HTTPException(
@@ -0,0 +1,313 @@
+"""Per-request database and timing instrumentation.
+
+``MetricsMiddleware`` opens a ``RequestMetrics`` for every HTTP request.
+``instrument_db`` wraps the tortoise client methods every statement goes
+through, adding each query and its time to the open request.
+``TimedRoute`` splits the route's time into the endpoint itself and the
+serialization of what it returned. Every response gets a ``Server-Timing``
+header:
+
+    Server-Timing: db;dur=1.42;desc="3 queries", handler;dur=2.10, serialize;dur=0.35, total;dur=2.87
+
+and ``RequestStats.render`` exposes per-route histograms in the Prometheus
+text format for ``/metrics``. The numbers are per worker process; Prometheus
+sums them across the targets it scrapes.
+
+A route can declare how many queries it may run with ``@query_budget(n)``,
+and ``QUERY_BUDGET`` sets one for every other route. Requests over budget
+are logged; with ``QUERY_BUDGET_STRICT`` they raise ``QueryBudgetExceeded``
+so a test client running the app fails loudly.
+"""
+import functools
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+from tortoise import BaseDBAsyncClient
+
+from config import get_bool, get_int
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING = get_bool("SERVER_TIMING", True)
+#0 leaves routes without their own @query_budget unchecked
+QUERY_BUDGET = get_int("QUERY_BUDGET", 0)
+QUERY_BUDGET_STRICT = get_bool("QUERY_BUDGET_STRICT", False)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+#every statement tortoise runs goes through one of these
+DB_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many", "execute_script")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@dataclass
+class RequestMetrics:
+    queries: int = 0
+    db_time: float = 0.0
+    handler_time: float = 0.0
+    serialize_time: float = 0.0
+    handler_done: Optional[float] = None
+    budget: Optional[int] = None
+
+    def server_timing(self, total: float) -> str:
+        return (
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries", '
+            f"handler;dur={self.handler_time * 1000:.2f}, "
+            f"serialize;dur={self.serialize_time * 1000:.2f}, "
+            f"total;dur={total * 1000:.2f}"
+        )
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+#a client method calling another one is still a single statement
+_in_query: ContextVar[bool] = ContextVar("in_query", default=False)
+
+
+def current_metrics() -> Optional[RequestMetrics]:
+    return _current.get()
+
+
+def _timed_query(method: Callable) -> Callable:
+    @functools.wraps(method)
+    async def timed(*args, **kwargs):
+        metrics = _current.get()
+        if metrics is None or _in_query.get():
+            return await method(*args, **kwargs)
+        token = _in_query.set(True)
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            metrics.db_time += time.perf_counter() - started
+            metrics.queries += 1
+            _in_query.reset(token)
+
+    timed.instrumented = True
+    return timed
+
+
+def _subclasses(cls: type):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def instrument_db() -> None:
+    """Count and time the statements of every loaded tortoise client class.
+
+    Call it once the connections are initialised, so the backend modules,
+    transaction wrappers included, are imported. Calling it again is harmless.
+    """
+    for cls in _subclasses(BaseDBAsyncClient):
+        for name in DB_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "instrumented", False):
+                setattr(cls, name, _timed_query(method))
+
+
+def _handler_done(started: float) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        now = time.perf_counter()
+        metrics.handler_time += now - started
+        metrics.handler_done = now
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    # keep sync endpoints sync, FastAPI runs them in the threadpool
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _handler_done(started)
+    else:
+        @functools.wraps(endpoint)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _handler_done(started)
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """An ``APIRoute`` that times its endpoint and the serialization after it."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        budget = getattr(self.endpoint, "query_budget", None)
+
+        async def timed_handler(request):
+            metrics = _current.get()
+            if metrics is not None:
+                metrics.budget = budget
+            response = await handler(request)
+            if metrics is not None and metrics.handler_done is not None:
+                metrics.serialize_time += time.perf_counter() - metrics.handler_done
+            return response
+
+        return timed_handler
+
+
+def query_budget(queries: int) -> Callable:
+    """Declare the most queries a route's request may run."""
+    def decorate(endpoint: Callable) -> Callable:
+        endpoint.query_budget = queries
+        return endpoint
+    return decorate
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list:
+        lines = []
+        cumulative = 0
+        for bucket, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bucket}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RequestStats:
+    """Per-route counters and histograms of everything the middleware measured."""
+
+    HISTOGRAMS = (
+        ("http_request_duration_seconds", "Time until the response was sent.", LATENCY_BUCKETS),
+        ("http_request_handler_seconds", "Time spent in the endpoint.", LATENCY_BUCKETS),
+        ("http_request_serialize_seconds", "Time spent serializing the endpoint's result.", LATENCY_BUCKETS),
+        ("http_request_db_seconds", "Time spent waiting on the database.", LATENCY_BUCKETS),
+        ("http_request_db_queries", "Database queries per request.", QUERY_BUCKETS),
+    )
+
+    def __init__(self):
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.over_budget: Dict[Tuple[str, str], int] = {}
+        self.histograms: Dict[str, Dict[Tuple[str, str], Histogram]] = {name: {} for name, _, _ in self.HISTOGRAMS}
+        self._buckets = {name: buckets for name, _, buckets in self.HISTOGRAMS}
+
+    def _observe(self, name: str, key: Tuple[str, str], value: float) -> None:
+        histogram = self.histograms[name].get(key)
+        if histogram is None:
+            histogram = self.histograms[name][key] = Histogram(self._buckets[name])
+        histogram.observe(value)
+
+    def observe(self, method: str, route: str, status_code: int, metrics: RequestMetrics, total: float) -> None:
+        key = (method, route)
+        self.requests[(method, route, status_code)] = self.requests.get((method, route, status_code), 0) + 1
+        self._observe("http_request_duration_seconds", key, total)
+        self._observe("http_request_handler_seconds", key, metrics.handler_time)
+        self._observe("http_request_serialize_seconds", key, metrics.serialize_time)
+        self._observe("http_request_db_seconds", key, metrics.db_time)
+        self._observe("http_request_db_queries", key, metrics.queries)
+
+    def exceeded(self, method: str, route: str) -> None:
+        self.over_budget[(method, route)] = self.over_budget.get((method, route), 0) + 1
+
+    def clear(self) -> None:
+        self.__init__()
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_total Requests handled, by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status_code), count in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status_code}"}} {count}')
+        lines += [
+            "# HELP http_request_query_budget_exceeded_total Requests that ran more queries than their budget.",
+            "# TYPE http_request_query_budget_exceeded_total counter",
+        ]
+        for (method, route), count in sorted(self.over_budget.items()):
+            lines.append(f'http_request_query_budget_exceeded_total{{method="{method}",route="{route}"}} {count}')
+        for name, description, _ in self.HISTOGRAMS:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+            for (method, route), histogram in sorted(self.histograms[name].items()):
+                lines += histogram.render(name, f'method="{method}",route="{route}"')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so the request's context reaches the endpoint and its queries."""
+
+    def __init__(
+        self,
+        app,
+        stats: Optional[RequestStats] = None,
+        server_timing: bool = SERVER_TIMING,
+        budget: int = QUERY_BUDGET,
+        strict: bool = QUERY_BUDGET_STRICT,
+    ):
+        self.app = app
+        self.stats = stats if stats is not None else request_stats
+        self.server_timing = server_timing
+        self.budget = budget
+        self.strict = strict
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", metrics.server_timing(time.perf_counter() - started)
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            # the route template keeps the label set small, mounts report their prefix
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.stats.observe(scope["method"], route, status_code, metrics, time.perf_counter() - started)
+
+        budget = metrics.budget if metrics.budget is not None else (self.budget or None)
+        if budget is not None and metrics.queries > budget:
+            self.stats.exceeded(scope["method"], route)
+            message = f"{scope['method']} {route} ran {metrics.queries} queries, its budget is {budget}"
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+
+request_stats = RequestStats()
@@ -0,0 +1,187 @@
+"""Versioned schema migrations.
+
+Migrations are the numbered scripts in ``migrations/``, e.g.
+``0002_product_date_published.py``. Each one defines
+``async def upgrade(connection)`` and runs once per database, in version
+order, in its own transaction together with its row in ``schema_migrations``.
+Run them out of band before starting or upgrading the app, from the
+``ecommerce`` directory:
+
+    python -m migrate upgrade             apply everything pending
+    python -m migrate upgrade --to 0003   stop after 0003
+    python -m migrate status              list applied and pending versions
+    python -m migrate new add_some_index  create the next numbered script
+    python -m migrate repair              rebuild the search index and the deals table
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import ModuleType
+from typing import List, Optional, Set
+
+from tortoise import BaseDBAsyncClient, Tortoise, connections
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+
+from database import TORTOISE_ORM, WRITE_CONNECTION
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.py$")
+MIGRATIONS_TABLE = "schema_migrations"
+
+TEMPLATE = '''"""{description}"""
+
+
+async def upgrade(connection):
+    pass
+'''
+
+
+@dataclass
+class Migration:
+    version: str
+    name: str
+
+    @property
+    def module(self) -> ModuleType:
+        return importlib.import_module(f"migrations.{self.version}_{self.name}")
+
+
+def dialect(connection: BaseDBAsyncClient) -> str:
+    return connection.capabilities.dialect
+
+
+def sql(connection: BaseDBAsyncClient, query: str) -> str:
+    """Write queries with ``?`` placeholders; postgres drivers want ``$1, $2, ...``."""
+    if dialect(connection) != "postgres":
+        return query
+    count = iter(range(1, query.count("?") + 1))
+    return re.sub(r"\?", lambda _: f"${next(count)}", query)
+
+
+async def has_column(connection: BaseDBAsyncClient, table: str, column: str) -> bool:
+    if dialect(connection) == "sqlite":
+        _, rows = await connection.execute_query(f'PRAGMA table_info("{table}")')
+        return any(row[1] == column for row in rows)
+    _, rows = await connection.execute_query(
+        sql(connection, "SELECT 1 FROM information_schema.columns WHERE table_name = ? AND column_name = ?"),
+        [table, column],
+    )
+    return bool(rows)
+
+
+def discover() -> List[Migration]:
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append(Migration(version=match.group(1), name=match.group(2)))
+    return migrations
+
+
+async def applied_versions(connection: BaseDBAsyncClient) -> Set[str]:
+    await connection.execute_script(
+        f'CREATE TABLE IF NOT EXISTS "{MIGRATIONS_TABLE}" ('
+        '"version" VARCHAR(20) NOT NULL PRIMARY KEY, '
+        '"name" VARCHAR(200) NOT NULL, '
+        '"applied_at" VARCHAR(40) NOT NULL)'
+    )
+    _, rows = await connection.execute_query(f'SELECT "version" FROM "{MIGRATIONS_TABLE}"')
+    return {row[0] for row in rows}
+
+
+async def pending_migrations(connection: Optional[BaseDBAsyncClient] = None) -> List[Migration]:
+    connection = connection or connections.get(WRITE_CONNECTION)
+    applied = await applied_versions(connection)
+    return [migration for migration in discover() if migration.version not in applied]
+
+
+async def upgrade(connection: Optional[BaseDBAsyncClient] = None, target: Optional[str] = None) -> List[str]:
+    """Apply pending migrations up to and including ``target``; returns the versions applied."""
+    connection = connection or connections.get(WRITE_CONNECTION)
+    applied = []
+    for migration in await pending_migrations(connection):
+        if target is not None and migration.version > target:
+            break
+        try:
+            async with in_transaction(connection.connection_name) as transaction:
+                # claim the version first, so two deploys running at once apply it once
+                await transaction.execute_query(
+                    sql(transaction, f'INSERT INTO "{MIGRATIONS_TABLE}" ("version", "name", "applied_at") VALUES (?, ?, ?)'),
+                    [migration.version, migration.name, datetime.now(timezone.utc).isoformat()],
+                )
+                await migration.module.upgrade(transaction)
+        except IntegrityError:
+            if migration.version in await applied_versions(connection):
+                logger.info(f"Migration {migration.version} was applied by another process")
+                continue
+            raise
+        logger.info(f"Applied migration {migration.version}_{migration.name}")
+        applied.append(migration.version)
+    return applied
+
+
+def new(name: str) -> str:
+    slug = re.sub(r"\W+", "_", name.strip().lower()).strip("_")
+    if not slug:
+        raise ValueError("Migration name must contain a word")
+    versions = [int(migration.version) for migration in discover()]
+    version = f"{(max(versions) if versions else 0) + 1:04d}"
+    path = os.path.join(MIGRATIONS_DIR, f"{version}_{slug}.py")
+    with open(path, "x") as out:
+        out.write(TEMPLATE.format(description=name.strip().capitalize() + "."))
+    return path
+
+
+async def run(args) -> None:
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        if args.command == "upgrade":
+            applied = await upgrade(target=args.to)
+            print(f"Applied {len(applied)} migration(s)" + (f": {', '.join(applied)}" if applied else ""))
+        elif args.command == "repair":
+            # both import this module, so not at the top
+            from deals import rebuild_deals
+            from search import rebuild_search_index
+
+            await rebuild_search_index()
+            await rebuild_deals()
+            print("Rebuilt the product search index and the active deals")
+        else:
+            connection = connections.get(WRITE_CONNECTION)
+            applied = await applied_versions(connection)
+            for migration in discover():
+                state = "applied" if migration.version in applied else "pending"
+                print(f"{migration.version}  {state:8} {migration.name}")
+    finally:
+        await Tortoise.close_connections()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m migrate", description="Apply versioned schema migrations.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = commands.add_parser("upgrade", help="apply pending migrations")
+    upgrade_parser.add_argument("--to", help="last version to apply")
+    commands.add_parser("status", help="list applied and pending migrations")
+    new_parser = commands.add_parser("new", help="create the next numbered migration script")
+    new_parser.add_argument("name")
+    commands.add_parser("repair", help="rebuild tables derived from the products after writes that bypassed the app")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "new":
+        print(new(args.name))
+        return
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
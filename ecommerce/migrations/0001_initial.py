@@ -0,0 +1,80 @@
+"""Users, businesses and products as the app first shipped them.
+
+Every statement is IF NOT EXISTS, so databases created by the old
+schema generation at startup go through this unchanged.
+"""
+from migrate import dialect
+
+SQLITE = """
+CREATE TABLE IF NOT EXISTS "user" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "username" VARCHAR(20) NOT NULL UNIQUE,
+    "email" VARCHAR(200) NOT NULL UNIQUE,
+    "email_sent" INT NOT NULL DEFAULT 0,
+    "password" VARCHAR(100) NOT NULL,
+    "is_verified" INT NOT NULL DEFAULT 0,
+    "join_date" TIMESTAMP NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "business" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "business_name" VARCHAR(20) NOT NULL UNIQUE,
+    "city" VARCHAR(100) NOT NULL DEFAULT 'Unspecified',
+    "region" VARCHAR(100) NOT NULL DEFAULT 'Unspecified',
+    "business_description" TEXT,
+    "logo" VARCHAR(200) NOT NULL DEFAULT 'default.jpg',
+    "owner_id" INT NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS "product" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "name" VARCHAR(100) NOT NULL,
+    "category" VARCHAR(30) NOT NULL,
+    "original_price" VARCHAR(40) NOT NULL,
+    "new_price" VARCHAR(40) NOT NULL,
+    "percentage_discount" INT NOT NULL,
+    "offer_expiration_date" DATE NOT NULL,
+    "product_image" VARCHAR(200) NOT NULL DEFAULT 'productDefault.jpg',
+    "date_published" TIMESTAMP NOT NULL,
+    "business_id" INT NOT NULL REFERENCES "business" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_product_name_683352" ON "product" ("name");
+CREATE INDEX IF NOT EXISTS "idx_product_categor_5402db" ON "product" ("category");
+"""
+
+POSTGRES = """
+CREATE TABLE IF NOT EXISTS "user" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "username" VARCHAR(20) NOT NULL UNIQUE,
+    "email" VARCHAR(200) NOT NULL UNIQUE,
+    "email_sent" BOOL NOT NULL DEFAULT FALSE,
+    "password" VARCHAR(100) NOT NULL,
+    "is_verified" BOOL NOT NULL DEFAULT FALSE,
+    "join_date" TIMESTAMPTZ NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "business" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "business_name" VARCHAR(20) NOT NULL UNIQUE,
+    "city" VARCHAR(100) NOT NULL DEFAULT 'Unspecified',
+    "region" VARCHAR(100) NOT NULL DEFAULT 'Unspecified',
+    "business_description" TEXT,
+    "logo" VARCHAR(200) NOT NULL DEFAULT 'default.jpg',
+    "owner_id" INT NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS "product" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "name" VARCHAR(100) NOT NULL,
+    "category" VARCHAR(30) NOT NULL,
+    "original_price" DECIMAL(12,2) NOT NULL,
+    "new_price" DECIMAL(12,2) NOT NULL,
+    "percentage_discount" INT NOT NULL,
+    "offer_expiration_date" DATE NOT NULL,
+    "product_image" VARCHAR(200) NOT NULL DEFAULT 'productDefault.jpg',
+    "date_published" TIMESTAMPTZ NOT NULL,
+    "business_id" INT NOT NULL REFERENCES "business" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_product_name_683352" ON "product" ("name");
+CREATE INDEX IF NOT EXISTS "idx_product_categor_5402db" ON "product" ("category");
+"""
+
+
+async def upgrade(connection):
+    await connection.execute_script(POSTGRES if dialect(connection) == "postgres" else SQLITE)
@@ -0,0 +1,25 @@
+"""Add product.date_published to databases created before the column existed.
+
+Existing products are stamped with the time of the migration.
+"""
+from datetime import datetime, timezone
+
+from migrate import dialect, has_column, sql
+
+
+async def upgrade(connection):
+    if await has_column(connection, "product", "date_published"):
+        return
+
+    if dialect(connection) == "postgres":
+        await connection.execute_script(
+            'ALTER TABLE "product" ADD COLUMN "date_published" TIMESTAMPTZ NOT NULL DEFAULT now()'
+        )
+        return
+
+    # sqlite only takes constant defaults when adding a column
+    now = datetime.now(timezone.utc).isoformat(sep=" ")
+    await connection.execute_script(
+        'ALTER TABLE "product" ADD COLUMN "date_published" TIMESTAMP NOT NULL DEFAULT \'1970-01-01 00:00:00+00:00\''
+    )
+    await connection.execute_query(sql(connection, 'UPDATE "product" SET "date_published" = ?'), [now])
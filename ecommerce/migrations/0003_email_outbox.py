@@ -0,0 +1,40 @@
+"""The outbox the email worker delivers verification mail from."""
+from migrate import dialect
+
+SQLITE = """
+CREATE TABLE IF NOT EXISTS "emailoutbox" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "kind" VARCHAR(30) NOT NULL,
+    "recipient" VARCHAR(200) NOT NULL,
+    "dedupe_key" VARCHAR(100) NOT NULL UNIQUE,
+    "status" VARCHAR(10) NOT NULL DEFAULT 'pending',
+    "attempts" INT NOT NULL DEFAULT 0,
+    "next_attempt_at" TIMESTAMP NOT NULL,
+    "last_error" TEXT,
+    "created_at" TIMESTAMP NOT NULL,
+    "sent_at" TIMESTAMP,
+    "user_id" INT REFERENCES "user" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_emailoutbox_next_at_0ac95e" ON "emailoutbox" ("next_attempt_at");
+"""
+
+POSTGRES = """
+CREATE TABLE IF NOT EXISTS "emailoutbox" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "kind" VARCHAR(30) NOT NULL,
+    "recipient" VARCHAR(200) NOT NULL,
+    "dedupe_key" VARCHAR(100) NOT NULL UNIQUE,
+    "status" VARCHAR(10) NOT NULL DEFAULT 'pending',
+    "attempts" INT NOT NULL DEFAULT 0,
+    "next_attempt_at" TIMESTAMPTZ NOT NULL,
+    "last_error" TEXT,
+    "created_at" TIMESTAMPTZ NOT NULL,
+    "sent_at" TIMESTAMPTZ,
+    "user_id" INT REFERENCES "user" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_emailoutbox_next_at_0ac95e" ON "emailoutbox" ("next_attempt_at");
+"""
+
+
+async def upgrade(connection):
+    await connection.execute_script(POSTGRES if dialect(connection) == "postgres" else SQLITE)
@@ -0,0 +1,21 @@
+"""The FTS5 index behind /products/search, filled from the existing products.
+
+Only sqlite has it; on other databases the endpoint answers 503.
+"""
+from migrate import dialect
+
+
+async def upgrade(connection):
+    if dialect(connection) != "sqlite":
+        return
+    await connection.execute_script("""
+CREATE VIRTUAL TABLE IF NOT EXISTS "product_search" USING fts5(
+    name, category, business_name,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+DELETE FROM "product_search";
+INSERT INTO "product_search"(rowid, name, category, business_name)
+SELECT p."id", p."name", p."category", b."business_name"
+FROM "product" p JOIN "business" b ON b."id" = p."business_id";
+""")
@@ -0,0 +1,14 @@
+"""Indexes for the hot product reads.
+
+- business_id: a business's products (export, bulk import, ownership checks)
+- (category, date_published): newest-first listings filtered by category
+- date_published: the unfiltered newest-first listing
+"""
+
+
+async def upgrade(connection):
+    await connection.execute_script("""
+CREATE INDEX IF NOT EXISTS "idx_product_business_id" ON "product" ("business_id");
+CREATE INDEX IF NOT EXISTS "idx_product_category_published" ON "product" ("category", "date_published");
+CREATE INDEX IF NOT EXISTS "idx_product_published" ON "product" ("date_published");
+""")
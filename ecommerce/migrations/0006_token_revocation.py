@@ -0,0 +1,32 @@
+"""user.token_version and the revocation table behind access/refresh tokens."""
+from migrate import dialect, has_column
+
+SQLITE = """
+CREATE TABLE IF NOT EXISTS "revokedtoken" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "jti" VARCHAR(40) UNIQUE,
+    "min_version" INT,
+    "expires_at" TIMESTAMP NOT NULL,
+    "created_at" TIMESTAMP NOT NULL,
+    "user_id" INT NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_revokedtoken_expires_at" ON "revokedtoken" ("expires_at");
+"""
+
+POSTGRES = """
+CREATE TABLE IF NOT EXISTS "revokedtoken" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "jti" VARCHAR(40) UNIQUE,
+    "min_version" INT,
+    "expires_at" TIMESTAMPTZ NOT NULL,
+    "created_at" TIMESTAMPTZ NOT NULL,
+    "user_id" INT NOT NULL REFERENCES "user" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_revokedtoken_expires_at" ON "revokedtoken" ("expires_at");
+"""
+
+
+async def upgrade(connection):
+    if not await has_column(connection, "user", "token_version"):
+        await connection.execute_script('ALTER TABLE "user" ADD COLUMN "token_version" INT NOT NULL DEFAULT 0')
+    await connection.execute_script(POSTGRES if dialect(connection) == "postgres" else SQLITE)
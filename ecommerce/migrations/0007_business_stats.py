@@ -0,0 +1,91 @@
+"""Per-business product statistics, filled from the existing products, and
+the index behind a business's newest-first product pages.
+"""
+from migrate import dialect
+
+SQLITE = """
+CREATE TABLE IF NOT EXISTS "businessstats" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "product_count" INT NOT NULL DEFAULT 0,
+    "avg_discount" REAL NOT NULL DEFAULT 0,
+    "max_discount" INT,
+    "min_price" VARCHAR(40),
+    "max_price" VARCHAR(40),
+    "min_original_price" VARCHAR(40),
+    "max_original_price" VARCHAR(40),
+    "category_counts" JSON NOT NULL,
+    "updated_at" TIMESTAMP NOT NULL,
+    "business_id" INT NOT NULL UNIQUE REFERENCES "business" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_product_business_published" ON "product" ("business_id", "date_published");
+DELETE FROM "businessstats";
+INSERT INTO "businessstats" (
+    "business_id", "product_count", "avg_discount", "max_discount", "min_price", "max_price",
+    "min_original_price", "max_original_price", "category_counts", "updated_at"
+)
+SELECT
+    b."id",
+    coalesce(sum(c."products"), 0),
+    coalesce(sum(c."discount_sum") * 1.0 / sum(c."products"), 0),
+    max(c."max_discount"),
+    min(c."min_price"), max(c."max_price"), min(c."min_original_price"), max(c."max_original_price"),
+    coalesce(json_group_object(c."category", c."products") FILTER (WHERE c."category" IS NOT NULL), '{}'),
+    CURRENT_TIMESTAMP
+FROM "business" b
+LEFT JOIN (
+    SELECT
+        "business_id", "category", count(*) AS "products",
+        sum("percentage_discount") AS "discount_sum", max("percentage_discount") AS "max_discount",
+        min(CAST("new_price" AS REAL)) AS "min_price", max(CAST("new_price" AS REAL)) AS "max_price",
+        min(CAST("original_price" AS REAL)) AS "min_original_price",
+        max(CAST("original_price" AS REAL)) AS "max_original_price"
+    FROM "product"
+    GROUP BY "business_id", "category"
+) c ON c."business_id" = b."id"
+GROUP BY b."id";
+"""
+
+POSTGRES = """
+CREATE TABLE IF NOT EXISTS "businessstats" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "product_count" INT NOT NULL DEFAULT 0,
+    "avg_discount" DOUBLE PRECISION NOT NULL DEFAULT 0,
+    "max_discount" INT,
+    "min_price" DECIMAL(12,2),
+    "max_price" DECIMAL(12,2),
+    "min_original_price" DECIMAL(12,2),
+    "max_original_price" DECIMAL(12,2),
+    "category_counts" JSONB NOT NULL,
+    "updated_at" TIMESTAMPTZ NOT NULL,
+    "business_id" INT NOT NULL UNIQUE REFERENCES "business" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_product_business_published" ON "product" ("business_id", "date_published");
+DELETE FROM "businessstats";
+INSERT INTO "businessstats" (
+    "business_id", "product_count", "avg_discount", "max_discount", "min_price", "max_price",
+    "min_original_price", "max_original_price", "category_counts", "updated_at"
+)
+SELECT
+    b."id",
+    coalesce(sum(c."products"), 0),
+    coalesce(sum(c."discount_sum") * 1.0 / sum(c."products"), 0),
+    max(c."max_discount"),
+    min(c."min_price"), max(c."max_price"), min(c."min_original_price"), max(c."max_original_price"),
+    coalesce(jsonb_object_agg(c."category", c."products") FILTER (WHERE c."category" IS NOT NULL), '{}'::jsonb),
+    CURRENT_TIMESTAMP
+FROM "business" b
+LEFT JOIN (
+    SELECT
+        "business_id", "category", count(*) AS "products",
+        sum("percentage_discount") AS "discount_sum", max("percentage_discount") AS "max_discount",
+        min("new_price") AS "min_price", max("new_price") AS "max_price",
+        min("original_price") AS "min_original_price", max("original_price") AS "max_original_price"
+    FROM "product"
+    GROUP BY "business_id", "category"
+) c ON c."business_id" = b."id"
+GROUP BY b."id";
+"""
+
+
+async def upgrade(connection):
+    await connection.execute_script(POSTGRES if dialect(connection) == "postgres" else SQLITE)
@@ -0,0 +1,37 @@
+"""The table behind /deals, filled with the offers that are still running."""
+from migrate import dialect
+
+SQLITE = """
+CREATE TABLE IF NOT EXISTS "activedeal" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "category" VARCHAR(30) NOT NULL,
+    "percentage_discount" INT NOT NULL,
+    "offer_expiration_date" DATE NOT NULL,
+    "product_id" INT NOT NULL UNIQUE REFERENCES "product" ("id") ON DELETE CASCADE
+);
+"""
+
+POSTGRES = """
+CREATE TABLE IF NOT EXISTS "activedeal" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "category" VARCHAR(30) NOT NULL,
+    "percentage_discount" INT NOT NULL,
+    "offer_expiration_date" DATE NOT NULL,
+    "product_id" INT NOT NULL UNIQUE REFERENCES "product" ("id") ON DELETE CASCADE
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS "idx_activedeal_expiration" ON "activedeal" ("offer_expiration_date");
+CREATE INDEX IF NOT EXISTS "idx_activedeal_discount" ON "activedeal" ("percentage_discount", "product_id");
+CREATE INDEX IF NOT EXISTS "idx_activedeal_category_discount"
+    ON "activedeal" ("category", "percentage_discount", "product_id");
+DELETE FROM "activedeal";
+INSERT INTO "activedeal" ("product_id", "category", "percentage_discount", "offer_expiration_date")
+SELECT "id", "category", "percentage_discount", "offer_expiration_date" FROM "product"
+WHERE "offer_expiration_date" >= CURRENT_DATE;
+"""
+
+
+async def upgrade(connection):
+    await connection.execute_script((POSTGRES if dialect(connection) == "postgres" else SQLITE) + INDEXES)
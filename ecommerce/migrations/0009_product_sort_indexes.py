@@ -0,0 +1,19 @@
+"""Indexes for the price and discount sorts of the product listings.
+
+- (price, id) and (discount, id): the unfiltered listing sorted either way
+- the same behind category: listings filtered by category
+
+The price index is on the expression catalog.PRICE_SORT orders by, which
+has to match it exactly for the index to be used.
+"""
+
+PRICE = 'CAST("new_price" AS DOUBLE PRECISION)'
+
+
+async def upgrade(connection):
+    await connection.execute_script(f"""
+CREATE INDEX IF NOT EXISTS "idx_product_price" ON "product" (({PRICE}), "id");
+CREATE INDEX IF NOT EXISTS "idx_product_discount" ON "product" ("percentage_discount", "id");
+CREATE INDEX IF NOT EXISTS "idx_product_category_price" ON "product" ("category", ({PRICE}), "id");
+CREATE INDEX IF NOT EXISTS "idx_product_category_discount" ON "product" ("category", "percentage_discount", "id");
+""")
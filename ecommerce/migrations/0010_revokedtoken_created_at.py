@@ -0,0 +1,7 @@
+"""Index revokedtoken.created_at, which the revocation list syncs by."""
+
+
+async def upgrade(connection):
+    await connection.execute_script(
+        'CREATE INDEX IF NOT EXISTS "idx_revokedtoken_created_at" ON "revokedtoken" ("created_at");'
+    )
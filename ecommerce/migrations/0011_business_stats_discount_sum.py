@@ -0,0 +1,17 @@
+"""businessstats.discount_sum, the running total product writes adjust the
+average discount by, filled from the existing products.
+"""
+from migrate import has_column
+
+BACKFILL = """
+UPDATE "businessstats" SET "discount_sum" = (
+    SELECT coalesce(sum("percentage_discount"), 0) FROM "product"
+    WHERE "product"."business_id" = "businessstats"."business_id"
+);
+"""
+
+
+async def upgrade(connection):
+    if not await has_column(connection, "businessstats", "discount_sum"):
+        await connection.execute_script('ALTER TABLE "businessstats" ADD COLUMN "discount_sum" BIGINT NOT NULL DEFAULT 0')
+    await connection.execute_script(BACKFILL)
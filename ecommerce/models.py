@@ -1,6 +1,7 @@
 from tortoise import Model,fields
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Literal, Optional
 from tortoise.contrib.pydantic import  pydantic_model_creator
 class User(Model):
     id = fields.IntField(pk= True, index= True)
@@ -10,6 +11,8 @@ class User(Model):
     password = fields.CharField(max_length = 100, null = False)
     is_verified = fields.BooleanField(default = False)
     join_date = fields.DatetimeField(default = datetime.utcnow)
+    #bumped to revoke every token issued to the user so far
+    token_version = fields.IntField(default = 0)
 class Business(Model):
     id = fields.IntField(pk=True, index= True)
     business_name = fields.CharField(max_length=20, null = False, unique = True)
@@ -30,9 +33,59 @@ class Product(Model):
     date_published = fields.DatetimeField(default= datetime.utcnow)
     business = fields.ForeignKeyField("models.Business", related_name="products")
 
+class BusinessStats(Model):
+    #one row per business, kept current by the deltas and recomputes in business_stats
+    id = fields.IntField(pk = True, index = True)
+    business = fields.OneToOneField("models.Business", related_name = "stats")
+    product_count = fields.IntField(default = 0)
+    discount_sum = fields.BigIntField(default = 0)
+    avg_discount = fields.FloatField(default = 0)
+    max_discount = fields.IntField(null = True)
+    min_price = fields.DecimalField(max_digits=12,decimal_places=2, null = True)
+    max_price = fields.DecimalField(max_digits=12,decimal_places=2, null = True)
+    min_original_price = fields.DecimalField(max_digits=12,decimal_places=2, null = True)
+    max_original_price = fields.DecimalField(max_digits=12,decimal_places=2, null = True)
+    #category -> number of products
+    category_counts = fields.JSONField(default = dict)
+    updated_at = fields.DatetimeField(default = datetime.utcnow)
+
+class ActiveDeal(Model):
+    #a product whose offer has not expired yet, kept in step with it by deals.py
+    id = fields.IntField(pk = True, index = True)
+    product = fields.OneToOneField("models.Product", related_name = "deal")
+    category = fields.CharField(max_length=30)
+    percentage_discount = fields.IntField()
+    offer_expiration_date = fields.DateField(index = True)
+
+class EmailOutbox(Model):
+    id = fields.IntField(pk = True, index = True)
+    user = fields.ForeignKeyField("models.User", related_name = "emails", null = True)
+    kind = fields.CharField(max_length = 30)
+    recipient = fields.CharField(max_length = 200)
+    #one message per (kind, user), a second enqueue for the same key is a no-op
+    dedupe_key = fields.CharField(max_length = 100, unique = True)
+    status = fields.CharField(max_length = 10, default = "pending")
+    attempts = fields.IntField(default = 0)
+    next_attempt_at = fields.DatetimeField(default = datetime.utcnow, index = True)
+    last_error = fields.TextField(null = True)
+    created_at = fields.DatetimeField(default = datetime.utcnow)
+    sent_at = fields.DatetimeField(null = True)
+
+class RevokedToken(Model):
+    id = fields.IntField(pk = True, index = True)
+    #a single revoked token, or
+    jti = fields.CharField(max_length = 40, null = True, unique = True)
+    #every token of the user below this version
+    min_version = fields.IntField(null = True)
+    user = fields.ForeignKeyField("models.User", related_name = "revoked_tokens")
+    #once the revoked tokens would have expired anyway the row can go
+    expires_at = fields.DatetimeField(index = True)
+    #other workers' revocations are synced by it
+    created_at = fields.DatetimeField(default = datetime.utcnow, index = True)
+
 
 user_pydantic = pydantic_model_creator(User, name ="User", exclude=("is_verified", ))
-user_pydanticIn = pydantic_model_creator(User, name ="UserIn", exclude_readonly=True, exclude=("is_verified","join_date","email_sent" ))
+user_pydanticIn = pydantic_model_creator(User, name ="UserIn", exclude_readonly=True, exclude=("is_verified","join_date","email_sent","token_version" ))
 user_pydanticOut = pydantic_model_creator(User, name ="UserOut", exclude=("password", ))
 
 
@@ -43,3 +96,17 @@ business_pydanticIn = pydantic_model_creator(Business, name ="BusinessIn", exclu
 product_pydantic = pydantic_model_creator(Product, name ="Product")
 product_pydanticIn = pydantic_model_creator(Product, name ="Product", exclude=("percentage_discount","id"))
 
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    #also revoke this refresh token, or every token of the user
+    refresh_token: Optional[str] = None
+    everywhere: bool = False
+
+class RepriceRequest(BaseModel):
+    #percent off the original price, or off the current price when base is "current"
+    percent_off: float = Field(ge=0, lt=100)
+    category: Optional[str] = None
+    base: Literal["original", "current"] = "original"
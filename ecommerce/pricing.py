@@ -0,0 +1,235 @@
+"""Catalog pricing analytics and batch repricing on NumPy columns.
+
+``iter_price_columns`` walks the product table by id, ``PRICING_CHUNK_SIZE``
+rows per query, and turns each chunk into arrays: ids, original and new
+price in whole cents, the discount and a category code. Working in cents
+keeps every price exact. ``pricing_summary`` computes the discount
+distribution, percentiles and per-category figures over them without a
+Python loop per row.
+
+``reprice`` sets a business's prices to a percentage off the original (or
+the current) price, e.g. 10% off one category. It computes the new prices
+and discounts for a whole chunk at once and writes them back with one
+``executemany`` per chunk in its own transaction, the same unit bulk
+imports use. Rows whose price does not change are not written. Repriced
+products keep their active deals, business stats and cached responses
+current; the search index holds no prices.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+from tortoise import BaseDBAsyncClient, connections
+from tortoise.transactions import in_transaction
+
+from business_stats import refresh_business_stats
+from config import get_int
+from database import WRITE_CONNECTION, read_db
+from deals import update_deal_discounts
+from migrate import sql
+from response_cache import response_cache
+
+PRICING_CHUNK_SIZE = get_int("PRICING_CHUNK_SIZE", 10000)
+
+PERCENTILES = (5, 25, 50, 75, 90, 95, 99)
+
+CHUNK_SQL = """
+SELECT "id", CAST("original_price" AS DOUBLE PRECISION), CAST("new_price" AS DOUBLE PRECISION),
+       "percentage_discount", "category"
+FROM "product"
+WHERE "id" > ?{filters}
+ORDER BY "id"
+LIMIT ?
+"""
+
+UPDATE_SQL = 'UPDATE "product" SET "new_price" = ?, "percentage_discount" = ? WHERE "id" = ?'
+
+
+@dataclass
+class PriceColumns:
+    ids: np.ndarray
+    original_cents: np.ndarray
+    new_cents: np.ndarray
+    discount: np.ndarray
+    # index into ``categories`` for every row
+    category_codes: np.ndarray
+    categories: List[str]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def discount_percentages(original_cents: np.ndarray, new_cents: np.ndarray) -> np.ndarray:
+    """Whole percent off, truncated like the rest of the app does; 0 for a zero original price."""
+    difference = original_cents - new_cents
+    safe = np.where(original_cents == 0, 1, original_cents)
+    percent = np.sign(difference) * (np.abs(difference) * 100 // safe)
+    return np.where(original_cents == 0, 0, percent)
+
+
+def repriced_cents(base_cents: np.ndarray, percent_off: float) -> np.ndarray:
+    """``percent_off`` below ``base_cents``, rounded to the nearest cent."""
+    return np.rint(base_cents * ((100 - percent_off) / 100)).astype(np.int64)
+
+
+async def iter_price_columns(
+    category: Optional[str] = None,
+    business_id: Optional[int] = None,
+    chunk_size: int = PRICING_CHUNK_SIZE,
+    using_db: Optional[BaseDBAsyncClient] = None,
+) -> AsyncIterator[PriceColumns]:
+    connection = using_db or read_db()
+    filters, params = "", []
+    if category is not None:
+        filters += ' AND "category" = ?'
+        params.append(category)
+    if business_id is not None:
+        filters += ' AND "business_id" = ?'
+        params.append(business_id)
+    query = sql(connection, CHUNK_SQL.format(filters=filters))
+
+    # codes stay stable across chunks so they can be concatenated
+    codes: Dict[str, int] = {}
+    after_id = 0
+    while True:
+        _, rows = await connection.execute_query(query, [after_id, *params, chunk_size])
+        if not rows:
+            return
+        ids, original, new, discount, category_names = zip(*rows)
+        yield PriceColumns(
+            ids=np.fromiter(ids, np.int64, len(rows)),
+            original_cents=np.rint(np.fromiter(original, np.float64, len(rows)) * 100).astype(np.int64),
+            new_cents=np.rint(np.fromiter(new, np.float64, len(rows)) * 100).astype(np.int64),
+            discount=np.fromiter(discount, np.int64, len(rows)),
+            category_codes=np.fromiter((codes.setdefault(name, len(codes)) for name in category_names), np.int32, len(rows)),
+            categories=list(codes),
+        )
+        if len(rows) < chunk_size:
+            return
+        after_id = ids[-1]
+
+
+async def load_price_columns(
+    category: Optional[str] = None,
+    business_id: Optional[int] = None,
+    chunk_size: int = PRICING_CHUNK_SIZE,
+    using_db: Optional[BaseDBAsyncClient] = None,
+) -> PriceColumns:
+    chunks = [chunk async for chunk in iter_price_columns(category, business_id, chunk_size, using_db)]
+    if not chunks:
+        empty = np.zeros(0, np.int64)
+        return PriceColumns(empty, empty, empty, empty, np.zeros(0, np.int32), [])
+    return PriceColumns(
+        ids=np.concatenate([chunk.ids for chunk in chunks]),
+        original_cents=np.concatenate([chunk.original_cents for chunk in chunks]),
+        new_cents=np.concatenate([chunk.new_cents for chunk in chunks]),
+        discount=np.concatenate([chunk.discount for chunk in chunks]),
+        category_codes=np.concatenate([chunk.category_codes for chunk in chunks]),
+        categories=chunks[-1].categories,
+    )
+
+
+def _percentiles(values: np.ndarray, scale: float = 1) -> dict:
+    if not len(values):
+        return {f"p{q}": None for q in PERCENTILES}
+    return {f"p{q}": round(float(value) / scale, 2) for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def discount_distribution(discount: np.ndarray, bins: int = 10) -> List[dict]:
+    """Products per equal-width discount band from 0 to 100%, outliers counted in the end bands."""
+    counts, edges = np.histogram(np.clip(discount, 0, 100), bins=bins, range=(0, 100))
+    return [
+        {"from": round(float(low), 2), "to": round(float(high), 2), "products": int(count)}
+        for low, high, count in zip(edges[:-1], edges[1:], counts)
+    ]
+
+
+def category_summary(columns: PriceColumns) -> Dict[str, dict]:
+    if not len(columns):
+        return {}
+    # rows grouped by category, so each group's min and max is one reduceat
+    order = np.argsort(columns.category_codes, kind="stable")
+    codes = columns.category_codes[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    present = codes[starts]
+    counts = np.diff(np.r_[starts, len(codes)]).tolist()
+
+    discount = columns.discount[order]
+    new_cents = columns.new_cents[order]
+    discount_sums = np.add.reduceat(discount, starts)
+    price_sums = np.add.reduceat(new_cents, starts)
+    max_discounts = np.maximum.reduceat(discount, starts)
+    min_prices = np.minimum.reduceat(new_cents, starts)
+    max_prices = np.maximum.reduceat(new_cents, starts)
+
+    summary = {}
+    for i, code in enumerate(present):
+        summary[columns.categories[code]] = {
+            "products": counts[i],
+            "average_discount": round(float(discount_sums[i]) / counts[i], 2),
+            "max_discount": int(max_discounts[i]),
+            "average_price": round(float(price_sums[i]) / counts[i] / 100, 2),
+            "min_price": round(float(min_prices[i]) / 100, 2),
+            "max_price": round(float(max_prices[i]) / 100, 2),
+        }
+    return dict(sorted(summary.items()))
+
+
+def pricing_summary(columns: PriceColumns, bins: int = 10) -> dict:
+    count = len(columns)
+    return {
+        "products": count,
+        "discount": {
+            "average": round(float(columns.discount.mean()), 2) if count else None,
+            "percentiles": _percentiles(columns.discount),
+            "distribution": discount_distribution(columns.discount, bins),
+        },
+        "new_price": {
+            "average": round(float(columns.new_cents.mean()) / 100, 2) if count else None,
+            "percentiles": _percentiles(columns.new_cents, scale=100),
+        },
+        "categories": category_summary(columns),
+    }
+
+
+async def reprice(
+    business_id: int,
+    percent_off: float,
+    category: Optional[str] = None,
+    base: str = "original",
+    chunk_size: int = PRICING_CHUNK_SIZE,
+) -> dict:
+    """Set the business's prices ``percent_off`` below their ``base`` price, chunk by chunk."""
+    matched = updated = 0
+    categories = set()
+    try:
+        async for chunk in iter_price_columns(
+            category, business_id, chunk_size, using_db=connections.get(WRITE_CONNECTION)
+        ):
+            matched += len(chunk)
+            base_cents = chunk.original_cents if base == "original" else chunk.new_cents
+            new_cents = repriced_cents(base_cents, percent_off)
+            discount = discount_percentages(chunk.original_cents, new_cents)
+
+            changed = (new_cents != chunk.new_cents) | (discount != chunk.discount)
+            if not changed.any():
+                continue
+            ids = chunk.ids[changed].tolist()
+            prices = [Decimal(cents).scaleb(-2) for cents in new_cents[changed].tolist()]
+            discounts = discount[changed].tolist()
+
+            async with in_transaction(WRITE_CONNECTION) as connection:
+                await connection.execute_many(sql(connection, UPDATE_SQL), list(map(list, zip(prices, discounts, ids))))
+                await update_deal_discounts(ids, discounts, connection)
+            updated += len(ids)
+            categories.update(chunk.categories[code] for code in np.unique(chunk.category_codes[changed]))
+    finally:
+        # a run that stopped half way still leaves the summaries matching the rows it wrote
+        if updated:
+            await refresh_business_stats(business_id)
+            response_cache.invalidate(
+                "catalog", "deals", f"storefront:{business_id}", f"business:{business_id}", f"pricing:{business_id}",
+                *(f"category:{name}" for name in categories),
+            )
+    return {"matched": matched, "updated": updated}
@@ -0,0 +1,242 @@
+import hashlib
+import importlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+from config import get_float, get_int, get_setting
+from images import VARIANT_FORMATS
+from serialization import dumps
+from single_flight import SingleFlight
+
+# clients may keep responses but must revalidate them with If-None-Match
+CACHE_CONTROL = "no-cache"
+
+
+@dataclass
+class CachedResponse:
+    etag: str
+    body: bytes
+    tags: Tuple[str, ...]
+    # when the data behind the body was read, see ResponseCache.is_fresh
+    stamp: int
+
+
+class MemoryBackend:
+    """In-process LRU of cached responses plus the time each tag was last invalidated.
+
+    Any object with the same methods can be plugged in instead, e.g. one
+    backed by a shared store so that every worker sees the same invalidations.
+    A backend may drop entries whenever it likes, but it must remember a tag
+    stamp for at least ``ttl`` seconds.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[CachedResponse, float]]" = OrderedDict()
+        self._tags: "OrderedDict[str, int]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: CachedResponse) -> None:
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def tag_stamps(self, tags: Iterable[str]) -> List[int]:
+        return [self._tags.get(tag, 0) for tag in tags]
+
+    def touch_tags(self, tags: Iterable[str], stamp: int) -> None:
+        for tag in tags:
+            self._tags[tag] = stamp
+            self._tags.move_to_end(tag)
+        # a stamp older than the ttl cannot be newer than any live entry
+        expired = stamp - int(self.ttl * 1e9)
+        while self._tags and next(iter(self._tags.values())) < expired:
+            self._tags.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tags.clear()
+
+
+def load_backend(path: Optional[str], maxsize: int, ttl: float):
+    """``memory`` or ``module:factory``, the factory is called with maxsize and ttl."""
+    if not path or path == "memory":
+        return MemoryBackend(maxsize=maxsize, ttl=ttl)
+    module_name, _, attr = path.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory(maxsize=maxsize, ttl=ttl)
+
+
+def render_json(payload) -> bytes:
+    # compact utf-8 like fastapi's JSONResponse, Decimals and datetimes as the models write them
+    return dumps(payload)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+def accepted_formats(accept: Optional[str]) -> str:
+    """The part of an Accept header that changes which image variant is served."""
+    accept = accept or ""
+    return ",".join(extension for extension, (_, mime) in VARIANT_FORMATS.items() if mime in accept)
+
+
+def cache_key(route: str, *parts) -> str:
+    return route + json.dumps(parts, default=str, separators=(",", ":"))
+
+
+def product_tags(product_id: int, category: Optional[str] = None, business_id: Optional[int] = None) -> List[str]:
+    """Everything a change to one product can make stale."""
+    tags = [f"product:{product_id}", "catalog"]
+    if category is not None:
+        tags.append(f"category:{category}")
+    if business_id is not None:
+        tags.append(f"storefront:{business_id}")
+    return tags
+
+
+def catalog_tags(category: Optional[str], product_ids: Iterable[int], business_id: Optional[int] = None) -> List[str]:
+    """Tags of a catalog page: its own products, and the listing it is a page of.
+
+    A page with a category filter only changes when a product of that category
+    changes; an unfiltered page changes with any product. A business's page
+    only changes with that business's products.
+    """
+    tags = [f"product:{id}" for id in product_ids]
+    if business_id is not None:
+        tags.append(f"storefront:{business_id}")
+    else:
+        tags.append("catalog" if category is None else f"category:{category}")
+    return tags
+
+
+class ResponseCache:
+    """Serialized JSON responses keyed by route and query, with ETags and tag invalidation.
+
+    Invalidating a tag records the time it happened; an entry is fresh while
+    every one of its tags was last invalidated before its data was read. The
+    read time is taken before the handler queries the database, so a write
+    that lands while a response is being built makes that response stale
+    instead of caching it.
+
+    Concurrent misses on one key build the response once, see SingleFlight.
+    """
+
+    def __init__(self, backend=None, ttl: float = 60.0, flights: Optional[SingleFlight] = None):
+        self.backend = backend if backend is not None else MemoryBackend(ttl=ttl)
+        self.flights = flights if flights is not None else SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def is_fresh(self, entry: CachedResponse) -> bool:
+        return all(stamp < entry.stamp for stamp in self.backend.tag_stamps(entry.tags))
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self.backend.get(key)
+        if entry is not None and self.is_fresh(entry):
+            self.hits += 1
+            return entry
+        if entry is not None:
+            self.backend.delete(key)
+        self.misses += 1
+        return None
+
+    def invalidate(self, *tags: str) -> None:
+        self.backend.touch_tags(tags, time.time_ns())
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    async def fetch(
+        self,
+        key: str,
+        build: Callable[[], Awaitable[Tuple[object, List[str]]]],
+    ) -> CachedResponse:
+        entry = self.get(key)
+        if entry is None:
+            entry, shared = await self.flights.do(key, lambda: self._build(key, build))
+            # a write since the shared build began may predate this request, which must see it
+            if shared and not self.is_fresh(entry):
+                entry = await self._build(key, build)
+        return entry
+
+    async def _build(
+        self,
+        key: str,
+        build: Callable[[], Awaitable[Tuple[object, List[str]]]],
+    ) -> CachedResponse:
+        stamp = time.time_ns()
+        payload, tags = await build()
+        body = render_json(payload)
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        entry = CachedResponse(etag=etag, body=body, tags=tuple(tags), stamp=stamp)
+        self.backend.set(key, entry)
+        return entry
+
+    async def respond(
+        self,
+        request: Request,
+        key: str,
+        build: Callable[[], Awaitable[Tuple[object, List[str]]]],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        """Serve ``key`` from the cache, building it with ``build`` on a miss.
+
+        ``build`` returns the JSON payload and the tags that invalidate it. A
+        request whose If-None-Match matches gets a bodiless 304.
+        """
+        entry = await self.fetch(key, build)
+        headers = {"ETag": entry.etag, "Cache-Control": CACHE_CONTROL, **(headers or {})}
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache(
+    backend=load_backend(
+        get_setting("RESPONSE_CACHE_BACKEND", "memory"),
+        maxsize=get_int("RESPONSE_CACHE_SIZE", 10000),
+        ttl=get_float("RESPONSE_CACHE_TTL", 60.0),
+    ),
+)
@@ -0,0 +1,166 @@
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from tortoise import BaseDBAsyncClient, connections
+from tortoise.transactions import in_transaction
+
+from config import get_int
+
+logger = logging.getLogger(__name__)
+
+MAX_FACETS = 50
+MAX_CANDIDATES = get_int("SEARCH_MAX_CANDIDATES", 1000)
+MAX_COUNT = get_int("SEARCH_MAX_COUNT", 10000)
+
+# rowid is the product id; name weighs most in the ranking, then category
+SEARCH_TABLE_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS "product_search" USING fts5(
+    name, category, business_name,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+RANK = "bm25(product_search, 10.0, 4.0, 1.0)"
+
+INDEX_SELECT = """
+SELECT p."id", p."name", p."category", b."business_name"
+FROM "product" p JOIN "business" b ON b."id" = p."business_id"
+"""
+
+
+def _connection(using_db: Optional[BaseDBAsyncClient] = None) -> BaseDBAsyncClient:
+    return using_db or connections.get("default")
+
+
+def search_available(using_db: Optional[BaseDBAsyncClient] = None) -> bool:
+    return _connection(using_db).capabilities.dialect == "sqlite"
+
+
+async def rebuild_search_index(using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    """Create the FTS5 table if it is missing and refill it from the product table.
+
+    Migration 0004 creates the index and the app keeps it current; this
+    repairs one that drifted, e.g. after rows were written without going
+    through the app. Run it with ``python -m migrate repair``.
+    """
+    if not search_available(using_db):
+        logger.warning("Product search needs sqlite FTS5, /products/search is disabled")
+        return
+
+    connection = _connection(using_db)
+    await connection.execute_script(SEARCH_TABLE_SQL)
+    # one transaction, searches keep seeing the old index until the new one is complete
+    async with in_transaction(connection.connection_name) as transaction:
+        await transaction.execute_query('DELETE FROM "product_search"')
+        await transaction.execute_query(
+            f'INSERT INTO "product_search"(rowid, name, category, business_name) {INDEX_SELECT}'
+        )
+
+
+async def index_product(product_id: int, using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    if not search_available(using_db):
+        return
+    # one statement, concurrent saves of a product each replace the row instead of
+    # racing a separate delete and insert into a rowid conflict
+    await _connection(using_db).execute_query(
+        f'INSERT OR REPLACE INTO "product_search"(rowid, name, category, business_name) {INDEX_SELECT} '
+        'WHERE p."id" = ?',
+        [product_id],
+    )
+
+
+async def index_products(product_ids: List[int], using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    """Index newly inserted products (bulk inserts skip signals)."""
+    if not product_ids or not search_available(using_db):
+        return
+    connection = _connection(using_db)
+    placeholders = ", ".join("?" * len(product_ids))
+    await connection.execute_query(
+        f'INSERT INTO "product_search"(rowid, name, category, business_name) {INDEX_SELECT} '
+        f'WHERE p."id" IN ({placeholders})',
+        product_ids,
+    )
+
+
+async def unindex_product(product_id: int, using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    if not search_available(using_db):
+        return
+    await _connection(using_db).execute_query('DELETE FROM "product_search" WHERE rowid = ?', [product_id])
+
+
+async def rename_business(business_id: int, business_name: str, using_db: Optional[BaseDBAsyncClient] = None) -> None:
+    if not search_available(using_db):
+        return
+    await _connection(using_db).execute_query(
+        'UPDATE "product_search" SET business_name = ? '
+        'WHERE rowid IN (SELECT "id" FROM "product" WHERE "business_id" = ?) AND business_name != ?',
+        [business_name, business_id, business_name],
+    )
+
+
+def match_expression(q: str) -> str:
+    """Every word of the query must match, each as a prefix."""
+    tokens = re.findall(r"\w+", q.lower())
+    if not tokens:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Search query must contain at least one word"
+        )
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+async def search_products(
+    q: str,
+    category: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> Tuple[List[int], int, dict, bool]:
+    """Ranked product ids for ``q``, the hit count, per-category facet counts and
+    whether the counts are exact.
+
+    Ranking and facets cost time proportional to the number of matches, so
+    both look at the newest ``MAX_CANDIDATES`` matches only, and the hit count
+    stops at ``MAX_COUNT``. Selective queries are fully exact; a query that
+    matches most of the catalog stays fast and reports ``exact=False``.
+    Facets are counted regardless of ``category`` so clients can show the
+    other categories a query hits.
+    """
+    if not search_available():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Product search is not available on this database"
+        )
+
+    connection = _connection()
+    expression = match_expression(q)
+
+    where = '"product_search" MATCH ?'
+    params: list = [expression]
+    if category is not None:
+        # narrow through the index first, then keep exact category matches only
+        where += " AND category = ?"
+        params = [f'{expression} AND category : "{category.replace(chr(34), chr(34) * 2)}"', category]
+
+    _, rows = await connection.execute_query(
+        f'SELECT rowid FROM (SELECT rowid, {RANK} AS score FROM "product_search" WHERE {where} '
+        "ORDER BY rowid DESC LIMIT ?) ORDER BY score, rowid DESC LIMIT ? OFFSET ?",
+        params + [MAX_CANDIDATES, limit, offset],
+    )
+    ids = [row[0] for row in rows]
+
+    _, facet_rows = await connection.execute_query(
+        'SELECT category, count(*) FROM (SELECT category FROM "product_search" WHERE "product_search" MATCH ? '
+        "ORDER BY rowid DESC LIMIT ?) GROUP BY category ORDER BY count(*) DESC, category LIMIT ?",
+        [expression, MAX_CANDIDATES, MAX_FACETS],
+    )
+    facets = {row[0]: row[1] for row in facet_rows}
+
+    _, count_rows = await connection.execute_query(
+        f'SELECT count(*) FROM (SELECT 1 FROM "product_search" WHERE {where} LIMIT ?)',
+        params + [MAX_COUNT + 1],
+    )
+    total = count_rows[0][0]
+    exact = total <= MAX_CANDIDATES and sum(facets.values()) < MAX_CANDIDATES
+    return ids, min(total, MAX_COUNT), facets, exact
@@ -0,0 +1,83 @@
+"""Request coalescing: concurrent identical reads share one call.
+
+During a burst on one product every request misses the response cache at
+the same moment, and without coalescing each of them runs the same queries
+and serializes the same payload. ``SingleFlight.do`` runs the first caller's
+function for a key and makes every caller that arrives while it is running
+wait for that result instead.
+
+Followers wait at most ``timeout`` seconds, after that they stop waiting and
+make the call themselves, so one stuck query does not hold a whole burst.
+A leader's exception is raised in its followers too. A leader that is
+cancelled, e.g. because its client went away, hands the call over: its
+followers start a new flight.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from config import get_float
+
+T = TypeVar("T")
+
+SINGLE_FLIGHT_TIMEOUT = get_float("SINGLE_FLIGHT_TIMEOUT", 5.0)
+
+# the result of a flight whose leader was cancelled
+_ABANDONED = object()
+
+
+class SingleFlight:
+    """At most one in-flight call per key in this process, its result shared with concurrent callers."""
+
+    def __init__(self, timeout: float = SINGLE_FLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Result of ``call`` and whether it was shared with another caller's flight."""
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                return await self._lead(key, call), False
+
+            self.followers += 1
+            try:
+                # shielded, a follower timing out must not cancel the leader's call
+                result = await asyncio.wait_for(asyncio.shield(flight), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return await call(), False
+            if result is not _ABANDONED:
+                return result, True
+
+    async def _lead(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        self.leaders += 1
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            flight.set_result(_ABANDONED)
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            # retrieved, so a flight nobody joined does not log "exception was never retrieved"
+            flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "timeouts": self.timeouts,
+            "shared_ratio": round(self.followers / calls, 4) if calls else 0.0,
+        }
@@ -0,0 +1,97 @@
+"""Shared setup for the tests.
+
+The app reads its settings when its modules are imported and finds its
+templates relative to the working directory, so this sets a throwaway
+environment and moves into the ``ecommerce`` directory before any test
+module imports the app. Each test gets a freshly migrated sqlite database.
+
+    python -m pytest ecommerce/tests
+"""
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="ecommerce-tests-"), "test.sqlite3")
+# nothing listens here unless a test starts an SMTP server on it
+SMTP_PORT = free_port()
+
+os.environ.update({
+    "EMAIL": "tests@example.com",
+    "PASS": "x",
+    "SECRET": "test-secret",
+    "GOOGLE_CLIENT_ID": "test-client",
+    "GOOGLE_CLIENT_SECRET": "test-client-secret",
+    "GOOGLE_REDIRECT_URI": "http://testserver/auth/google",
+    "DB_URL": f"sqlite://{DB_PATH}",
+    "MAIL_SERVER": "127.0.0.1",
+    "MAIL_PORT": str(SMTP_PORT),
+    "MAIL_STARTTLS": "false",
+    "MAIL_USE_CREDENTIALS": "false",
+    "MAIL_TIMEOUT": "5",
+    "BCRYPT_ROUNDS": "4",
+})
+os.chdir(APP_DIR)
+sys.path.insert(0, APP_DIR)
+
+
+async def _open_db():
+    from tortoise import Tortoise
+
+    from database import TORTOISE_ORM
+
+    await Tortoise.init(config=TORTOISE_ORM)
+
+
+async def _close_db():
+    from tortoise import Tortoise
+
+    await Tortoise.close_connections()
+
+
+@pytest.fixture
+def database():
+    """A new database at DB_URL with every migration applied."""
+    import migrate
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+
+    async def upgrade():
+        await _open_db()
+        try:
+            await migrate.upgrade()
+        finally:
+            await _close_db()
+
+    asyncio.run(upgrade())
+    return DB_PATH
+
+
+@pytest.fixture
+def run(database):
+    """Run an async test body with the ORM connected to the test database."""
+    def run_body(body):
+        async def main():
+            await _open_db()
+            try:
+                return await body()
+            finally:
+                await _close_db()
+
+        return asyncio.run(main())
+
+    return run_body
@@ -0,0 +1,75 @@
+import business_stats
+import main  # registers the product signals that keep the stats
+from accounts import create_account
+from business_stats import get_business_stats
+from models import Business, Product
+
+
+def test_product_writes_apply_deltas_and_recompute_only_for_lost_extremes(run, monkeypatch):
+    recomputes = []
+    refresh = business_stats.refresh_business_stats
+
+    async def counted_refresh(business_id, using_db=None):
+        recomputes.append(business_id)
+        await refresh(business_id, using_db)
+
+    monkeypatch.setattr(business_stats, "refresh_business_stats", counted_refresh)
+
+    async def body():
+        user = await create_account("ann", "ann@example.com", "x", is_verified=True)
+        business = await Business.get(owner=user)
+
+        async def add(name, category, original_price, new_price, discount):
+            return await Product.create(
+                name=name, category=category, original_price=original_price, new_price=new_price,
+                percentage_discount=discount, business=business,
+            )
+
+        async def matches_a_recompute():
+            deltas = await get_business_stats(business.id)
+            await refresh(business.id)
+            recomputed = await get_business_stats(business.id)
+            assert {**deltas, "updated_at": None} == {**recomputed, "updated_at": None}
+            return recomputed
+
+        lamp = await add("lamp", "home", 100, 80, 20)
+        chair = await add("chair", "home", 200, 150, 25)
+        pen = await add("pen", "office", 10, 9, 10)
+        stats = await get_business_stats(business.id)
+        assert stats["product_count"] == 3
+        assert stats["categories"] == {"home": 2, "office": 1}
+        assert stats["max_discount"] == 25
+        assert float(stats["price"]["min"]) == 9 and float(stats["price"]["max"]) == 150
+
+        # inside the ranges, or pushing an extreme further
+        lamp.new_price = 70
+        lamp.category = "garden"
+        await lamp.save()
+        chair.percentage_discount = 40
+        await chair.save()
+        assert recomputes == []
+        stats = await get_business_stats(business.id)
+        assert stats["categories"] == {"home": 1, "office": 1, "garden": 1}
+        assert stats["max_discount"] == 40
+        assert stats["average_discount"] == round(70 / 3, 2)
+        await matches_a_recompute()
+
+        # the cheapest product goes, so does the minimum
+        await pen.delete()
+        assert recomputes == [business.id]
+        stats = await matches_a_recompute()
+        assert stats["product_count"] == 2 and float(stats["price"]["min"]) == 70
+
+        # an update lowering the maximum
+        chair.new_price = 60
+        await chair.save()
+        assert len(recomputes) == 2
+        stats = await get_business_stats(business.id)
+        assert float(stats["price"]["max"]) == 70 and float(stats["price"]["min"]) == 60
+
+        # a save of other fields leaves the stats alone
+        chair.name = "stool"
+        await chair.save(update_fields=["name"])
+        assert len(recomputes) == 2
+
+    run(body)
@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+
+import pytest
+from tortoise import connections
+
+from catalog import SORT_FIELDS, _page_queryset, catalog_queryset
+
+CURSORS = {
+    "date_published": (datetime(2024, 1, 1, tzinfo=timezone.utc), 5),
+    "new_price": (10.0, 5),
+    "percentage_discount": (10, 5),
+}
+
+
+@pytest.mark.parametrize("sort", SORT_FIELDS)
+def test_every_sort_reads_pages_off_an_index(run, sort):
+    """No page, first or later, with or without a category, sorts the catalog."""
+    async def body():
+        connection = connections.get("default")
+        for category in (None, "food"):
+            for after in (None, CURSORS[SORT_FIELDS[sort][0]]):
+                page = _page_queryset(catalog_queryset(sort=sort, category=category), sort, after, 51)
+                _, rows = await connection.execute_query("EXPLAIN QUERY PLAN " + page.sql(params_inline=True))
+                plan = " | ".join(row[3] for row in rows)
+                assert "TEMP B-TREE" not in plan, (category, after, plan)
+                assert "USING INDEX" in plan, (category, after, plan)
+
+    run(body)
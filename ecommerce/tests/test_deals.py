@@ -0,0 +1,36 @@
+import asyncio
+from datetime import timedelta
+
+import main  # registers the product signals that keep the deals
+from accounts import create_account
+from deals import today
+from models import ActiveDeal, Business, Product
+
+
+def test_parallel_updates_of_a_product_leave_its_last_offer(run):
+    async def body():
+        user = await create_account("ann", "ann@example.com", "x", is_verified=True)
+        business = await Business.get(owner=user)
+        product = await Product.create(
+            name="lamp", category="home", original_price=100, new_price=80, percentage_discount=20,
+            offer_expiration_date=today() + timedelta(days=7), business=business,
+        )
+        assert await ActiveDeal.filter(product_id=product.id).count() == 1
+
+        copies = [await Product.get(id=product.id) for _ in range(10)]
+        for discount, copy in enumerate(copies, start=30):
+            copy.percentage_discount = discount
+        # every save syncs the deal from the post_save signal
+        await asyncio.gather(*(copy.save() for copy in copies))
+
+        deal = await ActiveDeal.get(product_id=product.id)
+        assert deal.percentage_discount == (await Product.get(id=product.id)).percentage_discount
+
+        # an offer that ends takes the deal with it, even against a concurrent save
+        copies = [await Product.get(id=product.id) for _ in range(2)]
+        copies[0].offer_expiration_date = today() - timedelta(days=1)
+        copies[1].offer_expiration_date = today() - timedelta(days=2)
+        await asyncio.gather(*(copy.save() for copy in copies))
+        assert not await ActiveDeal.filter(product_id=product.id).exists()
+
+    run(body)
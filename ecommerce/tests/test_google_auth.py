@@ -0,0 +1,93 @@
+import json
+import time
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi.testclient import TestClient
+
+from google_auth import google_oauth
+from main import app
+from models import Business, User
+
+ISSUER = "https://accounts.google.com"
+KID = "test-key"
+
+
+class MockGoogle:
+    """Discovery, JWKS and token endpoints, signing id tokens with a local key."""
+
+    def __init__(self):
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.nonce = None
+        self.token_requests = []
+
+    def id_token(self) -> str:
+        now = int(time.time())
+        claims = {
+            "iss": ISSUER,
+            "aud": google_oauth.client_id,
+            "sub": "10769150350006150715113082367",
+            "email": "jane.doe@example.com",
+            "email_verified": True,
+            "nonce": self.nonce,
+            "iat": now,
+            "exp": now + 300,
+        }
+        return jwt.encode(claims, self.key, algorithm="RS256", headers={"kid": KID})
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/.well-known/openid-configuration":
+            return httpx.Response(200, json={
+                "issuer": ISSUER,
+                "authorization_endpoint": "https://accounts.example/o/oauth2/v2/auth",
+                "token_endpoint": "https://oauth2.example/token",
+                "jwks_uri": "https://www.example/oauth2/v3/certs",
+            })
+        if request.url.path == "/oauth2/v3/certs":
+            jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.key.public_key()))
+            return httpx.Response(200, json={"keys": [{**jwk, "kid": KID, "alg": "RS256", "use": "sig"}]})
+        if request.url.path == "/token":
+            form = parse_qs(request.content.decode())
+            self.token_requests.append(form)
+            if form.get("code") != ["auth-code"]:
+                return httpx.Response(400, json={"error": "invalid_grant"})
+            return httpx.Response(200, json={"access_token": "google-access", "id_token": self.id_token()})
+        return httpx.Response(404)
+
+
+def test_google_sign_in_creates_the_user_and_returns_a_token_pair(database):
+    google = MockGoogle()
+    # started before the app, so its startup keeps this client
+    google_oauth.start(httpx.AsyncClient(transport=httpx.MockTransport(google.handle)))
+
+    with TestClient(app) as client:
+        response = client.get("/login/google")
+        assert response.status_code == 200
+        params = parse_qs(urlparse(response.json()["url"]).query)
+        assert params["client_id"] == [google_oauth.client_id]
+        google.nonce = params["nonce"][0]
+
+        response = client.get("/auth/google", params={"code": "auth-code", "state": params["state"][0]})
+        assert response.status_code == 200, response.text
+        tokens = response.json()
+        assert tokens["access_token"] and tokens["refresh_token"]
+
+        assert google.token_requests[0]["client_secret"] == [google_oauth.client_secret]
+        assert google.token_requests[0]["grant_type"] == ["authorization_code"]
+
+        async def account():
+            user = await User.get(email="jane.doe@example.com")
+            return user.is_verified, await Business.filter(owner_id=user.id).count()
+
+        assert client.portal.call(account) == (True, 1)
+
+        # the pair is the app's own, the access token authenticates
+        response = client.post("/user/me", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+        assert response.status_code == 200
+        assert response.json()["data"]["email"] == "jane.doe@example.com"
+
+        # a replayed state with a code Google rejects gets no tokens
+        response = client.get("/auth/google", params={"code": "stolen", "state": params["state"][0]})
+        assert response.status_code == 400
@@ -0,0 +1,74 @@
+from datetime import timedelta
+from email import message_from_bytes
+
+from aiosmtpd.controller import Controller
+from tortoise import timezone
+
+from accounts import create_account
+from conftest import SMTP_PORT
+from emailss import OutboxWorker, enqueue_verification_email
+from models import EmailOutbox, User
+
+
+class Inbox:
+    """aiosmtpd handler keeping every message it is given."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(message_from_bytes(envelope.content))
+        return "250 OK"
+
+
+def test_drain_sends_one_verification_email_per_user(run):
+    inbox = Inbox()
+    smtp = Controller(inbox, hostname="127.0.0.1", port=SMTP_PORT)
+    smtp.start()
+
+    async def body():
+        users = [await create_account(name, f"{name}@example.com", "x") for name in ("ann", "ben")]
+        # signup already queued one each, the duplicates are refused
+        for user in users:
+            assert await enqueue_verification_email(user) is False
+
+        worker = OutboxWorker()
+        try:
+            assert await worker.drain_once() is True
+            # nothing left that is due
+            assert await worker.drain_once() is False
+        finally:
+            await worker.stop()
+
+        assert sorted(message["To"] for message in inbox.messages) == ["ann@example.com", "ben@example.com"]
+        assert all(message.is_multipart() for message in inbox.messages)
+        assert await EmailOutbox.filter(status="sent").count() == 2
+        assert await User.filter(email_sent=True).count() == 2
+
+    try:
+        run(body)
+    finally:
+        smtp.stop()
+
+
+def test_refused_connection_backs_off(run):
+    async def body():
+        await create_account("cat", "cat@example.com", "x")
+
+        # no SMTP server listens on the port
+        worker = OutboxWorker(backoff_base=30.0)
+        started = timezone.now()
+        try:
+            assert await worker.drain_once() is False
+        finally:
+            await worker.stop()
+
+        entry = await EmailOutbox.get(recipient="cat@example.com")
+        assert entry.status == "pending"
+        assert entry.attempts == 1
+        assert entry.last_error
+        assert entry.next_attempt_at >= started + timedelta(seconds=30)
+        # not due again until then
+        assert await OutboxWorker().drain_once() is False
+
+    run(body)
@@ -0,0 +1,56 @@
+from fastapi.testclient import TestClient
+
+import main
+from accounts import create_account
+from main import app
+from models import Business, Product
+from tokens import create_token_pair
+
+
+async def merchant(name: str, prices) -> dict:
+    user = await create_account(name, f"{name}@example.com", "x", is_verified=True)
+    business = await Business.get(owner=user)
+    for new_price in prices:
+        await Product.create(
+            name=f"{name} {new_price}", category="home", original_price=100, new_price=new_price,
+            percentage_discount=100 - new_price, business=business,
+        )
+    return {"Authorization": f"Bearer {create_token_pair(user)['access_token']}"}
+
+
+async def edit_price(name: str, new_price: int) -> None:
+    product = await Product.get(name=name)
+    product.new_price = new_price
+    await product.save()
+
+
+def test_pricing_analytics_cover_only_the_callers_business(database, monkeypatch):
+    scans = []
+    load_price_columns = main.load_price_columns
+
+    async def counted_load(**kwargs):
+        scans.append(kwargs)
+        return await load_price_columns(**kwargs)
+
+    monkeypatch.setattr(main, "load_price_columns", counted_load)
+
+    with TestClient(app) as client:
+        ann = client.portal.call(merchant, "ann", [90, 80])
+        client.portal.call(merchant, "ben", [50, 40, 30])
+
+        assert client.get("/analytics/pricing").status_code == 401
+
+        response = client.get("/analytics/pricing", headers=ann)
+        assert response.status_code == 200
+        assert response.json()["data"]["products"] == 2
+        assert response.json()["data"]["discount"]["average"] == 15
+
+        # product edits don't force another scan
+        client.portal.call(edit_price, "ann 90", 10)
+        assert client.get("/analytics/pricing", headers=ann).json()["data"]["products"] == 2
+        assert len(scans) == 1
+
+        # a reprice does
+        assert client.post("/products/reprice", json={"percent_off": 50}, headers=ann).status_code == 200
+        assert client.get("/analytics/pricing", headers=ann).json()["data"]["discount"]["average"] == 50
+        assert len(scans) == 2
@@ -0,0 +1,32 @@
+import asyncio
+
+from fastapi import HTTPException
+
+from main import user_registration
+from models import Business, EmailOutbox, User, user_pydanticIn
+
+NAMES = ["racer0", "racer1", "racer2"]
+RACERS_PER_NAME = 10
+
+
+async def signup(name: str) -> int:
+    try:
+        await user_registration(user_pydanticIn(username=name, email=f"{name}@example.com", password="pw123456"))
+        return 200
+    except HTTPException as e:
+        return e.status_code
+
+
+def test_parallel_duplicate_signups_create_one_account_per_name(run):
+    async def body():
+        racers = [name for name in NAMES for _ in range(RACERS_PER_NAME)]
+        codes = await asyncio.gather(*(signup(name) for name in racers))
+
+        for name in NAMES:
+            statuses = sorted(code for racer, code in zip(racers, codes) if racer == name)
+            assert statuses == [200] + [400] * (RACERS_PER_NAME - 1), name
+            assert await User.filter(username=name).count() == 1
+            assert await Business.filter(business_name=name).count() == 1
+            assert await EmailOutbox.filter(user__username=name).count() == 1
+
+    run(body)
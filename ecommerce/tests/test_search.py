@@ -0,0 +1,54 @@
+import asyncio
+import os
+
+from fastapi.testclient import TestClient
+from tortoise import connections
+
+import images
+from accounts import create_account
+from main import app
+from models import Business, Product
+
+
+async def add_product(name: str) -> Product:
+    user = await create_account(name, f"{name}@example.com", "x", is_verified=True)
+    business = await Business.get(owner=user)
+    return await Product.create(
+        name=f"{name} lamp", category="home", original_price=100, new_price=80,
+        percentage_discount=20, product_image="abc123.jpg", business=business,
+    )
+
+
+def test_parallel_saves_of_a_product_leave_one_search_row(run):
+    async def body():
+        product = await add_product("ann")
+        copies = [await Product.get(id=product.id) for _ in range(10)]
+        for number, copy in enumerate(copies):
+            copy.name = f"lamp {number}"
+
+        # every save reindexes the product from the post_save signal
+        await asyncio.gather(*(copy.save(update_fields=["name"]) for copy in copies))
+
+        _, rows = await connections.get("default").execute_query(
+            'SELECT name FROM "product_search" WHERE rowid = ?', [product.id]
+        )
+        assert len(rows) == 1
+        assert rows[0][0] == (await Product.get(id=product.id)).name
+
+    run(body)
+
+
+def test_search_resolves_images_like_the_other_listings(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "FILEPATH", f"{tmp_path}/")
+    (tmp_path / images.variant_name("abc123.jpg", images.DEFAULT_SIZE, "webp")).touch()
+
+    with TestClient(app) as client:
+        id = client.portal.call(add_product, "ben").id
+
+        response = client.get("/products/search", params={"q": "lamp"}, headers={"Accept": "image/webp"})
+        assert response.status_code == 200
+        assert response.headers["vary"] == "Accept"
+        [hit] = response.json()["data"]
+        listed = client.get(f"/product/{id}", headers={"Accept": "image/webp"}).json()["data"]
+        assert hit["product_image"] == listed["product_details"]["product_image"]
+        assert hit["product_image"] == images.variant_name("abc123.jpg", images.DEFAULT_SIZE, "webp")
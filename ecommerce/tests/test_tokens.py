@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+
+from models import RevokedToken, User
+from tokens import RevocationList
+
+
+def test_sync_picks_up_revocations_committed_out_of_id_order(run):
+    async def body():
+        user = await User.create(username="ann", email="ann@example.com", password="x")
+        revocations = RevocationList(sync_overlap=30.0)
+        await revocations.rebuild()
+
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(minutes=15)
+
+        # id 1 was handed out first, but id 2 commits and is synced before it
+        await RevokedToken.create(id=2, jti="second", user_id=user.id, expires_at=expires_at, created_at=now)
+        await revocations.sync()
+        assert revocations.is_revoked({"id": user.id, "jti": "second"})
+        assert not revocations.is_revoked({"id": user.id, "jti": "first"})
+
+        await RevokedToken.create(
+            id=1, jti="first", user_id=user.id, expires_at=expires_at, created_at=now - timedelta(seconds=1)
+        )
+        await RevokedToken.create(
+            id=3, user_id=user.id, min_version=1, expires_at=expires_at, created_at=now - timedelta(seconds=2)
+        )
+        await revocations.sync()
+        assert revocations.is_revoked({"id": user.id, "jti": "first"})
+        assert revocations.is_revoked({"id": user.id, "ver": 0, "jti": "other"})
+
+        # the rows the overlap reads again are not applied twice
+        await revocations.sync()
+        assert revocations._tokens.count == 2
+
+    run(body)
+
+
+def test_rows_older_than_the_overlap_are_forgotten(run):
+    async def body():
+        user = await User.create(username="ben", email="ben@example.com", password="x")
+        revocations = RevocationList(sync_overlap=30.0)
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(minutes=15)
+        await RevokedToken.create(jti="old", user_id=user.id, expires_at=expires_at, created_at=now - timedelta(minutes=5))
+        await RevokedToken.create(jti="new", user_id=user.id, expires_at=expires_at, created_at=now)
+
+        await revocations.rebuild()
+        assert revocations.is_revoked({"id": user.id, "jti": "old"})
+        assert len(revocations._applied) == 1
+        await revocations.sync()
+        assert revocations._tokens.count == 2
+
+    run(body)
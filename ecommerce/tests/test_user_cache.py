@@ -0,0 +1,55 @@
+from models import User
+from user_cache import UserCache, get_cached_user, user_cache
+
+
+def test_each_token_version_keeps_its_own_entry(run):
+    async def body():
+        user = await User.create(username="ann", email="ann@example.com", password="x")
+        user_cache.clear()
+        user_cache.hits = user_cache.misses = 0
+
+        for _ in range(3):
+            for version in (0, 1):
+                assert (await get_cached_user(user.id, version)).id == user.id
+        # one miss per version, the rest are hits instead of evicting each other
+        assert (user_cache.hits, user_cache.misses) == (4, 2)
+
+        user_cache.invalidate(user.id)
+        assert user_cache.get(user.id, 0) is None
+        assert user_cache.get(user.id, 1) is None
+        assert user_cache.stats()["size"] == 0
+
+    run(body)
+
+
+def test_hits_hand_out_copies(run):
+    async def body():
+        cache = UserCache()
+        user = await User.create(username="ben", email="ben@example.com", password="x")
+        cache.set(user)
+        user.is_verified = True
+
+        first = cache.get(user.id)
+        assert first is not user and first.is_verified is False
+        first.is_verified = True
+        assert cache.get(user.id).is_verified is False
+
+        # a copy is still a model the handler can save
+        await first.save(update_fields=["is_verified"])
+        assert (await User.get(id=user.id)).is_verified is True
+
+    run(body)
+
+
+def test_eviction_drops_the_oldest_version(run):
+    async def body():
+        cache = UserCache(maxsize=2)
+        user = await User.create(username="cat", email="cat@example.com", password="x")
+        for version in (0, 1, 2):
+            cache.set(user, version)
+        assert cache.get(user.id, 0) is None
+        assert cache.get(user.id, 2).id == user.id
+        cache.invalidate(user.id)
+        assert cache.stats()["size"] == 0
+
+    run(body)
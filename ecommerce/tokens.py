@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import logging
+import math
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+
+import jwt
+from fastapi import HTTPException, status
+from tortoise.expressions import F
+
+from config import get_float, get_int, get_setting
+from models import RevokedToken, User
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "HS256"
+ACCESS_TOKEN_TTL = timedelta(seconds=get_int("ACCESS_TOKEN_TTL", 15 * 60))
+REFRESH_TOKEN_TTL = timedelta(seconds=get_int("REFRESH_TOKEN_TTL", 14 * 24 * 3600))
+VERIFICATION_TOKEN_TTL = timedelta(hours=24)
+
+
+def _secret() -> str:
+    return get_setting("SECRET")
+
+
+def _encode(claims: dict, ttl: timedelta) -> str:
+    now = datetime.now(timezone.utc)
+    claims = {**claims, "iat": now, "exp": now + ttl}
+    return jwt.encode(claims, _secret(), algorithm=ALGORITHM)
+
+
+def create_token_pair(user: User) -> dict:
+    """A short-lived access token and the refresh token that renews it.
+
+    Both carry the user's ``token_version``; bumping it revokes every token
+    issued before.
+    """
+    version = user.token_version
+    access_token = _encode(
+        {"id": user.id, "username": user.username, "type": "access", "ver": version, "jti": secrets.token_urlsafe(12)},
+        ACCESS_TOKEN_TTL,
+    )
+    refresh_token = _encode(
+        {"id": user.id, "type": "refresh", "ver": version, "jti": secrets.token_urlsafe(12)},
+        REFRESH_TOKEN_TTL,
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": int(ACCESS_TOKEN_TTL.total_seconds()),
+    }
+
+
+def create_verification_token(user: User) -> str:
+    return _encode({"id": user.id, "username": user.username, "type": "verify"}, VERIFICATION_TOKEN_TTL)
+
+
+def decode_token(token: str, token_type: str) -> dict:
+    """Check signature, expiry and type; raises 401 for anything else."""
+    try:
+        payload = jwt.decode(token, _secret(), algorithms=[ALGORITHM], options={"require": ["exp", "id"]})
+    except jwt.PyJWTError:
+        payload = {}
+    if payload.get("type") != token_type:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return payload
+
+
+class BloomFilter:
+    """Fixed-size set membership with false positives but no false negatives."""
+
+    def __init__(self, capacity: int, error_rate: float = 1e-4):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """In-memory view of ``RevokedToken`` so access tokens are checked without a query.
+
+    Revoked token ids go into a bloom filter, and user-wide revocations (a
+    bumped ``token_version``) into a map of the lowest version still valid per
+    user. Revocations made in this process apply at once; a background task
+    picks up rows written by other workers every ``sync_interval`` seconds,
+    and rebuilds everything from the unexpired rows every ``rebuild_interval``
+    seconds, dropping expired rows as it goes. A bloom false positive rejects
+    a valid access token, which the client renews with its refresh token.
+
+    Syncs go by ``created_at`` rather than by id. On postgres an id is taken
+    from the sequence before its row commits, so a row can show up after
+    rows with higher ids. Each sync re-reads the last ``sync_overlap``
+    seconds and skips the rows it has already applied, so a row that commits
+    late, or comes from a worker whose clock is behind, is still picked up.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 100000,
+        error_rate: float = 1e-4,
+        sync_interval: float = 2.0,
+        rebuild_interval: float = 600.0,
+        sync_overlap: float = 30.0,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.sync_overlap = timedelta(seconds=sync_overlap)
+        self._tokens = BloomFilter(capacity, error_rate)
+        self._min_versions: Dict[int, int] = {}
+        # newest created_at applied, and the ids applied within the overlap before it
+        self._synced_at: Optional[datetime] = None
+        self._applied: Dict[int, datetime] = {}
+        self._rebuilt_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def is_revoked(self, payload: dict) -> bool:
+        if payload.get("ver", 0) < self._min_versions.get(payload["id"], 0):
+            return True
+        jti = payload.get("jti")
+        return jti is not None and jti in self._tokens
+
+    def _apply(self, row: RevokedToken) -> None:
+        if row.id in self._applied:
+            return
+        self._applied[row.id] = row.created_at
+        if self._synced_at is None or row.created_at > self._synced_at:
+            self._synced_at = row.created_at
+        if row.jti is not None:
+            self._tokens.add(row.jti)
+        if row.min_version is not None:
+            current = self._min_versions.get(row.user_id, 0)
+            self._min_versions[row.user_id] = max(current, row.min_version)
+
+    def _forget_applied(self) -> None:
+        """Drop the applied ids that are older than the next sync re-reads."""
+        if self._synced_at is None:
+            return
+        since = self._synced_at - self.sync_overlap
+        self._applied = {id: created_at for id, created_at in self._applied.items() if created_at >= since}
+
+    async def sync(self) -> None:
+        """Apply rows added since the last sync."""
+        rows = RevokedToken.all()
+        if self._synced_at is not None:
+            rows = rows.filter(created_at__gte=self._synced_at - self.sync_overlap)
+        for row in await rows.order_by("created_at", "id"):
+            self._apply(row)
+        self._forget_applied()
+        if self._tokens.count > self._tokens.capacity:
+            await self.rebuild()
+
+    async def rebuild(self) -> None:
+        now = datetime.now(timezone.utc)
+        await RevokedToken.filter(expires_at__lt=now).delete()
+        rows = await RevokedToken.all().order_by("id")
+
+        self._tokens = BloomFilter(max(self.capacity, 2 * len(rows)), self.error_rate)
+        self._min_versions = {}
+        self._synced_at = None
+        self._applied = {}
+        for row in rows:
+            self._apply(row)
+        self._forget_applied()
+        self._rebuilt_at = time.monotonic()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if time.monotonic() - self._rebuilt_at >= self.rebuild_interval:
+                    await self.rebuild()
+                else:
+                    await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Revocation sync failed: {e}")
+            await asyncio.sleep(self.sync_interval)
+
+    async def revoke_token(self, payload: dict) -> None:
+        """Revoke one token until it would have expired anyway."""
+        expires_at = datetime.fromtimestamp(payload["exp"], timezone.utc)
+        row, _ = await RevokedToken.get_or_create(
+            jti=payload["jti"], defaults={"user_id": payload["id"], "expires_at": expires_at}
+        )
+        self._apply(row)
+
+    async def revoke_user(self, user: User) -> None:
+        """Revoke every token of ``user`` by bumping its token version."""
+        await User.filter(id=user.id).update(token_version=F("token_version") + 1)
+        await user.refresh_from_db(fields=["token_version"])
+        # older tokens are all expired once the longest lived kind has run out
+        row = await RevokedToken.create(
+            user_id=user.id,
+            min_version=user.token_version,
+            expires_at=datetime.now(timezone.utc) + REFRESH_TOKEN_TTL,
+        )
+        self._apply(row)
+
+    async def is_refresh_revoked(self, payload: dict) -> bool:
+        """Exact check for the refresh path, which can afford a query."""
+        if payload.get("ver", 0) < self._min_versions.get(payload["id"], 0):
+            return True
+        return await RevokedToken.filter(jti=payload["jti"]).exists()
+
+
+revocations = RevocationList(
+    capacity=get_int("REVOCATION_BLOOM_CAPACITY", 100000),
+    error_rate=get_float("REVOCATION_BLOOM_ERROR_RATE", 1e-4),
+    sync_interval=get_float("REVOCATION_SYNC_INTERVAL", 2.0),
+    rebuild_interval=get_float("REVOCATION_REBUILD_INTERVAL", 600.0),
+    sync_overlap=get_float("REVOCATION_SYNC_OVERLAP", 30.0),
+)
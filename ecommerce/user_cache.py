@@ -0,0 +1,90 @@
+import copy
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from config import get_float, get_int
+from models import User
+
+
+class UserCache:
+    """Bounded LRU of authenticated users with a per-entry time to live.
+
+    Entries are keyed by user id and token version, so live tokens of one
+    user carrying different versions each keep their own entry. Every hit
+    hands out a copy of the cached user, so a handler changing the one it got
+    does not change it for the requests running alongside it.
+    Saves to ``User`` invalidate the user's entries in this process; other
+    workers converge within ``ttl`` seconds.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[int, int], tuple]" = OrderedDict()
+        # user id -> the versions it has entries for, so invalidate needs no scan
+        self._versions: Dict[int, Set[int]] = {}
+
+    def get(self, user_id: int, version: int = 0) -> Optional[User]:
+        key = (user_id, version)
+        entry = self._entries.get(key)
+        if entry is not None:
+            user, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.copy(user)
+            self._discard(key)
+        self.misses += 1
+        return None
+
+    def set(self, user: User, version: int = 0) -> None:
+        key = (user.id, version)
+        self._entries[key] = (copy.copy(user), time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        self._versions.setdefault(user.id, set()).add(version)
+        while len(self._entries) > self.maxsize:
+            self._discard(next(iter(self._entries)))
+
+    def invalidate(self, user_id: int) -> None:
+        for version in self._versions.pop(user_id, ()):
+            self._entries.pop((user_id, version), None)
+
+    def _discard(self, key: Tuple[int, int]) -> None:
+        del self._entries[key]
+        user_id, version = key
+        versions = self._versions.get(user_id)
+        if versions is not None:
+            versions.discard(version)
+            if not versions:
+                del self._versions[user_id]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._versions.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+user_cache = UserCache(
+    maxsize=get_int("USER_CACHE_SIZE", 10000),
+    ttl=get_float("USER_CACHE_TTL", 60.0),
+)
+
+
+async def get_cached_user(user_id: int, version: int = 0) -> User:
+    user = user_cache.get(user_id, version)
+    if user is None:
+        user = await User.get(id=user_id)
+        user_cache.set(user, version)
+    return user
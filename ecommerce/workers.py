@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutor:
+    """Runs blocking calls off the event loop with a cap on queued work.
+
+    At most ``max_workers`` calls run at once and up to ``max_queue`` more may
+    wait for a worker; anything beyond that is rejected with a 503 so a burst
+    sheds load instead of piling up behind the pool.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, kind: str = "thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=self.name
+                )
+        return self._executor
+
+    def check_capacity(self) -> None:
+        """Raise a 503 if a call submitted now would be rejected."""
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            logger.warning(f"{self.name} pool is saturated ({self.pending} pending), rejecting call")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please retry shortly",
+                headers={"Retry-After": "1"}
+            )
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        self.check_capacity()
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None